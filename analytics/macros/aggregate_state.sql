@@ -0,0 +1,12 @@
+{#
+  An aggregate function state, e.g. aggregate_state('sum', 'last_size') gives
+  sumState(last_size). The states can't be read back by the unit tests, so with
+  the finalize_states var set they are finalized into plain values instead.
+#}
+{% macro aggregate_state(function, expression='') -%}
+  {%- if var('finalize_states', false) -%}
+    finalizeAggregation({{ function }}State({{ expression }}))
+  {%- else -%}
+    {{ function }}State({{ expression }})
+  {%- endif -%}
+{%- endmacro %}
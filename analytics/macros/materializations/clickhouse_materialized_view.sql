@@ -26,10 +26,26 @@
 
   {%- set compiled_sql = render(sql) -%}
 
+  {#- The view keeps a hash of its query in its comment. A view whose query has
+      changed, or that was created before the hash was kept, is dropped and
+      created again. Rows inserted in between don't reach the target table. -#}
+  {%- set definition = 'dbt:' ~ local_md5(compiled_sql) -%}
+  {%- set existing = run_query(
+      "SELECT comment FROM system.tables WHERE database = '" ~ target_relation.schema
+      ~ "' AND name = '" ~ target_relation.identifier ~ "'"
+  ) -%}
+  {%- if existing.rows | length and existing.rows[0][0] != definition -%}
+    {{ log("Query of " ~ target_relation ~ " has changed, recreating it", info=True) }}
+    {% call statement('drop_changed_view') -%}
+      DROP VIEW IF EXISTS {{ target_relation }}
+    {%- endcall %}
+  {%- endif -%}
+
   {%- set ddl -%}
     CREATE MATERIALIZED VIEW IF NOT EXISTS {{ target_relation }}
     TO {{ materialization_table }}
     AS {{ compiled_sql }}
+    COMMENT '{{ definition }}'
   {%- endset -%}
 
   {{ log("Creating materialized view with DDL:", info=True) }}
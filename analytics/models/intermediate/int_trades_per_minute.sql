@@ -1,13 +1,24 @@
 {{ config(
-    materialized='table',
-    engine='SummingMergeTree()',
-    order_by='minute'
+    materialized='incremental',
+    incremental_strategy='append',
+    full_refresh=false,
+    engine='AggregatingMergeTree()',
+    order_by='(product_id, minute)',
+    partition_by='toYYYYMMDD(minute)'
 ) }}
 
+-- Partial aggregation states per minute, finalized with sumMerge and countMerge.
+-- int_trades_per_minute_mv adds to it as trades arrive, so dbt only builds it
+-- from the trades when creating it, and never rebuilds it.
 SELECT 
+    product_id,
     tumbleStart(trade_time, toIntervalMinute(1)) as minute,
-    SUM(last_size) as total_volume,
-    SUM(last_size*price) as total_volume_price,
-    countIf(last_size > 0) as num_trades 
+    {{ aggregate_state('sum', 'last_size') }} as total_volume,
+    {{ aggregate_state('sum', 'last_size*price') }} as total_volume_price,
+    {{ aggregate_state('count') }} as num_trades 
 FROM {{ ref('stg_coinbase__trades') }}
-GROUP BY minute
\ No newline at end of file
+WHERE last_size > 0
+{% if is_incremental() %}
+  AND false
+{% endif %}
+GROUP BY product_id, minute
@@ -2,13 +2,18 @@
     materialized='clickhouse_materialized_view',
     materialization_schema='coinbase_demo',
     materialization_identifier='int_trades_per_minute',
-    order_by='minute'
+    order_by='(product_id, minute)'
 ) }}
 
+-- Partial aggregation states per minute, finalized with sumMerge and countMerge.
+-- A materialized view only sees inserts into a table, so this reads the raw
+-- table that stg_coinbase__trades is a view of.
 SELECT 
-    tumbleStart(trade_time, toIntervalMinute(1)) as minute,
-    SUM(last_size) as total_volume,
-    SUM(last_size*price) as total_volume_price,
-    countIf(last_size > 0) as num_trades 
-FROM {{ ref('stg_coinbase__trades') }}
-GROUP BY minute
\ No newline at end of file
+    product_id,
+    tumbleStart(time, toIntervalMinute(1)) as minute,
+    {{ aggregate_state('sum', 'last_size') }} as total_volume,
+    {{ aggregate_state('sum', 'last_size*price') }} as total_volume_price,
+    {{ aggregate_state('count') }} as num_trades 
+FROM {{ source('stg_coinbase__sources', 'coinbase_ticker') }}
+WHERE last_size > 0
+GROUP BY product_id, minute
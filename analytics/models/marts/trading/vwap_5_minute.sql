@@ -1,24 +1,23 @@
 {{ config(
-    materialized='table',
-    engine='SummingMergeTree()',
-    order_by='minute'
+    materialized='incremental',
+    incremental_strategy='append',
+    full_refresh=false,
+    engine='AggregatingMergeTree()',
+    order_by='(product_id, minute)',
+    partition_by='toYYYYMM(minute)'
 ) }}
 
--- Construct 5 minute intervals
-WITH five_minute_intervals AS (
-    SELECT 
-        tumbleStart(minute, toIntervalMinute(5)) as five_min_interval
-    FROM {{ ref('minutes') }}
-    GROUP BY five_min_interval
-)
--- Get all vwap values
+-- Merge the per minute states into 5 minute states, finalized in vwap_5_minute_final.
+-- vwap_5_minute_mv adds to it as trades arrive, so dbt only builds it from
+-- int_trades_per_minute when creating it, and never rebuilds it.
 SELECT 
-    five_min_interval as minute,
-    SUM(total_volume) as total_volume,
-    SUM(total_volume_price) as total_volume_price,
-    IF(total_volume > 0, total_volume_price/total_volume, 0) as vwap,
-    SUM(num_trades) as num_trades  
-FROM five_minute_intervals
-LEFT JOIN {{ ref('int_trades_per_minute') }} as int_trades_per_minute
-    ON five_minute_intervals.five_min_interval = tumbleStart(int_trades_per_minute.minute, toIntervalMinute(5))
-GROUP BY minute
\ No newline at end of file
+    int_trades_per_minute.product_id as product_id,
+    tumbleStart(int_trades_per_minute.minute, toIntervalMinute(5)) as minute,
+    sumMergeState(int_trades_per_minute.total_volume) as total_volume,
+    sumMergeState(int_trades_per_minute.total_volume_price) as total_volume_price,
+    countMergeState(int_trades_per_minute.num_trades) as num_trades 
+FROM {{ ref('int_trades_per_minute') }} as int_trades_per_minute
+{% if is_incremental() %}
+WHERE false
+{% endif %}
+GROUP BY product_id, minute
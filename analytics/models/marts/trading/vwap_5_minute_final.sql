@@ -0,0 +1,17 @@
+{{ config(
+    materialized='view'
+) }}
+
+-- Finalize the 5 minute states. This reads one row per interval per part, so
+-- its cost depends on the time range rather than the number of trades.
+-- Intervals without trades are filled in with zeros, for each product.
+SELECT 
+    vwap_5_minute.product_id as product_id,
+    vwap_5_minute.minute as minute,
+    sumMerge(vwap_5_minute.total_volume) as total_volume,
+    sumMerge(vwap_5_minute.total_volume_price) as total_volume_price,
+    IF(total_volume > 0, total_volume_price/total_volume, 0) as vwap,
+    countMerge(vwap_5_minute.num_trades) as num_trades 
+FROM {{ ref('vwap_5_minute') }} as vwap_5_minute
+GROUP BY product_id, minute
+ORDER BY product_id, minute WITH FILL STEP toIntervalMinute(5)
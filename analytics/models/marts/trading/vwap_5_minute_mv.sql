@@ -2,24 +2,18 @@
     materialized='clickhouse_materialized_view',
     materialization_schema='coinbase_demo',
     materialization_identifier='vwap_5_minute',
-    order_by='minute'
+    order_by='(product_id, minute)'
 ) }}
 
--- Construct 5 minute intervals
-WITH five_minute_intervals AS (
-    SELECT 
-        tumbleStart(minute, toIntervalMinute(5)) as five_min_interval
-    FROM {{ ref('minutes') }}
-    GROUP BY five_min_interval
-)
--- Get all vwap values
+-- Merge each block of per minute states into 5 minute states. This fires on
+-- inserts into int_trades_per_minute, which its own view makes as trades
+-- arrive, so no join is needed and partial states for the same interval are
+-- combined when read rather than summed into a wrong vwap.
 SELECT 
-    five_min_interval as minute,
-    SUM(int_trades_per_minute.total_volume) as total_volume,
-    SUM(int_trades_per_minute.total_volume_price) as total_volume_price,
-    IF(total_volume > 0, total_volume_price/total_volume, 0) as vwap,
-    SUM(int_trades_per_minute.num_trades) as num_trades 
-FROM five_minute_intervals
-LEFT JOIN {{ ref('int_trades_per_minute') }} as int_trades_per_minute
-    ON five_minute_intervals.five_min_interval = tumbleStart(int_trades_per_minute.minute, toIntervalMinute(5))
-GROUP BY minute
\ No newline at end of file
+    int_trades_per_minute.product_id as product_id,
+    tumbleStart(int_trades_per_minute.minute, toIntervalMinute(5)) as minute,
+    sumMergeState(int_trades_per_minute.total_volume) as total_volume,
+    sumMergeState(int_trades_per_minute.total_volume_price) as total_volume_price,
+    countMergeState(int_trades_per_minute.num_trades) as num_trades 
+FROM {{ ref('int_trades_per_minute') }} as int_trades_per_minute
+GROUP BY product_id, minute
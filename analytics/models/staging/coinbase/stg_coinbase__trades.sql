@@ -2,11 +2,12 @@
     Model representing the coinbase tick data, slightly renamed.
 */
 {{ config(
-    materialized='table',
-    engine='MergeTree()',
-    order_by='trade_time'
+    materialized='view'
 ) }}
 
+-- A view rather than a copy, so each tick is stored once, in the raw table.
+-- Like it, it holds the last 30 days of ticks.
+
 with source as (
     select * from {{ source('stg_coinbase__sources', 'coinbase_ticker') }}
 )
@@ -1,22 +1,27 @@
--- This test directly builds sums values from the trades table and compares them to the vwap_5_minute_mv table
+-- This test directly builds sums values from the trades table and compares them to the finalized vwap_5_minute states
 WITH trades as ( -- Get all trades
     SELECT * from {{ ref('stg_coinbase__trades') }}
 ),
 vwap as ( -- Get all vwap values
-    SELECT * from {{ ref('vwap_5_minute_mv') }}
+    SELECT * from {{ ref('vwap_5_minute_final') }}
 ),
 totals as ( -- Get all sums of trades
     SELECT
+        product_id,
         tumbleStart(trade_time, toIntervalMinute(5)) as minute,
         SUM(last_size) as total_volume,
         SUM(1) as num_trades
     FROM trades
-    GROUP BY minute
+    WHERE last_size > 0
+    GROUP BY product_id, minute
 )
--- Compare the sums of trades to the vwap values
+-- Compare the sums of trades to the vwap values. The rollups keep intervals
+-- whose trades have expired from the raw table, those can't be compared.
 SELECT *
 FROM vwap
 LEFT JOIN totals
-    ON vwap.minute = totals.minute
-WHERE totals.num_trades != vwap.num_trades 
-  OR abs(totals.total_volume - vwap.total_volume) >= .0001
\ No newline at end of file
+    ON vwap.product_id = totals.product_id
+    AND vwap.minute = totals.minute
+WHERE vwap.minute >= (SELECT tumbleStart(min(trade_time), toIntervalMinute(5)) FROM trades)
+  AND (totals.num_trades != vwap.num_trades 
+    OR abs(totals.total_volume - vwap.total_volume) >= .0001)
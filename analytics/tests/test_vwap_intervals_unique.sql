@@ -0,0 +1,8 @@
+-- Each product should have a single row for each interval once the states are finalized
+SELECT
+    product_id,
+    minute,
+    count() as rows
+FROM {{ ref('vwap_5_minute_final') }}
+GROUP BY product_id, minute
+HAVING rows > 1
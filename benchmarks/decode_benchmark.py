@@ -0,0 +1,105 @@
+"""Compare the message decoders on recorded Coinbase frames.
+
+Record frames with the file sink (it stores the frames exactly as received), then:
+
+    poetry run python benchmarks/decode_benchmark.py --frames test.jsonl
+
+Without --frames the benchmark runs on generated ticker and heartbeat frames.
+"""
+
+import json
+import random
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import click
+
+from streaming_analytics_demo.sources import get_decoder
+
+
+def _generate_frames(count: int) -> List[str]:
+    """Generate ticker frames with the occasional heartbeat, like a live feed."""
+    frames = []
+    price = 97000.0
+    for sequence in range(count):
+        price += random.uniform(-5, 5)
+        if sequence % 20 == 0:
+            message = {
+                "type": "heartbeat",
+                "last_trade_id": 780146125 + sequence,
+                "product_id": "BTC-USD",
+                "sequence": sequence,
+                "time": "2025-02-01T12:00:00.123456Z",
+            }
+        else:
+            message = {
+                "type": "ticker",
+                "sequence": sequence,
+                "product_id": "BTC-USD",
+                "price": f"{price:.2f}",
+                "open_24h": "96420.01",
+                "volume_24h": "11009.55813263",
+                "low_24h": "95500",
+                "high_24h": "98000.5",
+                "volume_30d": "310217.53462719",
+                "best_bid": f"{price - 0.01:.2f}",
+                "best_bid_size": "0.00038584",
+                "best_ask": f"{price:.2f}",
+                "best_ask_size": "0.18140919",
+                "side": random.choice(["buy", "sell"]),
+                "time": "2025-02-01T12:00:00.123456Z",
+                "trade_id": 780146125 + sequence,
+                "last_size": "0.00071001",
+            }
+        frames.append(json.dumps(message))
+    return frames
+
+
+def _time(decode: Callable, frames: List[str], repeat: int) -> float:
+    """Return the best time to decode all frames, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for frame in frames:
+            decode(frame)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+@click.command()
+@click.option(
+    "--frames",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="JSON lines file of recorded frames",
+)
+@click.option("--count", default=100_000, help="Number of frames to generate")
+@click.option("--repeat", default=5, help="Runs per decoder, the best is reported")
+def benchmark(frames: Path | None, count: int, repeat: int) -> None:
+    """Time each installed decoder against untyped json.loads."""
+    if frames:
+        lines = [line for line in frames.read_text().splitlines() if line]
+    else:
+        lines = _generate_frames(count)
+
+    decoders = {"json.loads (untyped)": json.loads}
+    for name in ["json", "orjson", "msgspec"]:
+        try:
+            decoders[name] = get_decoder(name).decode
+        except ImportError:
+            click.echo(f"{name}: not installed, skipped")
+
+    click.echo(f"{len(lines)} frames, best of {repeat} runs")
+    baseline = None
+    for name, decode in decoders.items():
+        elapsed = _time(decode, lines, repeat)
+        baseline = baseline or elapsed
+        click.echo(
+            f"{name:>22}: {len(lines) / elapsed:>10,.0f} frames/s "
+            f"{elapsed / len(lines) * 1e6:6.2f} us/frame "
+            f"{baseline / elapsed:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,414 @@
+"""End-to-end benchmark of the listen pipeline against a local fake exchange.
+
+Each scenario runs the fake exchange (`fake_exchange.py`) and the listener in
+processes of their own, so the listener's CPU time and peak RSS are its alone.
+The listener runs exactly what `listen` runs, with the coinbase source pointed at
+the fake exchange and sinks that record when each message was written:
+
+- `benchmark_file` is the file sink, sampling one written line in ten
+- `fake_clickhouse` is the ClickHouse sink with a stand-in client. Every insert
+  is encoded and compressed by clickhouse_connect exactly as it would be sent,
+  then the bytes are dropped instead of going over HTTP.
+
+The exchange stamps each message with the time it was sent, so a message's
+end-to-end latency is the time it was written less its `time`. Throughput is the
+messages written over the time from the first one sent to the last one written;
+at a fixed rate it shows whether the listener kept up, the `_max` scenarios send
+as fast as the exchange can.
+
+    poetry run python benchmarks/e2e_benchmark.py
+    poetry run python benchmarks/e2e_benchmark.py --check
+    poetry run python benchmarks/e2e_benchmark.py --update-baseline
+
+`--check` compares the results with the baseline file and exits with status 1 if
+any metric is worse than the baseline by more than the tolerance. Baselines depend
+on the machine, so record your own before relying on the check.
+"""
+
+import asyncio
+from array import array
+import json
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+import re
+import resource
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, List
+import warnings
+
+import click
+from clickhouse_connect.datatypes.registry import get_from_name
+from clickhouse_connect.driver.insert import InsertContext
+from clickhouse_connect.driver.transform import NativeTransform
+
+from fake_exchange import run_exchange
+from streaming_analytics_demo.listen import _async_run
+from streaming_analytics_demo.sinks import ClickHouseConnectSink, FileSink
+from streaming_analytics_demo.sinks.sink import register_sink
+from streaming_analytics_demo.util import setup_logging, to_epoch_micros
+
+# Only warnings and errors, in every process the benchmark starts
+setup_logging(logging.WARNING)
+# Sink.__del__ calls the async disconnect of sinks that were already disconnected
+warnings.filterwarnings("ignore", "coroutine .* was never awaited", RuntimeWarning)
+
+_BASELINE = Path(__file__).parent / "baselines" / "e2e.json"
+
+_PRODUCT_IDS = ["BTC-USD", "ETH-USD", "SOL-USD"]
+
+# The coinbase_ticker table from sql/coinbase_ticker.sql
+_TICKER_COLUMN_TYPES = {
+    "sequence": "UInt64",
+    "trade_id": "UInt64",
+    "price": "Float64",
+    "last_size": "Float64",
+    "time": "DateTime",
+    "product_id": "LowCardinality(String)",
+    "side": "LowCardinality(String)",
+    "open_24h": "Float64",
+    "volume_24h": "Float64",
+    "low_24h": "Float64",
+    "high_24h": "Float64",
+    "volume_30d": "Float64",
+    "best_bid": "Float64",
+    "best_bid_size": "Float64",
+    "best_ask": "Float64",
+    "best_ask_size": "Float64",
+}
+
+# The sinks of each scenario and the exchange's rate, None for the --rate option
+_SCENARIOS = {
+    "file": (["benchmark_file"], None),
+    "clickhouse": (["fake_clickhouse"], None),
+    "fanout": (["benchmark_file", "fake_clickhouse"], None),
+    "fanout_max": (["benchmark_file", "fake_clickhouse"], 0),
+}
+
+# Metrics where a larger value is an improvement, for the other ones smaller is
+_HIGHER_IS_BETTER = {"msgs_per_s"}
+
+_TIME = re.compile(r'"time":\s*"([^"]+)"')
+
+
+class _Recorder:
+    """Keeps the end-to-end latency of the messages a sink has written."""
+
+    def __init__(self):
+        """Initialize an empty recorder."""
+        self.count = 0
+        self.latencies = array("q")
+        self.first_sent: int | None = None
+        self.last_written = 0
+
+    def record(self, count: int, sent: Iterable[int]) -> None:
+        """Record that `count` messages were written, sent at (a sample of) `sent`."""
+        now = time.time_ns() // 1000
+        for sent_at in sent:
+            self.latencies.append(now - sent_at)
+            if self.first_sent is None or sent_at < self.first_sent:
+                self.first_sent = sent_at
+        self.count += count
+        self.last_written = now
+
+
+# The recorders of the sinks in this process
+_recorders: List[_Recorder] = []
+
+
+@register_sink("benchmark_file")
+class _BenchmarkFileSink(FileSink):
+    """File sink recording the latency of one line in ten."""
+
+    config_schema = {
+        **FileSink.config_schema,
+        "properties": {
+            **FileSink.config_schema["properties"],
+            "type": {"type": "string", "enum": ["benchmark_file"]},
+        },
+    }
+
+    def __init__(self, config: dict):
+        """Initialize the sink and its recorder."""
+        super().__init__(config)
+        self.recorder = _Recorder()
+        _recorders.append(self.recorder)
+
+    def _write_lines(self, messages: List[str]) -> None:
+        """Write the lines, then record when they were written."""
+        super()._write_lines(messages)
+        sent = (_TIME.search(message) for message in messages[::10])
+        self.recorder.record(
+            len(messages), (to_epoch_micros(match[1]) for match in sent if match)
+        )
+
+
+class _FakeClient:
+    """Stands in for a clickhouse_connect client, encoding inserts but not sending them."""
+
+    def __init__(self, recorder: _Recorder):
+        """Initialize the client."""
+        self.recorder = recorder
+        self.bytes_encoded = 0
+        # The times of the rows being inserted on each thread, to the microsecond
+        self.sent = threading.local()
+
+    def create_insert_context(
+        self, table: str, column_names: List[str], column_oriented: bool
+    ) -> InsertContext:
+        """Create an insert context with the ticker table's column types."""
+        return InsertContext(
+            table,
+            column_names,
+            [get_from_name(_TICKER_COLUMN_TYPES[name]) for name in column_names],
+            column_oriented=column_oriented,
+            compression="lz4",
+        )
+
+    def insert(self, context: InsertContext) -> None:
+        """Encode and compress the insert, then record when its rows were written."""
+        for chunk in NativeTransform.build_insert(context):
+            self.bytes_encoded += len(chunk)
+        times = self.sent.micros
+        self.recorder.record(len(times), times)
+
+    def close(self) -> None:
+        """Nothing to close."""
+
+
+@register_sink("fake_clickhouse")
+class _FakeClickHouseSink(ClickHouseConnectSink):
+    """ClickHouse sink inserting through a `_FakeClient`."""
+
+    config_schema = {
+        **ClickHouseConnectSink.config_schema,
+        "properties": {
+            **ClickHouseConnectSink.config_schema["properties"],
+            "type": {"type": "string", "enum": ["fake_clickhouse"]},
+        },
+    }
+
+    def _create_client(self) -> _FakeClient:
+        """Create the fake client, with a recorder."""
+        recorder = _Recorder()
+        _recorders.append(recorder)
+        return _FakeClient(recorder)
+
+    def _scale_times(self, micros: array, column_type: Any) -> Any:
+        """Keep the times for the client's latencies before they're cut to seconds."""
+        self.client.sent.micros = micros
+        return super()._scale_times(micros, column_type)
+
+
+def _config(sinks: List[str], port: int, directory: str) -> Dict[str, Any]:
+    """Return the listen config for a scenario."""
+    sink_configs = {
+        "benchmark_file": {
+            "type": "benchmark_file",
+            "file_path": os.path.join(directory, "benchmark.jsonl"),
+        },
+        "fake_clickhouse": {
+            "type": "fake_clickhouse",
+            "host": "localhost",
+            "port": 8123,
+            "database": "coinbase_demo",
+            "table": "coinbase_ticker",
+            "user": "default",
+            "max_rows": 10000,
+            "max_latency_ms": 100,
+            "max_in_flight": 2,
+        },
+    }
+    config = {
+        "source": {
+            "type": "coinbase",
+            "wss_url": f"ws://127.0.0.1:{port}",
+            "subscription": {"product_ids": _PRODUCT_IDS, "channels": ["ticker"]},
+            "decoder": "auto",
+        },
+        "pipeline": {"stats_interval_s": 0},
+    }
+    if len(sinks) == 1:
+        config["sink"] = sink_configs[sinks[0]]
+    else:
+        config["sinks"] = [sink_configs[sink] for sink in sinks]
+    return config
+
+
+def _percentile(ordered: array, fraction: float) -> float:
+    """Return a percentile of sorted latencies, in milliseconds."""
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] / 1000
+
+
+async def _listen(config: Dict[str, Any], count: int, timeout_s: float) -> dict:
+    """Run the listener until every sink has written `count` messages."""
+    started, cpu_started = time.monotonic(), time.process_time()
+    task = asyncio.create_task(_async_run(config))
+    deadline = started + timeout_s
+    while not task.done() and time.monotonic() < deadline:
+        if _recorders and all(r.count >= count for r in _recorders):
+            break
+        await asyncio.sleep(0.05)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    cpu_s = time.process_time() - cpu_started
+
+    written = min((r.count for r in _recorders), default=0)
+    if not written:
+        raise RuntimeError("Nothing was written")
+    latencies = array("q", sorted(lat for r in _recorders for lat in r.latencies))
+    first_sent = min(r.first_sent for r in _recorders)
+    last_written = max(r.last_written for r in _recorders)
+    return {
+        "messages": written,
+        "msgs_per_s": round(written / ((last_written - first_sent) / 1e6)),
+        "p50_latency_ms": round(_percentile(latencies, 0.5), 2),
+        "p99_latency_ms": round(_percentile(latencies, 0.99), 2),
+        "cpu_us_per_msg": round(cpu_s / written * 1e6, 2),
+        "peak_rss_mib": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def _run_listener(
+    config: Dict[str, Any], count: int, timeout_s: float, results: Any
+) -> None:
+    """Run the listener in a process of its own, putting its metrics on `results`."""
+    try:
+        results.put(asyncio.run(_listen(config, count, timeout_s)))
+    except Exception as e:
+        results.put({"error": str(e)})
+
+
+def _run_scenario(
+    sinks: List[str], rate: float, burst: int, count: int, timeout_s: float
+) -> dict:
+    """Run one scenario against a fresh exchange and return the listener's metrics."""
+    context = multiprocessing.get_context("spawn")
+    ports, results = context.Queue(), context.Queue()
+    exchange = context.Process(
+        target=run_exchange, args=(ports, rate, burst, count), name="fake-exchange"
+    )
+    exchange.start()
+    try:
+        port = ports.get(timeout=30)
+        with tempfile.TemporaryDirectory() as directory:
+            listener = context.Process(
+                target=_run_listener,
+                args=(_config(sinks, port, directory), count, timeout_s, results),
+                name="listener",
+            )
+            listener.start()
+            metrics = results.get(timeout=timeout_s + 60)
+            listener.join()
+    finally:
+        exchange.terminate()
+        exchange.join()
+    if "error" in metrics:
+        raise click.ClickException(metrics["error"])
+    return metrics
+
+
+def _regressions(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float
+) -> List[str]:
+    """Describe every metric that is worse than its baseline by more than tolerance."""
+    regressions = []
+    for scenario, metrics in results.items():
+        for metric, expected in baseline.get(scenario, {}).items():
+            if metric == "messages" or metric not in metrics:
+                continue
+            actual = metrics[metric]
+            if metric in _HIGHER_IS_BETTER:
+                worse = actual < expected * (1 - tolerance)
+            else:
+                worse = actual > expected * (1 + tolerance)
+            if worse:
+                regressions.append(
+                    f"{scenario} {metric}: {actual} against a baseline of {expected}"
+                )
+    return regressions
+
+
+@click.command()
+@click.option(
+    "--scenario",
+    "scenarios",
+    multiple=True,
+    type=click.Choice(list(_SCENARIOS)),
+    help="Scenarios to run, all of them by default",
+)
+@click.option("--count", default=100_000, help="Messages per scenario")
+@click.option("--rate", default=10_000.0, help="Messages per second sent")
+@click.option("--burst", default=100, help="Messages sent back to back at a time")
+@click.option("--timeout", "timeout_s", default=120.0, help="Limit per scenario")
+@click.option(
+    "--baseline",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=_BASELINE,
+    show_default=True,
+)
+@click.option("--check", is_flag=True, help="Fail if a metric regressed")
+@click.option("--update-baseline", is_flag=True, help="Save the results as baseline")
+@click.option("--tolerance", default=0.25, help="Allowed regression, as a fraction")
+def benchmark(
+    scenarios: List[str],
+    count: int,
+    rate: float,
+    burst: int,
+    timeout_s: float,
+    baseline: Path,
+    check: bool,
+    update_baseline: bool,
+    tolerance: float,
+) -> None:
+    """Benchmark the listen pipeline end to end."""
+    settings = {"count": count, "rate": rate, "burst": burst}
+    results = {}
+    for name in scenarios or list(_SCENARIOS):
+        sinks, scenario_rate = _SCENARIOS[name]
+        scenario_rate = rate if scenario_rate is None else scenario_rate
+        metrics = _run_scenario(sinks, scenario_rate, burst, count, timeout_s)
+        results[name] = metrics
+        click.echo(
+            f"{name:>12}: {metrics['msgs_per_s']:>8,} msgs/s "
+            f"p50 {metrics['p50_latency_ms']:7.2f} ms "
+            f"p99 {metrics['p99_latency_ms']:7.2f} ms "
+            f"{metrics['cpu_us_per_msg']:6.2f} us CPU/msg "
+            f"{metrics['peak_rss_mib']:6.1f} MiB peak RSS"
+            + ("" if metrics["messages"] >= count else " (timed out)")
+        )
+
+    if update_baseline:
+        saved = json.loads(baseline.read_text()) if baseline.exists() else {}
+        if saved.get("settings", settings) != settings:
+            saved["scenarios"] = {}
+        saved["settings"] = settings
+        saved["scenarios"] = {**saved.get("scenarios", {}), **results}
+        baseline.parent.mkdir(parents=True, exist_ok=True)
+        baseline.write_text(json.dumps(saved, indent=2) + "\n")
+        click.echo(f"Saved the results to {baseline}")
+
+    if check:
+        saved = json.loads(baseline.read_text())
+        if saved["settings"] != settings:
+            raise click.ClickException(
+                f"The baseline was recorded with {saved['settings']}, not {settings}"
+            )
+        regressions = _regressions(results, saved["scenarios"], tolerance)
+        for regression in regressions:
+            click.echo(f"Regression: {regression}", err=True)
+        if regressions:
+            raise SystemExit(1)
+        click.echo("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    benchmark()
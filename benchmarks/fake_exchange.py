@@ -0,0 +1,136 @@
+"""Local stand-in for the Coinbase websocket feed.
+
+Speaks enough of Coinbase's protocol for the coinbase source: it waits for the
+subscribe message, confirms it, then streams ticker messages for the subscribed
+products at a fixed rate. Messages go out in bursts of `--burst` back to back,
+spaced so the average rate is `--rate`, and each message's `time` is when its
+burst was sent, so a sink can work out the end-to-end latency.
+
+    poetry run python benchmarks/fake_exchange.py --rate 5000 --burst 100
+
+then point a config's `wss_url` at `ws://localhost:8765`.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+import json
+import random
+import time
+from typing import Any, Callable
+
+import click
+from websockets.asyncio.server import serve
+
+# A ticker message as Coinbase sends it, every number a string
+_TICKER = (
+    '{{"type":"ticker","sequence":{sequence},"product_id":"{product_id}",'
+    '"price":"{price:.2f}","open_24h":"96420.01","volume_24h":"11009.55813263",'
+    '"low_24h":"95500","high_24h":"98000.5","volume_30d":"310217.53462719",'
+    '"best_bid":"{bid:.2f}","best_bid_size":"0.00038584","best_ask":"{price:.2f}",'
+    '"best_ask_size":"0.18140919","side":"{side}","time":"{time}",'
+    '"trade_id":{trade_id},"last_size":"0.00071001"}}'
+)
+
+
+def _now() -> str:
+    """Return the current time the way Coinbase formats it."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+async def _stream(websocket: Any, rate: float, burst: int, count: int) -> None:
+    """Confirm a subscription, then send ticker messages until `count` are sent."""
+    subscribe = json.loads(await websocket.recv())
+    product_ids = subscribe["product_ids"]
+    await websocket.send(
+        json.dumps(
+            {
+                "type": "subscriptions",
+                "channels": [
+                    {"name": channel, "product_ids": product_ids}
+                    for channel in subscribe["channels"]
+                ],
+            }
+        )
+    )
+
+    interval = burst / rate if rate else 0
+    next_at = time.perf_counter()
+    price = 97000.0
+    sent = 0
+    while not count or sent < count:
+        sent_at = _now()
+        size = min(burst, count - sent) if count else burst
+        for n in range(sent, sent + size):
+            price += random.uniform(-5, 5)
+            await websocket.send(
+                _TICKER.format(
+                    sequence=n,
+                    product_id=product_ids[n % len(product_ids)],
+                    price=price,
+                    bid=price - 0.01,
+                    side="buy" if n % 2 else "sell",
+                    time=sent_at,
+                    trade_id=780146125 + n,
+                )
+            )
+        sent += size
+        if interval:
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+    await websocket.wait_closed()
+
+
+async def serve_exchange(
+    port: int,
+    rate: float,
+    burst: int,
+    count: int,
+    ready: Callable[[int], None] | None = None,
+) -> None:
+    """Serve the exchange until cancelled.
+
+    Args:
+        port: The port to listen on, 0 picks a free one
+        rate: Messages per second per connection, 0 sends as fast as possible
+        burst: Messages sent back to back at a time
+        count: Messages to send per connection, 0 for no limit
+        ready: Called with the port once the server is listening
+    """
+
+    async def handler(websocket: Any) -> None:
+        await _stream(websocket, rate, burst, count)
+
+    async with serve(handler, "127.0.0.1", port) as server:
+        if ready:
+            ready(server.sockets[0].getsockname()[1])
+        await asyncio.Future()
+
+
+def run_exchange(ports: Any, rate: float, burst: int, count: int) -> None:
+    """Serve the exchange in a process of its own, putting its port on `ports`."""
+    try:
+        asyncio.run(serve_exchange(0, rate, burst, count, ports.put))
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command()
+@click.option("--port", default=8765)
+@click.option("--rate", default=1000.0, help="Messages per second, 0 for no limit")
+@click.option("--burst", default=1, help="Messages sent back to back at a time")
+@click.option("--count", default=0, help="Messages per connection, 0 for no limit")
+def exchange(port: int, rate: float, burst: int, count: int) -> None:
+    """Serve a fake Coinbase feed on localhost."""
+    asyncio.run(
+        serve_exchange(
+            port, rate, burst, count, lambda p: click.echo(f"Listening on port {p}")
+        )
+    )
+
+
+if __name__ == "__main__":
+    exchange()
@@ -0,0 +1,135 @@
+"""Compare inserting into ClickHouse over HTTP and over the native protocol.
+
+Needs a running ClickHouse with the coinbase_ticker table from sql/coinbase_ticker.sql. The
+benchmark inserts real rows, so point it at a scratch copy of the table:
+
+    CREATE TABLE coinbase_demo.ticker_benchmark AS coinbase_demo.coinbase_ticker;
+    poetry run python benchmarks/insert_benchmark.py --table ticker_benchmark
+
+The records are generated already decoded, so the CPU time per row is what the
+sink itself costs: building the columns, serializing and compressing them.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, List
+
+import click
+
+from streaming_analytics_demo.sinks import get_sink
+
+
+def _generate_records(count: int) -> List[Dict[str, Any]]:
+    """Generate decoded ticker records, as the source hands them to the sink."""
+    records = []
+    price = 97000.0
+    started = int(time.time() * 1_000_000)
+    for sequence in range(count):
+        price += random.uniform(-5, 5)
+        records.append(
+            {
+                "type": "ticker",
+                "sequence": sequence,
+                "product_id": "BTC-USD",
+                "price": price,
+                "open_24h": 96420.01,
+                "volume_24h": 11009.55813263,
+                "low_24h": 95500.0,
+                "high_24h": 98000.5,
+                "volume_30d": 310217.53462719,
+                "best_bid": price - 0.01,
+                "best_bid_size": 0.00038584,
+                "best_ask": price,
+                "best_ask_size": 0.18140919,
+                "side": random.choice(["buy", "sell"]),
+                "time": started + sequence * 1000,
+                "trade_id": 780146125 + sequence,
+                "last_size": 0.00071001,
+            }
+        )
+    return records
+
+
+async def _run(config: Dict[str, Any], records: List[Dict[str, Any]], chunk: int):
+    """Write the records through a sink, returning wall and CPU seconds."""
+    sink = get_sink(config)
+    await sink.connect()
+    try:
+        started, cpu_started = time.perf_counter(), time.process_time()
+        for i in range(0, len(records), chunk):
+            await sink.write_records(records[i : i + chunk])
+        await sink.flush()
+        return time.perf_counter() - started, time.process_time() - cpu_started
+    finally:
+        await sink.disconnect()
+
+
+@click.command()
+@click.option("--host", default="localhost")
+@click.option("--http-port", default=8123, help="Port for clickhouse_connect")
+@click.option("--native-port", default=9000, help="Port for clickhouse_native")
+@click.option("--database", default="coinbase_demo")
+@click.option("--table", default="ticker_benchmark")
+@click.option("--user", default="default")
+@click.option("--password", default="")
+@click.option("--count", default=500_000, help="Number of rows to insert per run")
+@click.option("--batch-rows", default=50_000, help="Rows per insert (max_rows)")
+@click.option("--max-in-flight", default=1, help="Concurrent inserts per sink")
+@click.option(
+    "--compression",
+    type=click.Choice(["none", "lz4", "lz4hc", "zstd"]),
+    default="lz4",
+    help="Native protocol compression",
+)
+@click.option("--repeat", default=3, help="Runs per sink, the best is reported")
+def benchmark(
+    host: str,
+    http_port: int,
+    native_port: int,
+    database: str,
+    table: str,
+    user: str,
+    password: str,
+    count: int,
+    batch_rows: int,
+    max_in_flight: int,
+    compression: str,
+    repeat: int,
+) -> None:
+    """Time inserting generated ticker rows through each ClickHouse sink."""
+    common = {
+        "host": host,
+        "database": database,
+        "table": table,
+        "user": user,
+        "password": password,
+        "max_rows": batch_rows,
+        "max_in_flight": max_in_flight,
+    }
+    configs = {
+        "http": {**common, "type": "clickhouse_connect", "port": http_port},
+        f"native ({compression})": {
+            **common,
+            "type": "clickhouse_native",
+            "port": native_port,
+            "compression": compression,
+        },
+    }
+    records = _generate_records(count)
+
+    click.echo(f"{count} rows in batches of {batch_rows}, best of {repeat} runs")
+    baseline = None
+    for name, config in configs.items():
+        runs = [asyncio.run(_run(config, records, 1000)) for _ in range(repeat)]
+        elapsed, cpu = min(runs)
+        baseline = baseline or elapsed
+        click.echo(
+            f"{name:>14}: {count / elapsed:>10,.0f} rows/s "
+            f"{cpu / count * 1e6:6.2f} us CPU/row "
+            f"{baseline / elapsed:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
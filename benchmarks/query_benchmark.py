@@ -0,0 +1,109 @@
+"""Compare the rows the queries in sql/ read with and without the table's indexes.
+
+Needs a running ClickHouse with the coinbase_ticker table from
+sql/coinbase_ticker.sql, some data in it, and the projection and skip index from
+sql/coinbase_ticker_indexes.sql:
+
+    poetry run python benchmarks/query_benchmark.py
+
+Each query is run once per step, with ClickHouse settings turning the skip
+indexes and projections off, then adding each back in turn, so nothing on the
+table changes:
+
+    scan            neither, only the partitions and primary key prune
+    + skip indexes  the time_minmax index
+    + projections   the ticks_per_minute projection and the part min/max of time
+
+Rows and bytes read are ClickHouse's own counts for the query, the time is the
+best of --repeat runs as seen by the client.
+"""
+
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import click
+import clickhouse_connect
+
+_SQL = Path(__file__).parent.parent / "sql"
+
+_QUERIES = ["vwap_calculation.sql", "ingestion_monitoring.sql"]
+
+_OFF = {
+    "use_skip_indexes": 0,
+    "optimize_use_projections": 0,
+    "optimize_use_implicit_projections": 0,
+}
+
+# The settings of each step, an empty one leaving the server's defaults
+_STEPS: List[Tuple[str, Dict[str, Any]]] = [
+    ("scan", _OFF),
+    ("+ skip indexes", {**_OFF, "use_skip_indexes": 1}),
+    ("+ projections", {}),
+]
+
+
+def _read_query(name: str) -> str:
+    """Read a single statement query from sql/, without its trailing semicolon."""
+    return (_SQL / name).read_text().strip().rstrip(";")
+
+
+def _run(client: Any, query: str, settings: Dict[str, Any], repeat: int):
+    """Run a query, returning the rows and bytes it read and its best time."""
+    # Wait for the query to finish, so the summary has the final counts
+    settings = {**settings, "wait_end_of_query": 1}
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = client.query(query, settings=settings)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    summary = result.summary
+    return int(summary["read_rows"]), int(summary["read_bytes"]), best
+
+
+@click.command()
+@click.option("--host", default="localhost")
+@click.option("--port", default=8123)
+@click.option("--user", default="default")
+@click.option("--password", default="")
+@click.option(
+    "--query",
+    "queries",
+    multiple=True,
+    default=_QUERIES,
+    help="A file in sql/ to run, may be repeated",
+)
+@click.option("--repeat", default=3, help="Runs per step, the best time is reported")
+def benchmark(
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    queries: Tuple[str, ...],
+    repeat: int,
+) -> None:
+    """Report the rows read by each query in sql/ as each index is enabled."""
+    client = clickhouse_connect.get_client(
+        host=host, port=port, username=user, password=password
+    )
+    (total,) = client.query(
+        "SELECT count() FROM coinbase_demo.coinbase_ticker"
+    ).result_rows[0]
+    click.echo(f"coinbase_ticker has {total:,} rows, best of {repeat} runs")
+
+    for name in queries:
+        query = _read_query(name)
+        click.echo(name)
+        baseline = None
+        for step, settings in _STEPS:
+            rows, read_bytes, elapsed = _run(client, query, settings, repeat)
+            baseline = baseline or max(rows, 1)
+            click.echo(
+                f"{step:>16}: {rows:>14,} rows {read_bytes / 1e6:10.1f} MB "
+                f"{elapsed * 1000:8.1f} ms {rows / baseline:7.2%} of the rows"
+            )
+
+
+if __name__ == "__main__":
+    benchmark()
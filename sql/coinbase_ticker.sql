@@ -0,0 +1,48 @@
+-- create the raw table the clickhouse sinks write ticker messages to
+--
+-- Partitioned by day and ordered by product then time, so a query for one
+-- product over a recent range reads only that range's parts and granules, and
+-- whole days can be dropped at once. Times and ids are delta encoded, prices
+-- and sizes are XOR encoded with Gorilla, and everything is then compressed
+-- with ZSTD. product_id and side have a handful of values, so they are stored
+-- as dictionary indexes.
+CREATE TABLE IF NOT EXISTS coinbase_demo.coinbase_ticker
+(
+    sequence UInt64 CODEC(Delta, ZSTD(1)),
+    trade_id UInt64 CODEC(Delta, ZSTD(1)),
+    price Float64 CODEC(Gorilla, ZSTD(1)),
+    last_size Float64 CODEC(Gorilla, ZSTD(1)),
+    time DateTime CODEC(DoubleDelta, ZSTD(1)),
+    product_id LowCardinality(String),
+    side LowCardinality(String),
+    open_24h Float64 CODEC(Gorilla, ZSTD(1)),
+    volume_24h Float64 CODEC(Gorilla, ZSTD(1)),
+    low_24h Float64 CODEC(Gorilla, ZSTD(1)),
+    high_24h Float64 CODEC(Gorilla, ZSTD(1)),
+    volume_30d Float64 CODEC(Gorilla, ZSTD(1)),
+    best_bid Float64 CODEC(Gorilla, ZSTD(1)),
+    best_bid_size Float64 CODEC(Gorilla, ZSTD(1)),
+    best_ask Float64 CODEC(Gorilla, ZSTD(1)),
+    best_ask_size Float64 CODEC(Gorilla, ZSTD(1))
+) ENGINE = MergeTree()
+PARTITION BY toYYYYMMDD(time)
+ORDER BY (product_id, time)
+-- The materialized views add each tick to the per minute rollups as it
+-- arrives, and dbt never rebuilds those from this table, so raw ticks are only
+-- kept for 30 days, e.g. for checking the ingestion.
+TTL time + INTERVAL 30 DAY DELETE
+-- With a storage policy that has a 'cold' volume, move ticks there first:
+-- TTL time + INTERVAL 7 DAY TO VOLUME 'cold', time + INTERVAL 30 DAY DELETE
+SETTINGS ttl_only_drop_parts = 1;  -- drop whole days rather than rewrite parts
+
+-- the compression of each column, to check the codecs are paying off
+SELECT
+    name,
+    type,
+    compression_codec,
+    formatReadableSize(data_compressed_bytes) as compressed,
+    formatReadableSize(data_uncompressed_bytes) as uncompressed,
+    round(data_uncompressed_bytes / data_compressed_bytes, 1) as ratio
+FROM system.columns
+WHERE database = 'coinbase_demo' AND table = 'coinbase_ticker'
+ORDER BY data_compressed_bytes DESC;
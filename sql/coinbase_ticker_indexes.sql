@@ -0,0 +1,34 @@
+-- add the projection and skip index the queries in sql/ read from, to
+-- coinbase_ticker as created by sql/coinbase_ticker.sql
+--
+-- benchmarks/query_benchmark.py shows the rows each query reads with and
+-- without them.
+
+-- The ticks of each product per minute, pre-aggregated. Queries grouping by
+-- tumbleStart(time, toIntervalMinute(1)), optionally by product_id as well, and
+-- using these aggregates read one row per product and minute per part instead
+-- of every tick. vwap_calculation.sql and ingestion_monitoring.sql are written
+-- in this form. The table's own order, (product_id, time), already serves
+-- queries for one product over a time range, so there is no sort projection.
+ALTER TABLE coinbase_demo.coinbase_ticker
+    ADD PROJECTION IF NOT EXISTS ticks_per_minute
+    (
+        SELECT
+            product_id,
+            tumbleStart(time, toIntervalMinute(1)),
+            countIf(last_size > 0),
+            sumIf(last_size, last_size > 0 AND price > 0),
+            sumIf(price * last_size, last_size > 0 AND price > 0)
+        GROUP BY product_id, tumbleStart(time, toIntervalMinute(1))
+    );
+
+-- The primary key only narrows time within each product's range of the table,
+-- so a time range across all products can still read granules at the edges of
+-- each range. The smallest and largest time of each granule lets those be
+-- skipped when a query can't be answered from the projection.
+ALTER TABLE coinbase_demo.coinbase_ticker
+    ADD INDEX IF NOT EXISTS time_minmax time TYPE minmax GRANULARITY 1;
+
+-- build both for the parts already written, new parts get them as they're inserted
+ALTER TABLE coinbase_demo.coinbase_ticker MATERIALIZE PROJECTION ticks_per_minute;
+ALTER TABLE coinbase_demo.coinbase_ticker MATERIALIZE INDEX time_minmax;
@@ -1,36 +1,35 @@
 -- this query shows the number of rows ingested per minute
 
--- CTE for each minute since the start of the data to now
+-- CTE for each minute since the start of the data to now. min(time) is read
+-- from the part metadata, as time is the partition key, not from every row
 WITH time_series AS (
     SELECT 
         arrayJoin(
             range(
                 toUnixTimestamp(
-                    (SELECT min(tumbleStart(time, toIntervalMinute(1)))
+                    (SELECT tumbleStart(min(time), toIntervalMinute(1))
                      FROM coinbase_demo.coinbase_ticker)
                 ),
                 toUnixTimestamp(
-                    (SELECT max(tumbleStart(now(), toIntervalMinute(1)))
-                     FROM coinbase_demo.coinbase_ticker)
+                    (SELECT tumbleStart(now(), toIntervalMinute(1)))
                 ),
                 60  # increment by 60 seconds (1 minute)
             )
         ) as minute
 ),
--- CTE to break out the trades by minute
-trade_by_minute AS (
+-- CTE counting the trades per minute, in the form of the ticks_per_minute
+-- projection in coinbase_ticker_indexes.sql so it's answered from it
+trades_by_minute AS (
     SELECT 
         tumbleStart(time, toIntervalMinute(1)) as minute,
-        time,
-        last_size,
-        product_id
+        countIf(last_size > 0) as num_rows
     FROM coinbase_demo.coinbase_ticker
+    GROUP BY minute
 )
 -- select the minute and the number of rows ingested for each minute
 SELECT 
     fromUnixTimestamp(ts.minute) as minute,
-    countIf(t.last_size > 0 AND t.last_size IS NOT NULL) as num_rows
+    t.num_rows as num_rows
 FROM time_series ts
-LEFT JOIN trade_by_minute t ON fromUnixTimestamp(ts.minute) = t.minute
-GROUP BY ts.minute
+LEFT JOIN trades_by_minute t ON fromUnixTimestamp(ts.minute) = t.minute
 ORDER BY ts.minute DESC;
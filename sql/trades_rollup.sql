@@ -0,0 +1,28 @@
+-- create the table the aggregating sink writes its 1 minute windows to
+CREATE TABLE IF NOT EXISTS coinbase_demo.trades_per_minute_rollup
+(
+    product_id LowCardinality(String),
+    window_start DateTime64(6, 'UTC'),
+    open Float64,
+    high Float64,
+    low Float64,
+    close Float64,
+    volume Float64,
+    notional Float64,  -- sum of size * price
+    trades UInt64
+) ENGINE = MergeTree()
+PARTITION BY toYYYYMM(window_start)
+ORDER BY (product_id, window_start);
+
+-- the 5 minute vwap per product for the last 24 hours. A window split by a
+-- restart of the listener has two rows, so sum them rather than pick one
+SELECT
+    product_id,
+    tumbleStart(window_start, toIntervalMinute(5)) as period,
+    sum(notional) / sum(volume) as vwap,
+    sum(volume) as total_volume,
+    sum(trades) as num_trades
+FROM coinbase_demo.trades_per_minute_rollup
+WHERE window_start >= now() - INTERVAL 24 HOUR
+GROUP BY product_id, period
+ORDER BY product_id, period;
@@ -14,17 +14,26 @@ WITH time_series AS (
             )
         ) as interval
 ),
--- calculate the components of the vwap
-vwap AS (
+-- calculate the components of the vwap per minute, in the form of the
+-- ticks_per_minute projection in coinbase_ticker_indexes.sql so the query is
+-- answered from it rather than from every tick, then sum them per 5 minutes
+vwap_per_minute AS (
     SELECT 
-        tumbleStart(time, toIntervalMinute(5)) as period,
-        SUM(price * last_size) as volume_price,
-        SUM(last_size) as total_volume
+        tumbleStart(time, toIntervalMinute(1)) as minute,
+        -- Filter out zero volume trades and invalid prices
+        sumIf(price * last_size, last_size > 0 AND price > 0) as minute_volume_price,
+        sumIf(last_size, last_size > 0 AND price > 0) as minute_volume
       FROM coinbase_demo.coinbase_ticker
       WHERE 
-          period >= now() - INTERVAL 24 HOUR
-          AND last_size > 0  -- Filter out zero volume trades
-          AND price > 0      -- Filter out invalid prices
+          minute >= tumbleStart((now() - INTERVAL 24 HOUR), toIntervalMinute(5))
+      GROUP BY minute
+),
+vwap AS (
+    SELECT 
+        tumbleStart(minute, toIntervalMinute(5)) as period,
+        SUM(minute_volume_price) as volume_price,
+        SUM(minute_volume) as total_volume
+      FROM vwap_per_minute
       GROUP BY period
 )
 -- join the vwap calculation to the time series to give the 5 minute vwap for the last 24 hours
@@ -7,15 +7,18 @@ Raises:
 """
 
 import click
-import json
 import logging
+import signal
 from jsonschema import validate, ValidationError
 from pathlib import Path
-from typing import Dict
+from typing import Any, Callable, Dict, List, Tuple
 import yaml
 
+from streaming_analytics_demo.metrics import MetricsServer
+from streaming_analytics_demo.pipeline import Pipeline
 from streaming_analytics_demo.sinks import get_sink, Sink
 from streaming_analytics_demo.sources import Source, get_source
+from streaming_analytics_demo.supervisor import Supervisor
 from streaming_analytics_demo.util import setup_logging
 
 setup_logging()
@@ -30,17 +33,105 @@ logger = logging.getLogger(__name__)
     help="Path to configuration file",
     required=True,
 )
-def listen(config: Path) -> tuple[Path]:
+@click.option(
+    "--workers",
+    "-w",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of worker processes, each listening to a share of the products",
+)
+def listen(config: Path, workers: int) -> tuple[Path]:
     """Listen to a stream using the configuration in 'config'."""
     import asyncio
 
-    async def run():
-        config_data = build_config(config)
-        source = await _async_connect_source(config_data)
-        sink = await _async_connect_sink(config_data)
-        await _async_listen(source, sink)
+    config_data = build_config(config)
+    if workers > 1:
+        Supervisor(config_data, workers, _run_worker).run()
+        return
+    asyncio.run(_async_run(config_data))
+
+
+def _run_worker(config_data: Dict, worker: int, reports: Any) -> None:
+    """Run the pipeline in a worker process, reporting its stats to the supervisor.
+
+    Ctrl-C sends SIGINT to every process in the terminal's foreground group, and
+    a second interrupt from the supervisor would land in the middle of flushing
+    the sinks. So workers ignore SIGINT and the supervisor stops them with
+    SIGTERM instead.
+    """
+    import asyncio
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def report(stats: dict) -> None:
+        reports.put((worker, stats))
+
+    if asyncio.run(_async_run_worker(config_data, report)):
+        # The source has run out, there is nothing for a restart to read
+        reports.put((worker, None))
+
+
+async def _async_run_worker(
+    config_data: Dict, stats_callback: Callable[[dict], None]
+) -> bool:
+    """Run the pipeline, stopping it on SIGTERM the way asyncio.run does on SIGINT.
+
+    The first SIGTERM cancels the pipeline, which then disconnects the source and
+    sinks, flushing them. Further ones are ignored so they can't cut that short.
+
+    Returns:
+        bool: True if the pipeline stopped because the source ran out of messages
+    """
+    import asyncio
+
+    task = asyncio.current_task()
+    terminated = False
+
+    def terminate() -> None:
+        nonlocal terminated
+        if not terminated:
+            terminated = True
+            logger.info("Received SIGTERM, shutting down...")
+            task.cancel()
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, terminate)
+    try:
+        return await _async_run(config_data, stats_callback)
+    except asyncio.CancelledError:
+        if not terminated:
+            raise
+        return False
 
-    asyncio.run(run())
+
+async def _async_run(
+    config_data: Dict, stats_callback: Callable[[dict], None] | None = None
+) -> bool:
+    """Connect the source and sinks, then run the pipeline until it stops.
+
+    If the config has a `metrics` section, the metrics endpoint is served for as
+    long as this runs.
+
+    Returns:
+        bool: True if the pipeline stopped because the source ran out of messages
+    """
+    server = None
+    if "metrics" in config_data:
+        metrics = config_data["metrics"]
+        server = MetricsServer(metrics.get("host", "0.0.0.0"), metrics["port"])
+        await server.start()
+    try:
+        source = await _async_connect_source(config_data)
+        pipeline_config = config_data.get("pipeline")
+        if "sinks" in config_data:
+            sink, pipeline_config = await _async_connect_sinks(
+                config_data["sinks"], pipeline_config
+            )
+        else:
+            sink = await _async_connect_sink(config_data["sink"])
+        return await _async_listen(source, sink, pipeline_config, stats_callback)
+    finally:
+        if server:
+            await server.stop()
 
 
 async def _async_connect_source(config_data: Dict) -> Source:
@@ -60,9 +151,8 @@ async def _async_connect_source(config_data: Dict) -> Source:
     return source
 
 
-async def _async_connect_sink(config_data: Dict) -> Sink:
+async def _async_connect_sink(sink_config: Dict) -> Sink:
     """Async implementation of listen command."""
-    sink_config = config_data.get("sink")
     sink = get_sink(sink_config)
     try:
         logger.info("Connecting to Sink %s", sink.__class__.__name__)
@@ -76,27 +166,57 @@ async def _async_connect_sink(config_data: Dict) -> Sink:
     return sink
 
 
-async def _async_listen(source: Source, sink: Sink) -> None:
-    """Async implementation of listen command."""
+async def _async_connect_sinks(
+    sink_configs: List[Dict], pipeline_config: Dict | None
+) -> Tuple[List[Sink], Dict | None]:
+    """Connect each of the sinks in a `sinks` list.
+
+    Each entry may carry a `pipeline` section overriding the queue settings for
+    that sink, these are moved into the pipeline config.
+
+    Returns:
+        The connected sinks and the pipeline config including the overrides
+    """
+    sinks = []
+    overrides = []
+    try:
+        for sink_config in sink_configs:
+            sink_config = dict(sink_config)
+            overrides.append(sink_config.pop("pipeline", None))
+            sinks.append(await _async_connect_sink(sink_config))
+    except Exception as e:
+        for sink in sinks:
+            await sink.disconnect()
+        raise e
+
+    if any(overrides):
+        pipeline_config = {**(pipeline_config or {}), "sinks": overrides}
+    return sinks, pipeline_config
+
+
+async def _async_listen(
+    source: Source,
+    sink: Sink | List[Sink],
+    pipeline_config: Dict | None = None,
+    stats_callback: Callable[[dict], None] | None = None,
+) -> bool:
+    """Async implementation of listen command.
+
+    Returns:
+        bool: True if the pipeline stopped because the source ran out of messages
+    """
     try:
-        while True:
-            try:
-                message = await source.receive()
-                logger.debug("Received message: %s", message)
-                await sink.write(json.dumps(message))
-            except KeyboardInterrupt:
-                logger.info("Received interrupt, shutting down...")
-                break
-            except Exception as e:
-                logger.error("Error processing message: %s", str(e))
-                break
+        pipeline = Pipeline(source, sink, pipeline_config, stats_callback)
+        await pipeline.run()
+        return pipeline.source_exhausted
     except Exception as e:
         logger.error("lost connection to feed: %s", str(e))
         raise e
     finally:
         logger.info("Disconnecting from Source")
         await source.disconnect()
-        await sink.disconnect()
+        for each_sink in sink if isinstance(sink, list) else [sink]:
+            await each_sink.disconnect()
 
 
 def build_config(config_path: Path) -> dict:
@@ -0,0 +1,337 @@
+"""Counters, gauges and histograms served in the Prometheus text format.
+
+Metrics are cheap enough to keep on the per-message path. A metric with labels
+is a dict of children keyed by the label values, and updating a child is a
+plain attribute increment, plus a bisect for histograms. Nothing is formatted
+until the endpoint is scraped. Updates aren't locked, so each metric should
+only be updated from one thread, normally the event loop.
+
+Components don't register their metrics globally. Sources and sinks return
+theirs from `metrics()`, which builds gauges and counters from the totals they
+already keep, and the pipeline adds a collector to the registry while it runs.
+Metrics with the same name from several components (e.g. two sinks) are served
+as one family, so their labels must tell them apart.
+"""
+
+import asyncio
+from bisect import bisect_left
+import logging
+import math
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from 100 us to 10 s
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value the way Prometheus expects."""
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Format labels as `{name="value",...}`, escaping the values."""
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+class _Value:
+    """The value of a counter or gauge for one set of label values."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        """Start at zero."""
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        """Increase the value."""
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        """Set the value, for gauges."""
+        self.value = value
+
+
+class _Buckets:
+    """The buckets of a histogram for one set of label values."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        """Start with empty buckets."""
+        self.bounds = bounds
+        # One count per bucket, not cumulative, plus one for +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record an observation."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    """A metric with zero or more labels."""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Initialize the metric.
+
+        Args:
+            name: The metric name
+            documentation: The help text
+            labelnames: The names of the metric's labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._unlabelled = self.labels()
+
+    def _new_child(self) -> object:
+        """Create the value for a new set of label values."""
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def labels(self, *values: str):
+        """Return the child for the given label values, creating it if needed.
+
+        On a hot path, keep the child rather than calling this for every update.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} takes labels {self.labelnames}, got {values}"
+                )
+            child = self._children[values] = self._new_child()
+        return child
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        """Yield the metric's samples as (name suffix, labels, value)."""
+        for values, child in self._children.items():
+            yield "", dict(zip(self.labelnames, values)), child.value
+
+
+class Counter(Metric):
+    """A total that only goes up, e.g. messages received."""
+
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        """Create a counter at zero."""
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        """Increase a counter without labels."""
+        self._unlabelled.inc(amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g. a queue's depth."""
+
+    type = "gauge"
+
+    def _new_child(self) -> _Value:
+        """Create a gauge at zero."""
+        return _Value()
+
+    def set(self, value: float) -> None:
+        """Set a gauge without labels."""
+        self._unlabelled.set(value)
+
+
+class Histogram(Metric):
+    """Counts of observations in buckets, e.g. insert latencies."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        """Initialize the histogram.
+
+        Args:
+            name: The metric name
+            documentation: The help text
+            labelnames: The names of the metric's labels
+            buckets: The upper bounds of the buckets, +Inf is added
+        """
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _Buckets:
+        """Create empty buckets."""
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Record an observation for a histogram without labels."""
+        self._unlabelled.observe(value)
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        """Yield the cumulative buckets, sum and count of each child."""
+        for values, child in self._children.items():
+            labels = dict(zip(self.labelnames, values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                yield "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield "_sum", labels, child.sum
+            yield "_count", labels, cumulative
+
+
+def counter(
+    name: str, documentation: str, labelnames: Sequence[str], values: Dict
+) -> Counter:
+    """Build a counter from totals kept elsewhere, keyed by their label values."""
+    metric = Counter(name, documentation, labelnames)
+    for key, value in values.items():
+        metric.labels(*key).inc(value)
+    return metric
+
+
+def gauge(
+    name: str, documentation: str, labelnames: Sequence[str], values: Dict
+) -> Gauge:
+    """Build a gauge from values kept elsewhere, keyed by their label values."""
+    metric = Gauge(name, documentation, labelnames)
+    for key, value in values.items():
+        metric.labels(*key).set(value)
+    return metric
+
+
+class Registry:
+    """Collectors whose metrics are served together."""
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def add_collector(self, collector: Callable[[], Iterable[Metric]]) -> None:
+        """Add a function returning metrics, called at every scrape."""
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], Iterable[Metric]]) -> None:
+        """Remove a collector, if it was added."""
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self) -> str:
+        """Render every collector's metrics in the Prometheus text format."""
+        families: Dict[str, List[str]] = {}
+        for collector in self._collectors:
+            for metric in collector():
+                lines = families.get(metric.name)
+                if lines is None:
+                    lines = families[metric.name] = [
+                        f"# HELP {metric.name} {metric.documentation}",
+                        f"# TYPE {metric.name} {metric.type}",
+                    ]
+                for suffix, labels, value in metric.samples():
+                    lines.append(
+                        f"{metric.name}{suffix}{_format_labels(labels)} "
+                        f"{_format_value(value)}"
+                    )
+        return "".join(line + "\n" for lines in families.values() for line in lines)
+
+
+# The registry the metrics endpoint serves
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    """Minimal HTTP server answering `GET /metrics` from a registry."""
+
+    def __init__(
+        self, host: str = "0.0.0.0", port: int = 9108, registry: Registry = REGISTRY
+    ):
+        """Initialize the server.
+
+        Args:
+            host: The address to listen on
+            port: The port to listen on, 0 picks a free one
+            registry: The registry to serve
+        """
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        """Start listening."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Serving metrics on %s:%d", self.host, self.port)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answer a single request and close the connection."""
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            # Skip the headers
+            while (await reader.readline()).strip():
+                pass
+            if len(request) >= 2 and request[0] == "GET" and request[1] == "/metrics":
+                status = "200 OK"
+                body = self.registry.render().encode()
+            else:
+                status = "404 Not Found"
+                body = b"Not found\n"
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\n"
+                    "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode()
+                + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def stop(self) -> None:
+        """Stop listening."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
@@ -0,0 +1,7 @@
+"""Pipeline connecting sources to sinks."""
+
+from .pipeline import Pipeline
+from .queue import BoundedQueue
+from .transforms import compile_transforms
+
+__all__ = ["BoundedQueue", "Pipeline", "compile_transforms"]
@@ -0,0 +1,80 @@
+"""Dropping messages delivered more than once, in bounded memory."""
+
+from collections import deque
+from typing import Any, Deque, Dict, Set, Tuple
+
+_Stream = Tuple[Any, Any]
+
+# Types sharing their keys with another, e.g. the last_match sent on
+# subscribing repeats the latest match, and may well have been received already
+_SAME_KEYS = {"last_match": "match"}
+
+
+class _RecentKeys:
+    """The last `size` keys seen, as a set for lookups and a ring buffer for eviction."""
+
+    __slots__ = ("keys", "order", "size")
+
+    def __init__(self, size: int):
+        """Start with no keys."""
+        self.keys: Set[Any] = set()
+        self.order: Deque[Any] = deque()
+        self.size = size
+
+    def add(self, key: Any) -> bool:
+        """Add a key, returning False if it was already there."""
+        if key in self.keys:
+            return False
+        if len(self.order) == self.size:
+            self.keys.discard(self.order.popleft())
+        self.keys.add(key)
+        self.order.append(key)
+        return True
+
+
+class Deduplicator:
+    """Recognizes messages already seen among the recent ones of their product.
+
+    Messages are keyed on their `field` (`trade_id` or `sequence`), which is
+    unique per product and message type, e.g. a ticker and a match for the same
+    trade are not duplicates. A `last_match` is checked against the matches,
+    since on a reconnect it repeats one. For each product and type the last
+    `window` keys are remembered, so memory stays fixed however long the feed
+    runs. Duplicates from a reconnect or from overlapping shards arrive within
+    moments of the original, well inside the window.
+
+    Messages without the field (e.g. heartbeats, subscriptions) are never
+    duplicates.
+    """
+
+    def __init__(self, field: str = "trade_id", window: int = 10000):
+        """Initialize the deduplicator.
+
+        Args:
+            field: The field identifying a message within its product and type
+            window: How many recent keys to remember per product and type
+        """
+        self.field = field
+        self.window = window
+        self._recent: Dict[_Stream, _RecentKeys] = {}
+        # Duplicates dropped, by product id
+        self.duplicates: Dict[Any, int] = {}
+
+    def is_duplicate(self, record: Dict[str, Any]) -> bool:
+        """Check whether a record was already seen, remembering it if not."""
+        key = record.get(self.field)
+        if key is None:
+            return False
+        msg_type = record.get("type")
+        stream = (record.get("product_id"), _SAME_KEYS.get(msg_type, msg_type))
+        recent = self._recent.get(stream)
+        if recent is None:
+            recent = self._recent[stream] = _RecentKeys(self.window)
+        if recent.add(key):
+            return False
+        self.duplicates[stream[0]] = self.duplicates.get(stream[0], 0) + 1
+        return True
+
+    def stats(self) -> dict:
+        """Return the number of duplicates dropped."""
+        return {"duplicates": sum(self.duplicates.values())}
@@ -0,0 +1,424 @@
+"""Producer/consumer pipeline moving messages from a source to one or more sinks."""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, ClassVar, Dict, List, Tuple
+
+import jsonschema
+
+from streaming_analytics_demo.metrics import (
+    REGISTRY,
+    Histogram,
+    Metric,
+    counter,
+    gauge,
+)
+from streaming_analytics_demo.sinks import Sink
+from streaming_analytics_demo.sources import Source
+from streaming_analytics_demo.util import RateLimiter
+
+from .dedup import Deduplicator
+from .queue import OVERFLOW_POLICIES, BoundedQueue
+from .transforms import TRANSFORMS_SCHEMA, compile_transforms
+
+logger = logging.getLogger(__name__)
+
+# Settings that apply to each sink's queue and writers, and can be overridden per sink
+_branch_properties = {
+    "queue_size": {"type": "integer", "minimum": 1},
+    "writers": {"type": "integer", "minimum": 1},
+    "batch_size": {"type": "integer", "minimum": 1},
+    "overflow": {"type": "string", "enum": list(OVERFLOW_POLICIES)},
+    "spill_path": {"type": "string"},
+    "transforms": TRANSFORMS_SCHEMA,
+}
+
+_BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class _Branch:
+    """A sink together with its own queue and batching."""
+
+    def __init__(self, sink: Sink, index: int, config: Dict[str, Any], overflow: str):
+        """Initialize the branch.
+
+        Args:
+            sink: A connected sink
+            index: The sink's position in the pipeline's sinks
+            config: The branch settings
+            overflow: The overflow policy if the settings don't name one
+        """
+        self.sink = sink
+        # Metric labels telling this branch apart, two sinks can be of one type
+        self.labels = (type(sink).__name__, str(index))
+        transforms = config.get("transforms")
+        self.transform = compile_transforms(transforms) if transforms else None
+        # Transforms work on decoded records, so a raw sink with transforms gets
+        # records, which it serializes itself
+        self.raw = sink.raw_passthrough is True and self.transform is None
+        self.writers = config.get("writers", 1)
+        self.batch_size = config.get("batch_size", 500)
+        self.queue = BoundedQueue(
+            config.get("queue_size", 10000),
+            overflow=config.get("overflow", overflow),
+            spill_path=config.get("spill_path"),
+        )
+        self.written = 0
+        self.filtered = 0
+        self.write_errors = 0
+
+        self.batch_sizes = Histogram(
+            "ingest_batch_size",
+            "Messages per batch written to a sink",
+            ("sink", "index"),
+            buckets=_BATCH_SIZE_BUCKETS,
+        )
+        self.write_seconds = Histogram(
+            "ingest_write_seconds",
+            "Time taken by a sink to accept a batch",
+            ("sink", "index"),
+        )
+        self._batch_sizes = self.batch_sizes.labels(*self.labels)
+        self._write_seconds = self.write_seconds.labels(*self.labels)
+
+    def stats(self) -> dict:
+        """Return a snapshot of the branch statistics."""
+        return {
+            "sink": type(self.sink).__name__,
+            "written": self.written,
+            "filtered": self.filtered,
+            **self.queue.stats(),
+        }
+
+
+class Pipeline:
+    """Decouples reading from the source and writing to the sinks.
+
+    A reader task receives messages from the source and puts them on a bounded
+    queue, while one or more writer tasks drain the queue in batches and write
+    them to the sink. Slow writes no longer stall reads from the source; what
+    happens when the queue fills up is controlled by the overflow policy.
+
+    Messages are decoded once by the source and handed to the sink as records.
+    Sinks with `raw_passthrough` set receive the source's frames untouched
+    instead, so nothing on the path decodes or re-encodes them.
+
+    Given several sinks, every message is teed to each of them through a queue and
+    writers of its own. The records are shared between the sinks, which must not
+    modify them. A full queue blocking the reader would hold up every sink, so with
+    more than one sink the default overflow policy is `spill`. Entries of the
+    `sinks` setting override the queue settings of the sink in the same position.
+
+    `transforms` filter and reshape the records before they are queued for a sink
+    (see `transforms`), so what a sink doesn't want is never queued or written.
+
+    With `dedup`, messages already received (e.g. again after a reconnect) are
+    dropped before they reach any sink, see `Deduplicator`. Checking needs the
+    decoded message, so raw sinks no longer save the pipeline from decoding.
+
+    Note that with more than one writer, batches may reach the sink out of order.
+    """
+
+    config_schema: ClassVar[dict] = {
+        "type": "object",
+        "properties": {
+            **_branch_properties,
+            "stats_interval_s": {"type": "number", "minimum": 0},
+            "dedup": {
+                "type": "object",
+                "properties": {
+                    "field": {"type": "string", "enum": ["trade_id", "sequence"]},
+                    "window": {"type": "integer", "minimum": 1},
+                },
+                "additionalProperties": False,
+            },
+            "sinks": {
+                "type": "array",
+                "items": {
+                    "type": ["object", "null"],
+                    "properties": _branch_properties,
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "additionalProperties": False,
+    }
+
+    # How often the reader yields to the event loop when receive and put never
+    # suspend, e.g. when the websocket already has frames buffered.
+    _yield_every = 100
+
+    # At debug level, received messages are logged at most this often per second
+    _debug_messages_per_s = 10
+
+    def __init__(
+        self,
+        source: Source,
+        sink: Sink | List[Sink],
+        config: Dict[str, Any] | None = None,
+        stats_callback: Callable[[dict], None] | None = None,
+    ):
+        """Initialize the pipeline.
+
+        Args:
+            source: A connected source
+            sink: A connected sink, or a list of them to write every message to
+            config: Pipeline configuration validated against the schema
+            stats_callback: Called with the stats every stats_interval_s
+        """
+        config = config or {}
+        jsonschema.validate(config, self.config_schema)
+        self.source = source
+        self.sinks = sink if isinstance(sink, list) else [sink]
+        self.stats_interval_s = config.get("stats_interval_s", 60)
+        self.stats_callback = stats_callback
+
+        shared = {key: config[key] for key in _branch_properties if key in config}
+        overrides = config.get("sinks", [])
+        overflow = "spill" if len(self.sinks) > 1 else "block"
+        self.branches = []
+        for i, branch_sink in enumerate(self.sinks):
+            branch_config = dict(shared)
+            if len(self.sinks) > 1 and "spill_path" in branch_config:
+                branch_config["spill_path"] += f".{i}"
+            if i < len(overrides) and overrides[i]:
+                branch_config.update(overrides[i])
+            self.branches.append(_Branch(branch_sink, i, branch_config, overflow))
+
+        dedup = config.get("dedup")
+        self.deduplicator: Deduplicator | None = None
+        if dedup is not None:
+            self.deduplicator = Deduplicator(
+                dedup.get("field", "trade_id"), dedup.get("window", 10000)
+            )
+
+        self.received = 0
+        # Unix time of the last message received, to alert on ingestion lag
+        self.last_received_at = 0.0
+        self.read_errors = 0
+        # Set when the pipeline stopped because the source ran out of messages
+        self.source_exhausted = False
+        self._reader: asyncio.Task | None = None
+
+    @property
+    def written(self) -> int:
+        """Return the number of messages written, summed over the sinks."""
+        return sum(branch.written for branch in self.branches)
+
+    def stats(self) -> dict:
+        """Return a snapshot of the pipeline statistics."""
+        stats = {"received": self.received, "written": self.written}
+        if self.deduplicator:
+            stats.update(self.deduplicator.stats())
+        if len(self.branches) == 1:
+            stats["filtered"] = self.branches[0].filtered
+            stats.update(self.branches[0].queue.stats())
+        else:
+            stats["sinks"] = [branch.stats() for branch in self.branches]
+        return stats
+
+    def metrics(self) -> List[Metric]:
+        """Return the pipeline's metrics, followed by the source's and the sinks'."""
+        labels = ("sink", "index")
+        metrics: List[Metric] = [
+            counter(
+                "ingest_messages_received_total",
+                "Messages received from the source",
+                (),
+                {(): self.received},
+            ),
+            gauge(
+                "ingest_last_received_timestamp_seconds",
+                "Unix time the last message was received",
+                (),
+                {(): self.last_received_at},
+            ),
+            counter(
+                "ingest_read_errors_total",
+                "Errors receiving from the source",
+                (),
+                {(): self.read_errors},
+            ),
+            counter(
+                "ingest_messages_written_total",
+                "Messages written to a sink",
+                labels,
+                {branch.labels: branch.written for branch in self.branches},
+            ),
+            counter(
+                "ingest_messages_filtered_total",
+                "Messages dropped by a sink's transforms",
+                labels,
+                {branch.labels: branch.filtered for branch in self.branches},
+            ),
+            counter(
+                "ingest_write_errors_total",
+                "Batches a sink failed to write",
+                labels,
+                {branch.labels: branch.write_errors for branch in self.branches},
+            ),
+            gauge(
+                "ingest_queue_depth",
+                "Messages queued for a sink",
+                labels,
+                {branch.labels: branch.queue.depth for branch in self.branches},
+            ),
+            counter(
+                "ingest_queue_dropped_total",
+                "Messages dropped from a sink's full queue",
+                labels,
+                {branch.labels: branch.queue.dropped for branch in self.branches},
+            ),
+            counter(
+                "ingest_queue_spilled_total",
+                "Messages spilled to disk from a sink's full queue",
+                labels,
+                {branch.labels: branch.queue.spilled for branch in self.branches},
+            ),
+        ]
+        for branch in self.branches:
+            metrics += [branch.batch_sizes, branch.write_seconds]
+        if self.deduplicator:
+            metrics.append(
+                counter(
+                    "ingest_duplicates_dropped_total",
+                    "Messages dropped as duplicates, by product",
+                    ("product_id",),
+                    {
+                        (str(product_id),): count
+                        for product_id, count in self.deduplicator.duplicates.items()
+                    },
+                )
+            )
+        metrics += self.source.metrics()
+        for sink in self.sinks:
+            metrics += sink.metrics()
+        return metrics
+
+    async def run(self) -> None:
+        """Run the pipeline until the source stops or a write fails.
+
+        While it runs, the pipeline's metrics are served by the metrics endpoint.
+        """
+        REGISTRY.add_collector(self.metrics)
+        self._reader = asyncio.create_task(self._read())
+        tasks = [self._reader]
+        tasks += [
+            asyncio.create_task(self._write(branch))
+            for branch in self.branches
+            for _ in range(branch.writers)
+        ]
+        stats_task = None
+        if self.stats_interval_s:
+            stats_task = asyncio.create_task(self._log_stats())
+        try:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if stats_task:
+                stats_task.cancel()
+            REGISTRY.remove_collector(self.metrics)
+            logger.info("Pipeline stopped", extra={"extra_fields": self.stats()})
+
+    def _stop(self) -> None:
+        """Stop reading and discard anything still queued."""
+        if self._reader:
+            self._reader.cancel()
+        for branch in self.branches:
+            branch.queue.close()
+            branch.queue.clear()
+
+    async def _receive_both(self) -> Tuple[str, Any]:
+        """Receive the next frame and decode it, for a mix of raw and decoding sinks."""
+        frame = await self.source.receive_raw()
+        return frame, self.source.decode(frame)
+
+    async def _read(self) -> None:
+        """Receive messages from the source and queue them for the writers."""
+        raw = [branch.raw for branch in self.branches]
+        dedup = self.deduplicator
+        decode = not all(raw) or dedup is not None
+        mixed = any(raw) and decode
+        if mixed:
+            receive = self._receive_both
+        elif decode:
+            receive = self.source.receive
+        else:
+            receive = self.source.receive_raw
+        # Checked once, so with debug off the loop does no logging work at all
+        debug = logger.isEnabledFor(logging.DEBUG)
+        debug_limit = RateLimiter(self._debug_messages_per_s)
+        try:
+            while True:
+                message = await receive()
+                self.received += 1
+                self.last_received_at = time.time()
+                if not self.received % self._yield_every:
+                    await asyncio.sleep(0)
+                if debug and debug_limit.allow():
+                    logger.debug("Received message %d: %s", self.received, message)
+                if dedup is not None and dedup.is_duplicate(
+                    message[1] if mixed else message
+                ):
+                    continue
+                for branch in self.branches:
+                    item = message
+                    if mixed:
+                        item = message[0] if branch.raw else message[1]
+                    if branch.transform:
+                        item = branch.transform(item)
+                        if item is None:
+                            branch.filtered += 1
+                            continue
+                    await branch.queue.put(item)
+        except KeyboardInterrupt:
+            logger.info("Received interrupt, shutting down...")
+        except asyncio.CancelledError:
+            pass
+        except EOFError:
+            logger.info("Source has no more messages, shutting down...")
+            self.source_exhausted = True
+        except Exception as e:
+            self.read_errors += 1
+            logger.error("Error processing message: %s", str(e))
+        finally:
+            # Let the writers drain whatever has been queued, then stop.
+            for branch in self.branches:
+                branch.queue.close()
+
+    async def _write(self, branch: _Branch) -> None:
+        """Write a branch's queued messages to its sink in batches."""
+        write = branch.sink.write_batch if branch.raw else branch.sink.write_records
+        while True:
+            batch = await branch.queue.get_batch(branch.batch_size)
+            if not batch:
+                return
+            branch._batch_sizes.observe(len(batch))
+            started = time.perf_counter()
+            try:
+                await write(batch)
+                branch._write_seconds.observe(time.perf_counter() - started)
+                branch.written += len(batch)
+            except KeyboardInterrupt:
+                logger.info("Received interrupt, shutting down...")
+                self._stop()
+                return
+            except Exception as e:
+                branch.write_errors += 1
+                logger.error("Error processing message: %s", str(e))
+                self._stop()
+                return
+
+    async def _log_stats(self) -> None:
+        """Periodically log the pipeline statistics."""
+        while True:
+            await asyncio.sleep(self.stats_interval_s)
+            stats = self.stats()
+            logger.info("Pipeline stats", extra={"extra_fields": stats})
+            if self.stats_callback:
+                self.stats_callback(stats)
+            source_stats = self.source.stats()
+            if source_stats:
+                logger.info("Source stats", extra={"extra_fields": source_stats})
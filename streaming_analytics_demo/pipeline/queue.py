@@ -0,0 +1,177 @@
+"""Bounded queue between the source reader and the sink writers."""
+
+import asyncio
+from collections import deque
+import json
+import logging
+import tempfile
+from typing import Any, List
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+
+class _SpillFile:
+    """FIFO of JSON-serializable items stored one per line in a file."""
+
+    def __init__(self, path: str | None = None):
+        """Open the spill file, using an anonymous temporary file if no path is given."""
+        if path:
+            self._file = open(path, "w+b")
+        else:
+            self._file = tempfile.TemporaryFile()
+        self._read_offset = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        """Return the number of spilled items not yet read back."""
+        return self._count
+
+    def append(self, item: Any) -> None:
+        """Append an item to the end of the file."""
+        self._file.seek(0, 2)
+        self._file.write(json.dumps(item).encode() + b"\n")
+        self._count += 1
+
+    def popleft(self) -> Any:
+        """Read back the oldest spilled item."""
+        self._file.seek(self._read_offset)
+        line = self._file.readline()
+        self._read_offset = self._file.tell()
+        self._count -= 1
+        if not self._count:
+            # Everything has been read back, reclaim the disk space.
+            self._file.seek(0)
+            self._file.truncate()
+            self._read_offset = 0
+        return json.loads(line)
+
+    def clear(self) -> None:
+        """Discard all spilled items."""
+        self._file.seek(0)
+        self._file.truncate()
+        self._read_offset = 0
+        self._count = 0
+
+    def close(self) -> None:
+        """Close the underlying file."""
+        self._file.close()
+
+
+class BoundedQueue:
+    """An asyncio queue with a bounded size and a configurable overflow policy.
+
+    When the queue is full, `put` either waits for space (`block`), discards the
+    oldest queued item (`drop_oldest`) or appends the item to a file on disk
+    (`spill`). Spilled items are read back in order once the in-memory queue has
+    drained, so ordering is preserved under every policy.
+
+    The queue can be closed, after which getters drain what is left and then
+    receive an empty batch.
+    """
+
+    def __init__(
+        self, maxsize: int, overflow: str = "block", spill_path: str | None = None
+    ):
+        """Initialize the queue.
+
+        Args:
+            maxsize: Maximum number of items held in memory
+            overflow: One of "block", "drop_oldest" or "spill"
+            spill_path: File to spill to, defaults to an anonymous temporary file
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self._items: deque = deque()
+        self._spill = _SpillFile(spill_path) if overflow == "spill" else None
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._closed = False
+
+        self.high_water = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    @property
+    def depth(self) -> int:
+        """Return the number of queued items, including any spilled to disk."""
+        if self._spill is None:
+            return len(self._items)
+        return len(self._items) + len(self._spill)
+
+    @property
+    def closed(self) -> bool:
+        """Return True once the queue has been closed."""
+        return self._closed
+
+    async def put(self, item: Any) -> None:
+        """Add an item to the queue, applying the overflow policy if it is full."""
+        if self._spill is not None and (
+            len(self._spill) or len(self._items) >= self.maxsize
+        ):
+            # Once we've started spilling everything goes to disk until the spill
+            # has been read back, otherwise newer items would overtake older ones.
+            self._spill.append(item)
+            self.spilled += 1
+        else:
+            while len(self._items) >= self.maxsize:
+                if self.overflow == "drop_oldest":
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    self._writable.clear()
+                    await self._writable.wait()
+            self._items.append(item)
+
+        depth = self.depth
+        if depth > self.high_water:
+            self.high_water = depth
+        self._readable.set()
+
+    async def get_batch(self, max_items: int) -> List[Any]:
+        """Wait for items and return up to max_items of them, oldest first.
+
+        Returns:
+            List[Any]: The items, or an empty list once the queue is closed and drained
+        """
+        while not self.depth:
+            if self._closed:
+                return []
+            self._readable.clear()
+            await self._readable.wait()
+
+        batch = []
+        items = self._items
+        while items and len(batch) < max_items:
+            batch.append(items.popleft())
+        spill = self._spill
+        while spill is not None and spill and not items and len(batch) < max_items:
+            batch.append(spill.popleft())
+
+        self._writable.set()
+        return batch
+
+    def close(self) -> None:
+        """Close the queue. Getters drain any remaining items and then stop."""
+        self._closed = True
+        self._readable.set()
+        self._writable.set()
+
+    def clear(self) -> None:
+        """Discard everything in the queue."""
+        self._items.clear()
+        if self._spill is not None:
+            self._spill.clear()
+        self._writable.set()
+
+    def stats(self) -> dict:
+        """Return a snapshot of the queue statistics."""
+        return {
+            "queue_depth": self.depth,
+            "queue_high_water": self.high_water,
+            "queue_dropped": self.dropped,
+            "queue_spilled": self.spilled,
+        }
@@ -0,0 +1,160 @@
+"""Declarative filters and transforms applied to records before they are queued.
+
+A chain is a list of steps, each an object with a single key:
+
+    - filter: {type: [ticker]}          # keep records with one of these values
+    - drop: {product_id: [USDT-USD]}    # drop records with one of these values
+    - derive: [spread, mid]             # add computed fields
+    - rename: {last_size: size}         # rename fields
+    - project: [time, product_id, price, size, spread, mid]  # keep only these
+
+A filter or drop with several fields matches a record only if every field has
+one of its values, e.g. `drop: {product_id: [BTC-USD], type: [heartbeat]}`
+drops only BTC-USD heartbeats.
+
+A chain is compiled once into a single function taking a record and returning
+the transformed record, or None if it was filtered out. Records are shared
+between sinks, so steps that change a record return a new one.
+"""
+
+from typing import Any, Callable, Dict, List
+
+Record = Dict[str, Any]
+Transform = Callable[[Record], Record | None]
+
+
+def _spread(record: Record) -> float:
+    """Return the difference between the best ask and bid."""
+    return float(record["best_ask"]) - float(record["best_bid"])
+
+
+def _mid(record: Record) -> float:
+    """Return the price half way between the best ask and bid."""
+    return (float(record["best_ask"]) + float(record["best_bid"])) / 2
+
+
+def _notional(record: Record) -> float:
+    """Return the value of the last trade."""
+    return float(record["price"]) * float(record["last_size"])
+
+
+# The fields derive can add. Records without the fields they need are left as
+# they are, e.g. heartbeats have no best bid or ask.
+DERIVED_FIELDS: Dict[str, Callable[[Record], Any]] = {
+    "spread": _spread,
+    "mid": _mid,
+    "notional": _notional,
+}
+
+_field_values = {
+    "type": "object",
+    "minProperties": 1,
+    "additionalProperties": {"type": "array", "items": {}, "minItems": 1},
+}
+
+# The schema of a chain, used in the pipeline's config schema
+TRANSFORMS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "minProperties": 1,
+        "maxProperties": 1,
+        "properties": {
+            "filter": _field_values,
+            "drop": _field_values,
+            "derive": {
+                "type": "array",
+                "minItems": 1,
+                "items": {"type": "string", "enum": list(DERIVED_FIELDS)},
+            },
+            "rename": {
+                "type": "object",
+                "minProperties": 1,
+                "additionalProperties": {"type": "string"},
+            },
+            "project": {
+                "type": "array",
+                "minItems": 1,
+                "items": {"type": "string"},
+            },
+        },
+        "additionalProperties": False,
+    },
+}
+
+
+def _compile_match(fields: Dict[str, List[Any]], keep: bool) -> Transform:
+    """Compile a filter (keep=True) or drop (keep=False) step."""
+    conditions = [(field, frozenset(values)) for field, values in fields.items()]
+    if len(conditions) == 1:
+        ((field, values),) = conditions
+        if keep:
+            return lambda record: record if record.get(field) in values else None
+        return lambda record: None if record.get(field) in values else record
+
+    def match(record: Record) -> Record | None:
+        matches = all(record.get(field) in values for field, values in conditions)
+        return record if matches == keep else None
+
+    return match
+
+
+def _compile_derive(names: List[str]) -> Transform:
+    """Compile a step adding derived fields."""
+    derivations = [(name, DERIVED_FIELDS[name]) for name in names]
+
+    def derive(record: Record) -> Record:
+        derived = None
+        for name, compute in derivations:
+            try:
+                value = compute(record)
+            except (KeyError, TypeError, ValueError):
+                continue
+            if derived is None:
+                derived = dict(record)
+            derived[name] = value
+        return record if derived is None else derived
+
+    return derive
+
+
+def _compile_rename(names: Dict[str, str]) -> Transform:
+    """Compile a step renaming fields."""
+    return lambda record: {names.get(key, key): value for key, value in record.items()}
+
+
+def _compile_project(fields: List[str]) -> Transform:
+    """Compile a step keeping only the given fields, in the given order."""
+    return lambda record: {field: record[field] for field in fields if field in record}
+
+
+def _compile_step(step: Dict[str, Any]) -> Transform:
+    """Compile a single step of a chain."""
+    ((kind, spec),) = step.items()
+    if kind == "filter":
+        return _compile_match(spec, keep=True)
+    if kind == "drop":
+        return _compile_match(spec, keep=False)
+    if kind == "derive":
+        return _compile_derive(spec)
+    if kind == "rename":
+        return _compile_rename(spec)
+    if kind == "project":
+        return _compile_project(spec)
+    raise ValueError(f"Unknown transform: {kind}")
+
+
+def compile_transforms(steps: List[Dict[str, Any]]) -> Transform:
+    """Compile a chain of steps, validated against TRANSFORMS_SCHEMA, into one function."""
+    transforms = [_compile_step(step) for step in steps]
+    if len(transforms) == 1:
+        return transforms[0]
+
+    def apply(record: Record) -> Record | None:
+        for transform in transforms:
+            record = transform(record)
+            if record is None:
+                return None
+        return record
+
+    return apply
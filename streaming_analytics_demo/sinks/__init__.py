@@ -1,7 +1,17 @@
 """Sinks for the streaming analytics demo."""
 
+from .aggregating_sink import AggregatingSink
 from .file_sink import FileSink
 from .clickhouse_sink import ClickHouseConnectSink
+from .clickhouse_native_sink import ClickHouseNativeSink
 from .sink import Sink, get_sink, register_sink
 
-__all__ = ["FileSink", "Sink", "get_sink", "register_sink", "ClickHouseConnectSink"]
+__all__ = [
+    "AggregatingSink",
+    "FileSink",
+    "Sink",
+    "get_sink",
+    "register_sink",
+    "ClickHouseConnectSink",
+    "ClickHouseNativeSink",
+]
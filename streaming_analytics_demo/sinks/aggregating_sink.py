@@ -0,0 +1,215 @@
+"""Sink aggregating trades into per-product time windows before writing them."""
+
+import json
+import logging
+from typing import Any, Dict, List, Tuple
+
+from streaming_analytics_demo.metrics import Metric, counter, gauge
+from streaming_analytics_demo.util.timestamps import to_epoch_micros
+
+from .sink import Sink, get_sink, get_sink_class, register_sink
+
+logger = logging.getLogger(__name__)
+
+# The message types that report a trade, and the field holding its size
+_SIZE_FIELDS = {"ticker": "last_size", "match": "size", "last_match": "size"}
+
+
+class _Window:
+    """The running aggregates of one product's trades in one window."""
+
+    __slots__ = (
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "notional",
+        "trades",
+        "_open_time",
+        "_close_time",
+    )
+
+    def __init__(self, price: float, time: int):
+        """Start a window with no trades, at the price of its first."""
+        self.open = self.high = self.low = self.close = price
+        self.volume = 0.0
+        self.notional = 0.0
+        self.trades = 0
+        self._open_time = self._close_time = time
+
+    def add(self, price: float, size: float, time: int) -> None:
+        """Add a trade, which may be older than ones already added."""
+        if time < self._open_time:
+            self.open, self._open_time = price, time
+        if time >= self._close_time:
+            self.close, self._close_time = price, time
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.volume += size
+        self.notional += size * price
+        self.trades += 1
+
+
+@register_sink("aggregate")
+class AggregatingSink(Sink):
+    """Sink that writes per-product tumbling window aggregates to another sink.
+
+    Trades (`ticker`, `match` and `last_match` messages) are grouped by product
+    and by `window_s` windows of their event time. Each window is written to the
+    wrapped `sink` as a single row holding `product_id`, `window_start`, the
+    `open`, `high`, `low` and `close` prices, the `volume` (sum of sizes), the
+    `notional` (sum of size * price) and the number of `trades`. The window's
+    VWAP is `notional / volume`, summed over rows if there are several.
+    Other messages are ignored.
+
+    Windows close on a watermark trailing the latest event time seen by
+    `allowed_lateness_s`: a window is written once the watermark passes its end.
+    A trade arriving after its window was written is dropped and counted. On
+    disconnect, every open window is written as it stands, so a restart in the
+    middle of a window leaves two rows for it.
+
+    Subscribe to `ticker` or `matches`, not both, as each reports every trade.
+    """
+
+    config_schema = {
+        "type": "object",
+        "required": ["type", "sink"],
+        "properties": {
+            "type": {"type": "string", "enum": ["aggregate"]},
+            "window_s": {"type": "integer", "minimum": 1},
+            "allowed_lateness_s": {"type": "number", "minimum": 0},
+            # The sink the windows are written to, with its own settings
+            "sink": {
+                "type": "object",
+                "required": ["type"],
+                "properties": {"type": {"type": "string"}},
+            },
+        },
+        "additionalProperties": False,
+    }
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize the aggregating sink and the sink it writes to."""
+        super().__init__(config)
+        self.sink = get_sink(config["sink"])
+        self.window_us = config.get("window_s", 60) * 1_000_000
+        self.allowed_lateness_us = int(config.get("allowed_lateness_s", 5) * 1e6)
+
+        self._windows: Dict[Tuple[str, int], _Window] = {}
+        self._max_time: int | None = None
+        # Windows ending at or before this have been written
+        self._closed_before: int | None = None
+        self.late_trades = 0
+        self.windows_written = 0
+
+    @classmethod
+    def worker_config(cls, config: Dict[str, Any], worker: int) -> Dict[str, Any]:
+        """Adapt the wrapped sink's config for the worker."""
+        sink = config["sink"]
+        return {**config, "sink": get_sink_class(sink).worker_config(sink, worker)}
+
+    async def connect(self) -> None:
+        """Connect the wrapped sink."""
+        await self.sink.connect()
+
+    async def write(self, message: str) -> None:
+        """Aggregate a single JSON message."""
+        await self.write_records([json.loads(message)])
+
+    async def write_records(self, records: List[Dict[str, Any]]) -> None:
+        """Add the trades among the records to their windows, writing any that closed."""
+        window_us = self.window_us
+        windows = self._windows
+        closed_before = self._closed_before
+        max_time = self._max_time
+        for record in records:
+            size_field = _SIZE_FIELDS.get(record.get("type"))
+            if size_field is None:
+                continue
+            time = to_epoch_micros(record["time"])
+            start = time - time % window_us
+            if closed_before is not None and start + window_us <= closed_before:
+                self.late_trades += 1
+                continue
+            price = float(record["price"])
+            key = (record["product_id"], start)
+            window = windows.get(key)
+            if window is None:
+                window = windows[key] = _Window(price, time)
+            window.add(price, float(record[size_field]), time)
+            if max_time is None or time > max_time:
+                max_time = time
+        self._max_time = max_time
+
+        if max_time is not None:
+            watermark = max_time - self.allowed_lateness_us
+            if closed_before is None or watermark > closed_before:
+                self._closed_before = watermark
+                await self._write_windows(watermark)
+
+    async def _write_windows(self, before: int | None = None) -> None:
+        """Write the windows ending at or before `before`, or all of them."""
+        keys = sorted(
+            key
+            for key in self._windows
+            if before is None or key[1] + self.window_us <= before
+        )
+        if not keys:
+            return
+        rows = []
+        for key in keys:
+            window = self._windows.pop(key)
+            rows.append(
+                {
+                    "product_id": key[0],
+                    "window_start": key[1],
+                    "open": window.open,
+                    "high": window.high,
+                    "low": window.low,
+                    "close": window.close,
+                    "volume": window.volume,
+                    "notional": window.notional,
+                    "trades": window.trades,
+                }
+            )
+        await self.sink.write_records(rows)
+        self.windows_written += len(rows)
+
+    async def flush(self) -> None:
+        """Flush the wrapped sink, open windows stay open."""
+        await self.sink.flush()
+
+    def metrics(self) -> List[Metric]:
+        """Return the window counts, followed by the wrapped sink's metrics."""
+        return [
+            counter(
+                "ingest_aggregate_windows_written_total",
+                "Windows written by an aggregating sink",
+                (),
+                {(): self.windows_written},
+            ),
+            counter(
+                "ingest_aggregate_late_trades_total",
+                "Trades dropped because their window had already been written",
+                (),
+                {(): self.late_trades},
+            ),
+            gauge(
+                "ingest_aggregate_open_windows",
+                "Windows an aggregating sink has yet to write",
+                (),
+                {(): len(self._windows)},
+            ),
+        ] + self.sink.metrics()
+
+    async def disconnect(self) -> None:
+        """Write every open window, then disconnect the wrapped sink."""
+        try:
+            await self._write_windows()
+        except Exception as e:
+            logger.error("Failed to write open windows: %s", str(e))
+        finally:
+            await self.sink.disconnect()
@@ -1,40 +1,53 @@
 """ClickHouse sink implementation."""
 
-from datetime import datetime
+from array import array
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
-from typing import Any, Dict, List
+import os
+import time
+from typing import Any, Deque, Dict, List, Sequence, Tuple
 
 import clickhouse_connect
 from clickhouse_connect.driver.client import Client
+from clickhouse_connect.driver.insert import InsertContext
 
+from streaming_analytics_demo.metrics import Histogram, Metric, counter, gauge
+
+from .columnar import TIME_COLUMNS, ColumnarBatch
 from .sink import Sink, register_sink
+from .spool import Position, SegmentSpool
 
 logger = logging.getLogger(__name__)
 
-_message_field_types = {
-    "sequence": int,
-    "trade_id": int,
-    "price": float,
-    "last_size": float,
-    "time": datetime.fromisoformat,
-    "product_id": str,
-    "side": str,
-    "open_24h": float,
-    "volume_24h": float,
-    "low_24h": float,
-    "high_24h": float,
-    "volume_30d": float,
-    "best_bid": float,
-    "best_bid_size": float,
-    "best_ask": float,
-    "best_ask_size": float,
-}
-
 
 @register_sink("clickhouse_connect")
 class ClickHouseConnectSink(Sink):
-    """Sink that writes messages to ClickHouse."""
+    """Sink that writes messages to ClickHouse.
+
+    By default every message is inserted as soon as it is written. Setting any of
+    `max_rows`, `max_bytes` or `max_latency_ms` switches the sink into batching
+    mode: rows are buffered and inserted together when the first of the limits is
+    reached, so ClickHouse sees one insert (and one new part) per batch rather
+    than per message.
+
+    Inserts run on a dedicated thread pool so the event loop keeps reading from
+    the source while ClickHouse works. Up to `max_in_flight` batches may be
+    inserting at once; they are acknowledged strictly in the order they were
+    submitted, and a failed insert is raised from the next write or flush.
+
+    With a `spool` configured, every record is appended to a segment log on disk
+    before it is buffered, and acknowledged in the log once its insert succeeds. A
+    failed insert is no longer raised. Instead the sink stops inserting live
+    batches and replays the log from the last acknowledged record, in bulk inserts
+    of up to `replay_rows`, retrying with backoff until ClickHouse is back and the
+    replay has caught up. Whatever is left in the log when the sink stops is
+    replayed when it next connects. Inserts that were in flight alongside a failed
+    one are replayed too, so delivery is at least once. A record in the log that
+    can't be decoded is skipped and set aside rather than retried.
+    """
 
     config_schema = {
         "type": "object",
@@ -48,6 +61,24 @@ class ClickHouseConnectSink(Sink):
             "user": {"type": "string"},
             "password": {"type": "string"},
             "settings": {"type": "object", "additionalProperties": True},
+            "max_rows": {"type": "integer", "minimum": 1},
+            "max_bytes": {"type": "integer", "minimum": 1},
+            "max_latency_ms": {"type": "integer", "minimum": 1},
+            "max_in_flight": {"type": "integer", "minimum": 1},
+            "spool": {
+                "type": "object",
+                "required": ["path"],
+                "properties": {
+                    "path": {"type": "string"},
+                    "segment_bytes": {"type": "integer", "minimum": 1},
+                    "max_bytes": {"type": "integer", "minimum": 1},
+                    "fsync": {"type": "string", "enum": ["roll", "append"]},
+                    "replay_rows": {"type": "integer", "minimum": 1},
+                    "retry_backoff_ms": {"type": "integer", "minimum": 1},
+                    "max_backoff_ms": {"type": "integer", "minimum": 1},
+                },
+                "additionalProperties": False,
+            },
         },
         "additionalProperties": False,
     }
@@ -59,30 +90,326 @@ class ClickHouseConnectSink(Sink):
         self.database = config["database"]
         self.table = config["table"]
 
+        # Batching limits. Without any of them we insert one message at a time,
+        # with any of them a batch has no row limit unless max_rows is set.
+        self.max_rows = config.get("max_rows")
+        self.max_bytes = config.get("max_bytes")
+        self.max_latency_ms = config.get("max_latency_ms")
+        if not (self.max_rows or self.max_bytes or self.max_latency_ms):
+            self.max_rows = 1
+
+        self.max_in_flight = config.get("max_in_flight", 1)
+        self.rows_written = 0
+        self.insert_errors = 0
+        self._insert_seconds = Histogram(
+            "ingest_clickhouse_insert_seconds",
+            "Time taken by an insert into ClickHouse",
+            ("table",),
+        )
+        self._insert_timer = self._insert_seconds.labels(
+            f"{self.database}.{self.table}"
+        )
+
+        self._batch: ColumnarBatch | None = None
+        self._idle_contexts: Dict[Tuple[str, ...], List[InsertContext]] = {}
+        self._first_row_at: float | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._in_flight: Deque[
+            Tuple[ColumnarBatch, asyncio.Future, Position | None]
+        ] = deque()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self._flush_error: Exception | None = None
+
+        spool = config.get("spool")
+        self._spool: SegmentSpool | None = None
+        if spool:
+            self._spool = SegmentSpool(
+                spool["path"],
+                segment_bytes=spool.get("segment_bytes", 64 << 20),
+                max_bytes=spool.get("max_bytes", 1 << 30),
+                fsync=spool.get("fsync", "roll"),
+            )
+            self.replay_rows = spool.get("replay_rows", 100000)
+            self.retry_backoff_ms = spool.get("retry_backoff_ms", 1000)
+            self.max_backoff_ms = spool.get("max_backoff_ms", 30000)
+        # Spool position just after the last record in the pending batch
+        self._batch_end: Position | None = None
+        self._replaying = False
+        self._replay_task: asyncio.Task | None = None
+        # Set while disconnecting, when a failed insert is left for the next run
+        self._closing = False
+        self._spool_space = asyncio.Event()
+
+    @classmethod
+    def worker_config(cls, config: Dict[str, Any], worker: int) -> Dict[str, Any]:
+        """Give each worker a spool directory of its own."""
+        if "spool" not in config:
+            return config
+        spool = config["spool"]
+        return {
+            **config,
+            "spool": {**spool, "path": os.path.join(spool["path"], f"w{worker}")},
+        }
+
+    def _create_client(self) -> Any:
+        """Create the client the inserts go through."""
+        client_args = {}
+        if self.max_in_flight > 1:
+            # Concurrent requests can't share a session, ClickHouse locks it.
+            client_args["autogenerate_session_id"] = False
+        return clickhouse_connect.get_client(
+            host=self.config["host"],
+            port=self.config["port"],
+            database=self.config["database"],
+            username=self.config["user"],
+            password=self.config.get("password"),
+            settings=self.config.get("settings", {}),
+            **client_args,
+        )
+
+    def _close_client(self) -> None:
+        """Close the client once every insert has finished."""
+        self.client.close()
+
     async def connect(self) -> None:
         """Connect to ClickHouse."""
         try:
-            self.client = clickhouse_connect.get_client(
-                host=self.config["host"],
-                port=self.config["port"],
-                database=self.config["database"],
-                username=self.config["user"],
-                password=self.config.get("password"),
-                settings=self.config.get("settings", {}),
-            )
+            self.client = self._create_client()
             logger.info(
-                f"Connected to ClickHouse at {self.config['host']}:{self.config['port']}"
+                "Connected to ClickHouse at %s:%s",
+                self.config["host"],
+                self.config["port"],
             )
         except Exception as e:
-            logger.error(f"Failed to connect to ClickHouse: {e}")
+            logger.error("Failed to connect to ClickHouse: %s", str(e))
             raise e
 
-    def _convert_types(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Convert the data to the correct types for ClickHouse."""
-        for key, value in data.items():
-            if key in _message_field_types:
-                data[key] = _message_field_types[key](value)
-        return data
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="clickhouse-insert"
+        )
+        self._closing = False
+        if self.max_latency_ms:
+            self._flush_task = asyncio.create_task(self._flush_on_latency())
+        if self._spool:
+            self._spool.open()
+            if self._spool.pending:
+                self._start_replay()
+
+    def _check_writable(self) -> None:
+        """Raise if we can't accept writes, including failures from the background flush."""
+        if not self.client:
+            raise RuntimeError("Not connected to ClickHouse")
+        if self._flush_error:
+            error, self._flush_error = self._flush_error, None
+            raise error
+
+    async def _start_batch(self, record: Dict[str, Any]) -> None:
+        """Submit the pending batch and start a new one with the given record."""
+        await self._submit_pending()
+        self._batch = ColumnarBatch(record)
+        self._batch.append(record)
+        self._first_row_at = time.monotonic()
+
+    def _batch_full(self) -> bool:
+        """Check whether any of the configured limits has been reached."""
+        batch = self._batch
+        if batch is None:
+            return False
+        if self.max_rows and len(batch) >= self.max_rows:
+            return True
+        if self.max_bytes and batch.nbytes >= self.max_bytes:
+            return True
+        if (
+            self.max_latency_ms
+            and (time.monotonic() - self._first_row_at) * 1000 >= self.max_latency_ms
+        ):
+            return True
+        return False
+
+    def _checkout_context(self, column_names: Tuple[str, ...]) -> InsertContext:
+        """Get an idle column-oriented insert context for the given columns.
+
+        Creating a context looks up the table's column types, so contexts are kept
+        and reused. Each in-flight insert needs its own, as the context holds the data.
+        """
+        try:
+            return self._idle_contexts.setdefault(column_names, []).pop()
+        except IndexError:
+            return self.client.create_insert_context(
+                table=self.table, column_names=list(column_names), column_oriented=True
+            )
+
+    @staticmethod
+    def _scale_times(micros: array, column_type: Any) -> Sequence[int]:
+        """Convert epoch microseconds to the tick size of a DateTime/DateTime64 column."""
+        # DateTime64 types carry their precision (10**scale), DateTime is seconds.
+        precision = getattr(column_type, "prec", 1)
+        if precision == 1_000_000:
+            return micros
+        if precision > 1_000_000:
+            factor = precision // 1_000_000
+            return array("q", (value * factor for value in micros))
+        divisor = 1_000_000 // precision
+        return array("q", (value // divisor for value in micros))
+
+    def _insert_batch(self, batch: ColumnarBatch) -> int:
+        """Build the batch's columns and insert them. Runs on the insert executor."""
+        context = self._checkout_context(batch.names)
+        try:
+            columns = batch.columns()
+            for i, name in enumerate(batch.names):
+                if name in TIME_COLUMNS:
+                    columns[i] = self._scale_times(columns[i], context.column_types[i])
+
+            # Insert the data
+            context.data = columns
+            self.client.insert(context=context)
+        finally:
+            context.data = None
+            self._idle_contexts[batch.names].append(context)
+        return len(batch)
+
+    async def _submit_pending(self) -> None:
+        """Hand the pending batch to the insert executor.
+
+        Waits for the oldest in-flight insert first if max_in_flight are running.
+        """
+        if self._batch is None or not len(self._batch):
+            return
+        while len(self._in_flight) >= self.max_in_flight:
+            await self._acknowledge_oldest()
+
+        batch = self._batch
+        self._batch = None
+        self._first_row_at = None
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._insert_batch, batch
+        )
+        started = time.perf_counter()
+        future.add_done_callback(lambda f: self._insert_done(f, started))
+        self._in_flight.append((batch, future, self._batch_end))
+
+    def _insert_done(self, future: asyncio.Future, started: float) -> None:
+        """Record how long an insert took, or that it failed. Runs on the event loop."""
+        if future.cancelled():
+            return
+        if future.exception() is None:
+            self._insert_timer.observe(time.perf_counter() - started)
+        else:
+            self.insert_errors += 1
+
+    async def _acknowledge_oldest(self) -> None:
+        """Wait for the oldest in-flight insert, raising if it failed.
+
+        With a spool, a failure switches to replaying the spool instead.
+        """
+        batch, future, position = self._in_flight[0]
+        try:
+            rows = await future
+        except Exception as e:
+            if self._spool is None:
+                self._in_flight.popleft()
+                raise e
+            logger.warning("Insert into ClickHouse failed, replaying spool: %s", str(e))
+            # The replay repeats everything after the last acknowledged record,
+            # so the other inserts in flight no longer count.
+            self._in_flight.clear()
+            self._batch = None
+            self._first_row_at = None
+            self._start_replay()
+            return
+        except BaseException:
+            self._in_flight.popleft()
+            raise
+        self._in_flight.popleft()
+        self.rows_written += rows
+        if position:
+            self._spool.ack(position)
+            self._spool_space.set()
+        logger.debug(
+            "Successfully wrote %d records to %s.%s", rows, self.database, self.table
+        )
+
+    async def _wait_for_inserts(self) -> None:
+        """Wait for every in-flight insert to be acknowledged."""
+        while self._in_flight:
+            await self._acknowledge_oldest()
+
+    def _insert_records(self, records: List[Dict[str, Any]]) -> int:
+        """Insert records in as few batches as their shapes allow. Runs on the insert executor."""
+        batch = None
+        rows = 0
+        for record in records:
+            if batch is None or not batch.append(record):
+                if batch is not None:
+                    rows += self._insert_batch(batch)
+                batch = ColumnarBatch(record)
+                batch.append(record)
+        if batch is not None:
+            rows += self._insert_batch(batch)
+        return rows
+
+    def _replay_chunk(self) -> Tuple[int, Position | None]:
+        """Read the next records from the spool and insert them. Runs on the insert executor."""
+        records, position = self._spool.read(self.replay_rows)
+        return self._insert_records(records), position
+
+    def _start_replay(self) -> None:
+        """Start replaying the spool, unless a replay is already running or we're closing."""
+        self._replaying = True
+        if self._closing:
+            # The records stay in the spool and are replayed on the next connect
+            return
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = asyncio.create_task(self._replay())
+
+    async def _replay(self) -> None:
+        """Insert the spool's unacknowledged records in bulk until it has caught up."""
+        loop = asyncio.get_running_loop()
+        backoff_ms = self.retry_backoff_ms
+        while True:
+            started = time.perf_counter()
+            try:
+                rows, position = await loop.run_in_executor(
+                    self._executor, self._replay_chunk
+                )
+            except Exception as e:
+                self.insert_errors += 1
+                logger.warning(
+                    "Replaying spool failed, retrying in %d ms: %s", backoff_ms, str(e)
+                )
+                await asyncio.sleep(backoff_ms / 1000)
+                backoff_ms = min(backoff_ms * 2, self.max_backoff_ms)
+                continue
+            if position is None:
+                if self._spool.pending:
+                    # Nothing to read though records are pending, e.g. appended
+                    # just after the read began. Back off rather than spin.
+                    await asyncio.sleep(backoff_ms / 1000)
+                    backoff_ms = min(backoff_ms * 2, self.max_backoff_ms)
+                    continue
+                self._replaying = False
+                logger.info("Spool replay has caught up")
+                return
+            self._insert_timer.observe(time.perf_counter() - started)
+            backoff_ms = self.retry_backoff_ms
+            self.rows_written += rows
+            self._spool.ack(position)
+            self._spool_space.set()
+            logger.info("Replayed %d records from the spool", rows)
+
+    async def _append_to_spool(self, records: List[Dict[str, Any]]) -> List[Position]:
+        """Append records to the spool once it has room for them."""
+        while self._spool.full:
+            if self._replaying:
+                self._spool_space.clear()
+                await self._spool_space.wait()
+            else:
+                # Everything unacknowledged is buffered or in flight
+                await self._submit_pending()
+                await self._wait_for_inserts()
+        return self._spool.append(records)
 
     async def write(self, message: str) -> None:
         """Write a message to ClickHouse.
@@ -90,42 +417,147 @@ class ClickHouseConnectSink(Sink):
         Args:
             message: JSON string containing the data to write
         """
-        if not self.client:
-            raise RuntimeError("Not connected to ClickHouse")
+        await self.write_batch([message])
 
+    async def write_batch(self, messages: List[str]) -> None:
+        """Write a batch of JSON messages to ClickHouse.
+
+        Args:
+            messages: JSON strings containing the data to write
+        """
+        self._check_writable()
         try:
-            # Parse the JSON message
-            data = json.loads(message)
-            data.pop("type")  # Remove the type key,
+            records = [json.loads(message) for message in messages]
+        except Exception as e:
+            logger.error("Failed to write to ClickHouse: %s", str(e))
+            raise e
+        await self.write_records(records)
 
-            data = self._convert_types(data)
-            # Convert to list of values if it's a single record
-            if not isinstance(data, list):
-                data = [data]
+    async def write_records(self, records: List[Dict[str, Any]]) -> None:
+        """Write a batch of decoded messages to ClickHouse.
 
-            # Extract column names from the first record
-            columns = list(data[0].keys())
+        Records are buffered and inserted whenever one of the batch limits is
+        reached.
 
-            # Extract values maintaining column order
-            values = [[record[col] for col in columns] for record in data]
+        Args:
+            records: The decoded messages to write
+        """
+        self._check_writable()
 
-            # Insert the data
-            self.client.insert(table=self.table, data=values, column_names=columns)
+        try:
+            async with self._flush_lock:
+                positions = None
+                if self._spool:
+                    positions = await self._append_to_spool(records)
+                    if self._replaying:
+                        # The replay picks the records up from the spool
+                        return
 
-            logger.debug(
-                f"Successfully wrote {len(data)} records to {self.database}.{self.table}"
-            )
+                for i, record in enumerate(records):
+                    if self._batch is None or not self._batch.append(record):
+                        # Rows in one insert must share their columns, so a change
+                        # in message shape starts a new batch.
+                        await self._start_batch(record)
+                    if positions:
+                        self._batch_end = positions[i]
+                    if self._batch_full():
+                        await self._submit_pending()
+                    if self._replaying:
+                        # An insert failed and the replay takes over from the spool
+                        self._batch = None
+                        return
+
+                # Surface finished inserts, and any failures, as early as we can
+                while self._in_flight and self._in_flight[0][1].done():
+                    await self._acknowledge_oldest()
         except Exception as e:
-            logger.error(f"Failed to write to ClickHouse: {e}")
+            logger.error("Failed to write to ClickHouse: %s", str(e))
             raise e
 
+    async def flush(self) -> None:
+        """Insert any buffered rows and wait for all inserts to complete."""
+        async with self._flush_lock:
+            await self._submit_pending()
+            await self._wait_for_inserts()
+
+    async def _flush_on_latency(self) -> None:
+        """Flush batches that have been waiting longer than max_latency_ms."""
+        max_latency = self.max_latency_ms / 1000
+        while True:
+            if self._batch is None:
+                delay = max_latency
+            else:
+                delay = self._first_row_at + max_latency - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                async with self._flush_lock:
+                    await self._submit_pending()
+            except Exception as e:
+                logger.error("Failed to flush batch to ClickHouse: %s", str(e))
+                self._flush_error = e
+
+    def metrics(self) -> List[Metric]:
+        """Return the rows written, insert latency and errors, and the spool's backlog."""
+        labels = ("table",)
+        key = (f"{self.database}.{self.table}",)
+        metrics: List[Metric] = [
+            counter(
+                "ingest_clickhouse_rows_written_total",
+                "Rows inserted into ClickHouse",
+                labels,
+                {key: self.rows_written},
+            ),
+            counter(
+                "ingest_clickhouse_insert_errors_total",
+                "Failed inserts into ClickHouse",
+                labels,
+                {key: self.insert_errors},
+            ),
+            gauge(
+                "ingest_clickhouse_inserts_in_flight",
+                "Inserts into ClickHouse not yet acknowledged",
+                labels,
+                {key: len(self._in_flight)},
+            ),
+            self._insert_seconds,
+        ]
+        if self._spool is not None:
+            metrics.append(
+                gauge(
+                    "ingest_clickhouse_spool_unacked_bytes",
+                    "Spooled data not yet acknowledged by ClickHouse",
+                    labels,
+                    {key: self._spool.unacked_bytes},
+                )
+            )
+        return metrics
+
     async def disconnect(self) -> None:
-        """Disconnect from ClickHouse."""
+        """Disconnect from ClickHouse, inserting anything still buffered."""
+        self._closing = True
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._replay_task:
+            # Whatever hasn't been replayed stays in the spool for next time
+            self._replay_task.cancel()
+            self._replay_task = None
         if self.client:
             try:
-                self.client.close()
+                await self.flush()
+            except Exception as e:
+                logger.error("Failed to flush batch to ClickHouse: %s", str(e))
+            self._in_flight.clear()
+            self._executor.shutdown(wait=True)
+            try:
+                self._close_client()
                 logger.info("Disconnected from ClickHouse")
             except Exception as e:
-                logger.error(f"Error disconnecting from ClickHouse: {e}")
+                logger.error("Error disconnecting from ClickHouse: %s", str(e))
             finally:
                 self.client = None
+                self._idle_contexts.clear()
+                if self._spool:
+                    self._spool.close()
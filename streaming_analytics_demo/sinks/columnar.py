@@ -0,0 +1,112 @@
+"""Column-oriented batches for bulk inserts."""
+
+from array import array
+from operator import itemgetter
+from typing import Any, Dict, List, Sequence
+
+from streaming_analytics_demo.util.timestamps import to_epoch_micros
+
+# Typed array codes for the known Coinbase fields. Anything else is passed through
+# as a plain list and left to the client library to convert.
+_column_typecodes = {
+    "sequence": "Q",
+    "trade_id": "Q",
+    "price": "d",
+    "last_size": "d",
+    "open_24h": "d",
+    "volume_24h": "d",
+    "low_24h": "d",
+    "high_24h": "d",
+    "volume_30d": "d",
+    "best_bid": "d",
+    "best_bid_size": "d",
+    "best_ask": "d",
+    "best_ask_size": "d",
+    # Written by the aggregating sink
+    "open": "d",
+    "high": "d",
+    "low": "d",
+    "close": "d",
+    "volume": "d",
+    "notional": "d",
+    "trades": "Q",
+}
+_column_converters = {"Q": int, "d": float}
+
+# Columns holding timestamps, built as int64 microseconds since the epoch.
+TIME_COLUMNS = frozenset({"time", "window_start"})
+
+# Fields of the message that are never stored.
+_excluded_fields = frozenset({"type"})
+
+
+class ColumnarBatch:
+    """Accumulates records with the same shape for a column-oriented insert.
+
+    Appending a record costs a single `itemgetter` call to pick out its values, all
+    type conversion is deferred until the batch is built. At that point each column
+    is converted in one pass (e.g. `array("d", map(float, column))`), which keeps
+    the per-row work in C rather than in a Python loop over every field.
+    """
+
+    def __init__(self, record: Dict[str, Any]):
+        """Start a batch whose columns are the fields of the given record.
+
+        Args:
+            record: The first record of the batch, it is not appended
+        """
+        self.names = tuple(key for key in record if key not in _excluded_fields)
+        self._record_len = len(record)
+        getter = itemgetter(*self.names)
+        if len(self.names) == 1:
+            # itemgetter with one key returns the bare value rather than a tuple
+            self._get = lambda r: (getter(r),)
+        else:
+            self._get = getter
+        self._rows: List[tuple] = []
+
+        # Estimate of the encoded row size, numbers are 8 bytes and strings roughly
+        # as long as in the first record.
+        self.row_bytes = sum(
+            len(value) if isinstance(value, str) and key not in _column_typecodes else 8
+            for key, value in record.items()
+            if key not in _excluded_fields
+        )
+
+    def __len__(self) -> int:
+        """Return the number of rows in the batch."""
+        return len(self._rows)
+
+    @property
+    def nbytes(self) -> int:
+        """Return the estimated encoded size of the batch."""
+        return len(self._rows) * self.row_bytes
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        """Append a record to the batch.
+
+        Returns:
+            bool: False if the record has different fields and belongs in a new batch
+        """
+        if len(record) != self._record_len:
+            return False
+        try:
+            self._rows.append(self._get(record))
+        except KeyError:
+            return False
+        return True
+
+    def columns(self) -> List[Sequence[Any]]:
+        """Build the typed columns of the batch, in the same order as `names`."""
+        columns: List[Sequence[Any]] = []
+        for name, values in zip(self.names, zip(*self._rows)):
+            typecode = _column_typecodes.get(name)
+            if typecode is not None:
+                columns.append(
+                    array(typecode, map(_column_converters[typecode], values))
+                )
+            elif name in TIME_COLUMNS:
+                columns.append(array("q", map(to_epoch_micros, values)))
+            else:
+                columns.append(list(values))
+        return columns
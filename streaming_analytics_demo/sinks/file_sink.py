@@ -1,14 +1,63 @@
 """File sink for the streaming analytics demo."""
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import gzip
+import itertools
 import logging
+import os
+import time
+import weakref
+from typing import Any, Callable, List
+
+from streaming_analytics_demo.metrics import Metric, counter
+
 from .sink import Sink, register_sink
 
 logger = logging.getLogger(__name__)
 
 
+async def _flush_on_interval(ref: "weakref.ref[FileSink]") -> None:
+    """Flush lines left unflushed for flush_interval_s because no write came along.
+
+    The sink isn't held while sleeping, so an abandoned sink can still be
+    garbage collected, closing its file.
+    """
+    while True:
+        sink = ref()
+        if sink is None:
+            return
+        interval = sink._flush_interval_s
+        delay = sink._flushed_at + interval - time.monotonic()
+        if delay <= 0:
+            if sink._unflushed:
+                try:
+                    await sink.flush()
+                except Exception as e:
+                    logger.error("Failed to flush %s: %s", sink._file_path, str(e))
+            delay = interval
+        del sink
+        await asyncio.sleep(delay)
+
+
 @register_sink("file")
 class FileSink(Sink):
-    """Sink that writes messages to a file."""
+    """Sink that writes messages to a file.
+
+    All disk I/O happens on a single background thread, in the order the batches
+    were written, so a slow disk holds up the pipeline's writer but never the event
+    loop. The file is written through a large buffer and flushed every
+    `flush_interval_s`, by a timer when no writes come along to do it; `fsync`
+    controls whether flushes (`flush`) or only closing a file (`rotate`) also
+    force the data to disk.
+
+    With `rotate_bytes` or `rotate_interval_s` the file is renamed with a UTC
+    timestamp (`test.jsonl` becomes `test-20250201T120000.jsonl`) and a new one
+    started once it reaches the size or age. Like logging's rotating handlers, the
+    limits are checked as batches are written. Output can be streamed through gzip
+    or zstd compression, zstd needs the `zstandard` package.
+    """
 
     config_schema = {
         "type": "object",
@@ -16,10 +65,20 @@ class FileSink(Sink):
         "properties": {
             "type": {"type": "string", "enum": ["file"]},
             "file_path": {"type": "string"},
+            "buffer_size": {"type": "integer", "minimum": 1},
+            "flush_interval_s": {"type": "number", "minimum": 0},
+            "fsync": {"type": "string", "enum": ["never", "flush", "rotate"]},
+            "rotate_bytes": {"type": "integer", "minimum": 1},
+            "rotate_interval_s": {"type": "number", "exclusiveMinimum": 0},
+            "compression": {"type": "string", "enum": ["none", "gzip", "zstd"]},
+            "compression_level": {"type": "integer"},
         },
         "additionalProperties": False,
     }
 
+    # The file holds the messages as JSON lines, exactly as the source sent them.
+    raw_passthrough = True
+
     def __init__(self, config: dict):
         """Initialize the FileSink."""
         self.config = config
@@ -28,22 +87,159 @@ class FileSink(Sink):
         if not self._file_path:
             raise ValueError("file_path is required")
 
+        self._buffer_size = config.get("buffer_size", 1 << 20)
+        self._flush_interval_s = config.get("flush_interval_s", 1)
+        self._fsync = config.get("fsync", "never")
+        self._rotate_bytes = config.get("rotate_bytes")
+        self._rotate_interval_s = config.get("rotate_interval_s")
+        self._compression = config.get("compression", "none")
+        self._compression_level = config.get("compression_level")
+
+        # The uncompressed file underneath _file
+        self._raw = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._opened_at = 0.0
+        self._flushed_at = 0.0
+        # Whether lines were written since the last flush
+        self._unflushed = False
+        self._flush_task: asyncio.Task | None = None
+        self.rotations = 0
+
+    @classmethod
+    def worker_config(cls, config: dict, worker: int) -> dict:
+        """Give each worker a file of its own, e.g. `test-w1.jsonl`."""
+        directory, name = os.path.split(config["file_path"])
+        base, dot, extensions = name.partition(".")
+        file_path = os.path.join(directory, f"{base}-w{worker}{dot}{extensions}")
+        return {**config, "file_path": file_path}
+
+    async def _run(self, func: Callable, *args: Any) -> Any:
+        """Run a function on the I/O thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
     async def connect(self) -> None:
         """Connect to the sink."""
-        self._file = open(self._file_path, "a")
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="file-sink"
+        )
+        await self._run(self._open)
+        if self._flush_interval_s:
+            self._flush_task = asyncio.create_task(
+                _flush_on_interval(weakref.ref(self))
+            )
+
+    def _open(self) -> None:
+        """Open the file for appending, through the configured compression."""
+        self._raw = open(self._file_path, "ab", buffering=self._buffer_size)
+        if self._compression == "gzip":
+            self._file = gzip.GzipFile(
+                fileobj=self._raw,
+                mode="ab",
+                compresslevel=self._compression_level or 6,
+            )
+        elif self._compression == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                self._raw.close()
+                raise ImportError("zstd compression needs the zstandard package") from e
+            compressor = zstandard.ZstdCompressor(level=self._compression_level or 3)
+            self._file = compressor.stream_writer(self._raw, closefd=False)
+        else:
+            self._file = self._raw
+        self._opened_at = self._flushed_at = time.monotonic()
+
+    def _flush(self) -> None:
+        """Flush the compressor and file buffers, and fsync if configured to."""
+        self._file.flush()
+        self._raw.flush()
+        if self._fsync == "flush":
+            os.fsync(self._raw.fileno())
+        self._flushed_at = time.monotonic()
+        self._unflushed = False
+
+    def _close(self) -> None:
+        """Finish the compressed stream and close the file."""
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.flush()
+        if self._fsync != "never":
+            os.fsync(self._raw.fileno())
+        self._raw.close()
+
+    def _rotated_path(self) -> str:
+        """Return an unused timestamped name for the current file."""
+        directory, name = os.path.split(self._file_path)
+        base, dot, extensions = name.partition(".")
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        for n in itertools.count():
+            suffix = f"-{n}" if n else ""
+            path = os.path.join(directory, f"{base}-{stamp}{suffix}{dot}{extensions}")
+            if not os.path.exists(path):
+                return path
+
+    def _rotate(self) -> None:
+        """Close the current file, move it aside and start a new one."""
+        self._close()
+        path = self._rotated_path()
+        os.replace(self._file_path, path)
+        self.rotations += 1
+        logger.info("Rotated %s to %s", self._file_path, path)
+        self._open()
+
+    def _write_lines(self, messages: List[str]) -> None:
+        """Write messages as lines, then rotate or flush if it's time. Runs on the I/O thread."""
+        self._file.write(("\n".join(messages) + "\n").encode())
+        self._unflushed = True
+
+        now = time.monotonic()
+        if (self._rotate_bytes and self._raw.tell() >= self._rotate_bytes) or (
+            self._rotate_interval_s and now - self._opened_at >= self._rotate_interval_s
+        ):
+            self._rotate()
+        elif (
+            self._flush_interval_s is not None
+            and now - self._flushed_at >= self._flush_interval_s
+        ):
+            self._flush()
 
     async def write(self, message: str) -> None:
         """Write a single message to the file."""
+        await self.write_batch([message])
+
+    async def write_batch(self, messages: List[str]) -> None:
+        """Write a batch of messages to the file with a single write call."""
         if not self._file or self._file.closed:
             raise RuntimeError("Must connect before writing")
+        if messages:
+            await self._run(self._write_lines, messages)
 
-        """Write a message to the file."""
-        self._file.write(message + "\n")
+    async def flush(self) -> None:
+        """Flush buffered messages to the file."""
+        if self._file and not self._file.closed:
+            await self._run(self._flush)
+
+    def metrics(self) -> List[Metric]:
+        """Return the number of times the file has been rotated."""
+        return [
+            counter(
+                "ingest_file_rotations_total",
+                "Files rotated by a file sink",
+                ("file_path",),
+                {(self._file_path,): self.rotations},
+            )
+        ]
 
     async def disconnect(self) -> None:
         """Disconnect from the sink."""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
         if self._file:
-            self._file.close()
+            if not self._file.closed:
+                await self._run(self._close)
+            self._executor.shutdown(wait=True)
 
     def __del__(self):
         """Ensure file is closed when object is garbage collected."""
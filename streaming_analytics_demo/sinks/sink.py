@@ -1,9 +1,12 @@
 """Generic sink implementation. This includes the base class and a registry of sinks."""
 
+import json
 import jsonschema
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, Type, ClassVar
+from typing import Any, Dict, List, Type, ClassVar
+
+from streaming_analytics_demo.metrics import Metric
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +28,18 @@ def register_sink(sink_type: str):
     return wrapper
 
 
-def get_sink(config: dict) -> "Sink":
-    """Get a sink from the config."""
+def get_sink_class(config: dict) -> Type["Sink"]:
+    """Get the class of the sink described by the config."""
     sink_type = config.get("type")
     sink_class = _sink_registry.get(sink_type)
     if not sink_class:
         raise ValueError(f"Unknown sink type: {sink_type}")
+    return sink_class
+
+
+def get_sink(config: dict) -> "Sink":
+    """Get a sink from the config."""
+    sink_class = get_sink_class(config)
     jsonschema.validate(config, sink_class.config_schema)
     return sink_class(config)
 
@@ -45,10 +54,27 @@ class Sink(ABC):
         "properties": {"type": {"type": "string"}},
     }
 
+    # Sinks that store the source's messages verbatim (e.g. as JSON lines) set this
+    # so the pipeline hands them the raw frames and nothing is decoded at all.
+    raw_passthrough: ClassVar[bool] = False
+
     def __init__(self, config: dict):
         """All sinks must be initialized with a config."""
         self.config = config
 
+    @classmethod
+    def worker_config(cls, config: dict, worker: int) -> dict:
+        """Adapt a sink's config for one of several worker processes.
+
+        Sinks that keep local state, e.g. files, override this so that workers
+        don't share it. The default returns the config unchanged.
+
+        Args:
+            config: The sink's config
+            worker: The worker's number, from 0
+        """
+        return config
+
     @abstractmethod
     async def connect(self) -> None:
         """Connect to the sink."""
@@ -59,6 +85,50 @@ class Sink(ABC):
         """Write a single message to the file."""
         raise NotImplementedError("Subclasses must implement this method")
 
+    async def write_batch(self, messages: List[str]) -> None:
+        """Write a batch of messages to the sink.
+
+        Sinks that can write more efficiently in bulk should override this, the
+        default implementation writes each message in turn.
+
+        Args:
+            messages: The messages to write, in order
+        """
+        for message in messages:
+            await self.write(message)
+
+    async def write_record(self, record: Dict[str, Any]) -> None:
+        """Write a single already decoded record.
+
+        Args:
+            record: The decoded message
+        """
+        await self.write_records([record])
+
+    async def write_records(self, records: List[Dict[str, Any]]) -> None:
+        """Write a batch of already decoded records.
+
+        Sinks that work with structured data should override this to avoid the
+        round trip through JSON, the default implementation serializes each record
+        once and hands the result to write_batch.
+
+        Args:
+            records: The decoded messages, in order
+        """
+        await self.write_batch([json.dumps(record) for record in records])
+
+    async def flush(self) -> None:
+        """Flush any buffered messages. Unbuffered sinks have nothing to do."""
+        pass
+
+    def metrics(self) -> List[Metric]:
+        """Return the sink's metrics for the metrics endpoint, if it keeps any.
+
+        Called each time the endpoint is scraped, so build them from totals the
+        sink keeps anyway rather than doing extra work per message.
+        """
+        return []
+
     @abstractmethod
     async def disconnect(self) -> None:
         """Disconnect from the sink."""
@@ -0,0 +1,242 @@
+"""Disk-backed spool of records waiting to be written to a sink."""
+
+import json
+import logging
+import mmap
+import os
+import threading
+from typing import Any, Dict, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A position in the spool, the segment number and a byte offset within it
+Position = Tuple[int, int]
+
+_SEGMENT_SUFFIX = ".seg"
+_ACK_FILE = "ack"
+_REJECTED_FILE = "rejected"
+
+
+class SegmentSpool:
+    """Append-only log of records, split into numbered segment files.
+
+    Records are stored as JSON lines. A new segment is started once the current one
+    reaches `segment_bytes`, and a segment is deleted as soon as every record in it
+    has been acknowledged. The acknowledged position is kept in a small file next
+    to the segments, so after a restart reading carries on from the first record
+    that was never acknowledged.
+
+    Reads memory-map the segment, so reading back a large backlog costs a scan for
+    line breaks rather than a read call per record. `read` may run on another
+    thread than the other methods.
+
+    Appended records are written to the OS, so they survive the process crashing.
+    With `fsync` set to `roll` a segment is only synced to disk once it's
+    finished, so an OS crash or power loss can lose records appended to the
+    current segment. `append` syncs every append, at the cost of a disk flush per
+    batch.
+
+    A record that can't be decoded when read back is skipped, and its line is
+    moved to a `rejected` file next to the segments so it can be looked at later.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        segment_bytes: int = 64 << 20,
+        max_bytes: int = 1 << 30,
+        fsync: str = "roll",
+    ):
+        """Initialize the spool.
+
+        Args:
+            path: Directory holding the segments, created if it doesn't exist
+            segment_bytes: Size at which a new segment is started
+            max_bytes: Limit on unacknowledged data, see `full`
+            fsync: When to sync appended records to disk, `roll` or `append`
+        """
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._sizes: Dict[int, int] = {}
+        # Guards changes to _sizes against read taking a copy on another thread
+        self._sizes_lock = threading.Lock()
+        self._active = None
+        self._ack: Position = (0, 0)
+        # Records skipped by read because they couldn't be decoded, and where
+        # they are, so a record read again after a failed insert is moved once
+        self.rejected = 0
+        self._rejected_at: Set[Position] = set()
+
+    def _segment_path(self, segment: int) -> str:
+        """Return the file name of a segment."""
+        return os.path.join(self.path, f"{segment:020d}{_SEGMENT_SUFFIX}")
+
+    def open(self) -> None:
+        """Open the spool, picking up any segments left from a previous run."""
+        os.makedirs(self.path, exist_ok=True)
+        for name in os.listdir(self.path):
+            if name.endswith(_SEGMENT_SUFFIX):
+                segment = int(name[: -len(_SEGMENT_SUFFIX)])
+                self._sizes[segment] = os.path.getsize(self._segment_path(segment))
+
+        try:
+            with open(os.path.join(self.path, _ACK_FILE)) as f:
+                segment, offset = (int(value) for value in f.read().split())
+        except FileNotFoundError:
+            segment, offset = min(self._sizes, default=0), 0
+        if segment not in self._sizes:
+            # The acknowledged segment was deleted, start from the oldest one left
+            segment, offset = min(self._sizes, default=segment), 0
+        self._ack = (segment, offset)
+
+        head = max(self._sizes, default=segment)
+        self._sizes.setdefault(head, 0)
+        self._truncate_torn_record(head)
+        self._active = open(self._segment_path(head), "ab")
+        if self.pending:
+            logger.info(
+                "Spool %s has %d unacknowledged bytes", self.path, self.unacked_bytes
+            )
+
+    def _truncate_torn_record(self, segment: int) -> None:
+        """Drop a partly written last record, left by a crash in the middle of a write."""
+        size = self._sizes[segment]
+        if not size:
+            return
+        with open(self._segment_path(segment), "rb+") as f:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                end = mm.rfind(b"\n") + 1
+            if end < size:
+                logger.warning("Dropping a torn record at the end of the spool")
+                f.truncate(end)
+                self._sizes[segment] = end
+
+    @property
+    def unacked_bytes(self) -> int:
+        """Return the amount of data appended but not yet acknowledged."""
+        segment, offset = self._ack
+        return sum(
+            size for number, size in self._sizes.items() if number >= segment
+        ) - (offset if segment in self._sizes else 0)
+
+    @property
+    def pending(self) -> bool:
+        """Check whether there are records that haven't been acknowledged."""
+        return self.unacked_bytes > 0
+
+    @property
+    def full(self) -> bool:
+        """Check whether the unacknowledged data has reached max_bytes.
+
+        On disk the spool may take up to one segment more, as a segment is only
+        deleted once all of it is acknowledged.
+        """
+        return self.unacked_bytes >= self.max_bytes
+
+    def append(self, records: List[Dict[str, Any]]) -> List[Position]:
+        """Append records to the spool.
+
+        Returns:
+            The position just after each record, to acknowledge it by
+        """
+        segment = max(self._sizes)
+        if self._sizes[segment] >= self.segment_bytes:
+            self._roll()
+            segment += 1
+
+        lines = [json.dumps(record).encode() + b"\n" for record in records]
+        self._active.write(b"".join(lines))
+        self._active.flush()
+        if self.fsync == "append":
+            os.fsync(self._active.fileno())
+
+        positions = []
+        offset = self._sizes[segment]
+        for line in lines:
+            offset += len(line)
+            positions.append((segment, offset))
+        with self._sizes_lock:
+            self._sizes[segment] = offset
+        return positions
+
+    def _roll(self) -> None:
+        """Finish the active segment and start the next one."""
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self._active.close()
+        segment = max(self._sizes) + 1
+        with self._sizes_lock:
+            self._sizes[segment] = 0
+        self._active = open(self._segment_path(segment), "ab")
+
+    def read(self, max_records: int) -> Tuple[List[Dict[str, Any]], Position | None]:
+        """Read unacknowledged records, oldest first, without acknowledging them.
+
+        Returns:
+            The records and the position to acknowledge them by, None if there
+            were no records to read
+        """
+        records: List[Dict[str, Any]] = []
+        position = None
+        with self._sizes_lock:
+            sizes = dict(self._sizes)
+        segment, offset = self._ack
+        if segment not in sizes:
+            # The acknowledged segment is gone, carry on from the next one left
+            segment = min((n for n in sizes if n > segment), default=segment)
+            offset = 0
+        while len(records) < max_records and segment in sizes:
+            size = sizes[segment]
+            if offset < size:
+                with open(self._segment_path(segment), "rb") as f:
+                    with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                        while len(records) < max_records and offset < size:
+                            end = mm.find(b"\n", offset, size) + 1 or size
+                            try:
+                                records.append(json.loads(mm[offset:end]))
+                            except ValueError:
+                                self._reject(mm[offset:end], (segment, offset))
+                            offset = end
+                position = (segment, offset)
+            if offset >= size:
+                segment, offset = segment + 1, 0
+        return records, position
+
+    def _reject(self, line: bytes, position: Position) -> None:
+        """Move a line that can't be decoded out of the way of the records."""
+        if position in self._rejected_at:
+            return
+        self._rejected_at.add(position)
+        self.rejected += 1
+        logger.error(
+            "Skipping a record in spool %s at %s that can't be decoded",
+            self.path,
+            position,
+        )
+        with open(os.path.join(self.path, _REJECTED_FILE), "ab") as f:
+            f.write(line if line.endswith(b"\n") else line + b"\n")
+
+    def ack(self, position: Position) -> None:
+        """Acknowledge every record up to a position, deleting finished segments."""
+        segment, offset = position
+        active = max(self._sizes)
+        if segment < active and offset >= self._sizes[segment]:
+            segment, offset = segment + 1, 0
+        for number in [number for number in self._sizes if number < segment]:
+            os.remove(self._segment_path(number))
+            with self._sizes_lock:
+                del self._sizes[number]
+
+        self._ack = (segment, offset)
+        ack_path = os.path.join(self.path, _ACK_FILE)
+        with open(ack_path + ".tmp", "w") as f:
+            f.write(f"{segment} {offset}")
+        os.replace(ack_path + ".tmp", ack_path)
+
+    def close(self) -> None:
+        """Close the active segment."""
+        if self._active:
+            self._active.close()
+            self._active = None
@@ -1,6 +1,16 @@
 """Definition of source streams."""
 
 from .coinbase_source import CoinbaseSource
+from .decoders import Decoder, get_decoder, register_decoder
+from .replay_source import ReplaySource
 from .source import Source, get_source
 
-__all__ = ["CoinbaseSource", "Source", "get_source"]
+__all__ = [
+    "CoinbaseSource",
+    "Decoder",
+    "ReplaySource",
+    "Source",
+    "get_decoder",
+    "get_source",
+    "register_decoder",
+]
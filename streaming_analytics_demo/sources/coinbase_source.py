@@ -3,18 +3,90 @@
 import asyncio
 import json
 import logging
-from typing import Dict, Any
+import random
+import time
+from typing import Dict, Any, List, NamedTuple, Tuple
 import warnings
+import zlib
 import websockets
 
+from streaming_analytics_demo.metrics import Histogram, Metric, counter
+
+from .decoders import get_decoder
+from .sequence_tracker import SequenceTracker
 from .source import Source, register_source
 
 logger = logging.getLogger(__name__)
 
+# The channel each message type arrives on, where it isn't named after it
+_CHANNELS = {
+    "match": "matches",
+    "last_match": "matches",
+    "snapshot": "level2",
+    "l2update": "level2",
+    "received": "full",
+    "open": "full",
+    "done": "full",
+    "change": "full",
+    "activate": "full",
+}
+# Decoding is timed for one frame in this many, timing every frame would cost
+# about as much as decoding it
+_DECODE_SAMPLE_EVERY = 64
+_DECODE_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3)
+
+
+class _ShardReconnected(NamedTuple):
+    """Queued by a shard ahead of its first frame after a reconnect."""
+
+    product_ids: List[str]
+
+
+def partition_products(
+    product_ids: List[str], count: int, strategy: str = "count"
+) -> List[List[str]]:
+    """Split product ids into at most `count` non-empty groups.
+
+    Args:
+        product_ids: The product ids to split
+        count: The number of groups
+        strategy: "count" deals the products out round robin, "hash" assigns them
+            by a hash of the product id that is stable across runs
+    """
+    groups: List[List[str]] = [[] for _ in range(count)]
+    for i, product_id in enumerate(product_ids):
+        if strategy == "hash":
+            # crc32 rather than hash() so products land in the same group every run
+            i = zlib.crc32(product_id.encode())
+        groups[i % count].append(product_id)
+    return [group for group in groups if group]
+
 
 @register_source("coinbase")
 class CoinbaseSource(Source):
-    """Source implementation for Coinbase WebSocket API."""
+    """Source implementation for Coinbase WebSocket API.
+
+    With `reconnect` enabled, a dropped or stalled connection is re-established
+    inside receive and the original subscription is sent again, so callers only
+    see an error once `max_attempts` have failed. Attempts back off exponentially
+    with full jitter, starting immediately. A connection counts as stalled when no
+    frame arrives within `heartbeat_timeout_s`; subscribing to the heartbeat
+    channel keeps quiet products from tripping it.
+
+    Setting `decoder` decodes messages into typed records, with numbers parsed and
+    times in epoch microseconds (see `decoders`). Without it messages are decoded
+    as they are, with every value still a string.
+
+    Decoded messages are checked for per-product gaps in their `sequence` numbers.
+
+    Setting `shards` splits the product ids across several websocket connections,
+    either round robin (`count`) or by a stable hash of the product id (`hash`).
+    Each shard is a CoinbaseSource of its own with its own reconnect, and their
+    frames are merged into a single stream. A shard's reconnect is noted in the
+    merged stream, so sequence gaps across it are told apart for its products. Every product is carried by exactly one
+    shard, so each product's messages stay in order; there is no ordering between
+    products on different shards.
+    """
 
     config_schema = {
         "type": "object",
@@ -53,6 +125,31 @@ class CoinbaseSource(Source):
                     },
                 },
             },
+            "decoder": {
+                "type": "string",
+                "enum": ["auto", "json", "orjson", "msgspec"],
+            },
+            "heartbeat_timeout_s": {"type": "number", "exclusiveMinimum": 0},
+            "reconnect": {
+                "type": "object",
+                "properties": {
+                    "enabled": {"type": "boolean"},
+                    "initial_backoff_ms": {"type": "integer", "minimum": 1},
+                    "max_backoff_ms": {"type": "integer", "minimum": 1},
+                    "max_attempts": {"type": "integer", "minimum": 0},
+                },
+                "additionalProperties": False,
+            },
+            "shards": {
+                "type": "object",
+                "required": ["count"],
+                "properties": {
+                    "count": {"type": "integer", "minimum": 1},
+                    "strategy": {"type": "string", "enum": ["count", "hash"]},
+                    "queue_size": {"type": "integer", "minimum": 1},
+                },
+                "additionalProperties": False,
+            },
         },
     }
 
@@ -66,6 +163,33 @@ class CoinbaseSource(Source):
         self.websocket = None
         self._connected = False
         self._loop = None
+
+        reconnect = config.get("reconnect", {})
+        self.reconnect_enabled = reconnect.get("enabled", bool(reconnect))
+        self.initial_backoff_ms = reconnect.get("initial_backoff_ms", 100)
+        self.max_backoff_ms = reconnect.get("max_backoff_ms", 30000)
+        self.max_attempts = reconnect.get("max_attempts", 0)
+        self.heartbeat_timeout_s = config.get("heartbeat_timeout_s")
+        self.reconnects = 0
+        self.last_recovery_ms: float | None = None
+        self._recovered_at: float | None = None
+        self.sequences = SequenceTracker()
+        decoder = config.get("decoder")
+        self._decode = get_decoder(decoder).decode if decoder else json.loads
+        self.messages_received = 0
+        self._started_at: float | None = None
+        # Decoded frames by product id and message type
+        self.frames: Dict[Tuple[str, str], int] = {}
+        self.decoded = 0
+        self._decode_seconds = Histogram(
+            "ingest_decode_seconds",
+            "Time to decode a frame, sampled",
+            buckets=_DECODE_BUCKETS,
+        )
+
+        self.shards = self._create_shards()
+        self._merged: asyncio.Queue | None = None
+        self._shard_tasks: List[asyncio.Task] = []
         logger.info("Coinbase source initialized")
 
     def __del__(self):
@@ -82,12 +206,46 @@ class CoinbaseSource(Source):
                     source=self,
                 )
 
+    @classmethod
+    def partition(cls, config: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+        """Split the subscription's product ids round robin across configs."""
+        subscription = config["subscription"]
+        return [
+            {**config, "subscription": {**subscription, "product_ids": group}}
+            for group in partition_products(subscription["product_ids"], count)
+        ]
+
+    def _create_shards(self) -> List["CoinbaseSource"]:
+        """Create a source for each non-empty shard of the product ids."""
+        shards = self.config.get("shards")
+        if not shards or shards["count"] < 2:
+            return []
+        subscription = self.config["subscription"]
+        groups = partition_products(
+            subscription["product_ids"],
+            shards["count"],
+            shards.get("strategy", "count"),
+        )
+        shard_config = {
+            key: value for key, value in self.config.items() if key != "shards"
+        }
+        return [
+            CoinbaseSource(
+                {**shard_config, "subscription": {**subscription, "product_ids": group}}
+            )
+            for group in groups
+        ]
+
     async def connect(self) -> Any:
         """Connect to the Coinbase WebSocket feed.
 
         Raises:
             ConnectionError: If connection fails
         """
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        if self.shards:
+            return await self._connect_shards()
         try:
             logger.info("Connecting to Coinbase WebSocket feed")
             url = self.config.get("wss_url")
@@ -124,8 +282,52 @@ class CoinbaseSource(Source):
             raise ConnectionError(f"Lost connection to Coinbase WebSocket feed: {e}")
         return response_data
 
+    async def _connect_shards(self) -> Dict[str, Any]:
+        """Connect every shard and start merging their frames."""
+        self._merged = asyncio.Queue(self.config["shards"].get("queue_size", 10000))
+        try:
+            responses = await asyncio.gather(
+                *(shard.connect() for shard in self.shards)
+            )
+        except Exception as e:
+            await self.disconnect()
+            raise e
+        self._shard_tasks = [
+            asyncio.create_task(self._read_shard(shard)) for shard in self.shards
+        ]
+        self._connected = True
+        logger.info("Connected %d shards to Coinbase WebSocket feed", len(self.shards))
+        return {"type": "subscriptions", "shards": responses}
+
+    async def _read_shard(self, shard: "CoinbaseSource") -> None:
+        """Move a shard's frames onto the merged queue, followed by its error if it fails."""
+        reconnects = shard.reconnects
+        try:
+            while True:
+                frame = await shard.receive_raw()
+                if shard.reconnects != reconnects:
+                    # Frames are decoded, and their sequences checked, by this
+                    # source, so it's told of the reconnect in order with them
+                    reconnects = shard.reconnects
+                    product_ids = shard.config["subscription"]["product_ids"]
+                    await self._merged.put(_ShardReconnected(product_ids))
+                await self._merged.put(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._merged.put(e)
+
     async def disconnect(self) -> None:
         """Gracefully disconnect from the WebSocket feed."""
+        if self.shards:
+            for task in self._shard_tasks:
+                task.cancel()
+            self._shard_tasks = []
+            await asyncio.gather(
+                *(shard.disconnect() for shard in self.shards if shard.websocket)
+            )
+            self._connected = False
+            return
         try:
             logger.info("Disconnecting from Coinbase WebSocket feed")
             await self.websocket.close()
@@ -138,10 +340,163 @@ class CoinbaseSource(Source):
 
     async def receive(self) -> Any:
         """Receive messages from the Coinbase WebSocket feed."""
-        try:
-            message = await self.websocket.recv()
-            return json.loads(message)
-        except Exception as e:
-            logger.error("Error receiving message: %s", str(e))
-            await self.disconnect()
-            raise e
+        return self.decode(await self.receive_raw())
+
+    def decode(self, frame: str) -> Any:
+        """Decode a frame returned by receive_raw, tracking its sequence number."""
+        if self.decoded % _DECODE_SAMPLE_EVERY:
+            message = self._decode(frame)
+        else:
+            started = time.perf_counter()
+            message = self._decode(frame)
+            self._decode_seconds.observe(time.perf_counter() - started)
+        self.decoded += 1
+        key = (message.get("product_id", ""), message.get("type", ""))
+        self.frames[key] = self.frames.get(key, 0) + 1
+        self.sequences.track(message)
+        return message
+
+    async def receive_raw(self) -> str:
+        """Receive the next JSON frame from the Coinbase WebSocket feed undecoded."""
+        if self.shards:
+            frame = await self._merged.get()
+            while isinstance(frame, _ShardReconnected):
+                self.sequences.mark_reconnect(frame.product_ids)
+                frame = await self._merged.get()
+            if isinstance(frame, Exception):
+                raise frame
+            self.messages_received += 1
+            return frame
+
+        while True:
+            try:
+                if self.heartbeat_timeout_s:
+                    frame = await asyncio.wait_for(
+                        self.websocket.recv(), self.heartbeat_timeout_s
+                    )
+                else:
+                    frame = await self.websocket.recv()
+                self.messages_received += 1
+                return frame
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = ConnectionError(
+                        f"No message received in {self.heartbeat_timeout_s}s"
+                    )
+                if not self.reconnect_enabled:
+                    logger.error("Error receiving message: %s", str(e))
+                    await self.disconnect()
+                    raise e
+                logger.warning("Error receiving message, reconnecting: %s", str(e))
+                await self.disconnect()
+                await self._reconnect()
+
+    async def _reconnect(self) -> None:
+        """Reconnect and resubscribe, backing off between failed attempts.
+
+        Raises:
+            ConnectionError: If max_attempts is set and all of them fail
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if attempt:
+                # Exponential backoff with full jitter, so many clients dropped at
+                # once don't all come back at the same moment.
+                ceiling = min(
+                    self.max_backoff_ms, self.initial_backoff_ms * 2 ** (attempt - 1)
+                )
+                await asyncio.sleep(random.uniform(0, ceiling) / 1000)
+            attempt += 1
+            try:
+                await self.connect()
+                break
+            except ConnectionError as e:
+                if self.max_attempts and attempt >= self.max_attempts:
+                    logger.error("Giving up after %d reconnect attempts", attempt)
+                    raise e
+                logger.warning("Reconnect attempt %d failed: %s", attempt, str(e))
+
+        self.reconnects += 1
+        self._recovered_at = time.monotonic()
+        self.last_recovery_ms = (self._recovered_at - started) * 1000
+        self.sequences.mark_reconnect(self.config["subscription"]["product_ids"])
+        logger.info(
+            "Reconnected to Coinbase WebSocket feed in %.0f ms after %d attempts",
+            self.last_recovery_ms,
+            attempt,
+        )
+
+    def _connection_stats(self) -> dict:
+        """Return the throughput and reconnect statistics of this connection."""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0
+        return {
+            "messages": self.messages_received,
+            "messages_per_s": self.messages_received / elapsed if elapsed else 0.0,
+            "reconnects": self.reconnects,
+            "last_recovery_ms": self.last_recovery_ms,
+        }
+
+    def stats(self) -> dict:
+        """Return a snapshot of the connection statistics."""
+        stats = {**self._connection_stats(), **self.sequences.stats()}
+        if self.shards:
+            stats["reconnects"] = sum(shard.reconnects for shard in self.shards)
+            recovered = [s for s in self.shards if s._recovered_at is not None]
+            if recovered:
+                latest = max(recovered, key=lambda s: s._recovered_at)
+                stats["last_recovery_ms"] = latest.last_recovery_ms
+            stats["shards"] = [
+                {
+                    "product_ids": shard.config["subscription"]["product_ids"],
+                    **shard._connection_stats(),
+                }
+                for shard in self.shards
+            ]
+        return stats
+
+    def metrics(self) -> List[Metric]:
+        """Return the frames received, decode time, reconnects and sequence gaps."""
+        frames: Dict[Tuple[str, str], int] = {}
+        for (product_id, message_type), count in self.frames.items():
+            key = (product_id, _CHANNELS.get(message_type, message_type))
+            frames[key] = frames.get(key, 0) + count
+        # Frames passed to raw sinks without being decoded can't be told apart
+        if self.messages_received > self.decoded:
+            frames[("", "")] = self.messages_received - self.decoded
+        reconnects = self.reconnects
+        if self.shards:
+            reconnects = sum(shard.reconnects for shard in self.shards)
+        return [
+            counter(
+                "ingest_frames_received_total",
+                "Frames received from the source, by product and channel",
+                ("product_id", "channel"),
+                frames,
+            ),
+            self._decode_seconds,
+            counter(
+                "ingest_source_reconnects_total",
+                "Reconnects to the source",
+                (),
+                {(): reconnects},
+            ),
+            counter(
+                "ingest_sequence_gaps_total",
+                "Gaps in per-product sequence numbers",
+                (),
+                {(): self.sequences.gaps},
+            ),
+            counter(
+                "ingest_sequence_missing_total",
+                "Messages missing from the gaps in sequence numbers",
+                (),
+                {(): self.sequences.missing},
+            ),
+            counter(
+                "ingest_sequence_reconnect_gaps_total",
+                "Gaps in per-product sequence numbers spanning a reconnect",
+                (),
+                {(): self.sequences.reconnect_gaps},
+            ),
+        ]
@@ -0,0 +1,205 @@
+"""Decoders turning Coinbase frames into typed records.
+
+Coinbase sends every number as a string. The decoders here convert the fields of
+the channels we store straight to float, int and epoch microseconds, and drop the
+fields we don't store, so the sink doesn't have to parse anything a second time.
+Messages of other types (e.g. subscriptions) are decoded as they are.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+import json
+import logging
+from typing import Any, Callable, Dict, Tuple, Type, Union
+
+from streaming_analytics_demo.util.timestamps import to_epoch_micros
+
+logger = logging.getLogger(__name__)
+
+_decoder_registry: Dict[str, Type["Decoder"]] = {}
+
+# Tried in order by the "auto" decoder
+_preferred_decoders = ("msgspec", "orjson", "json")
+
+# The fields we keep for each message type and how to convert them
+_channel_fields: Dict[str, Tuple[Tuple[str, Callable[[Any], Any]], ...]] = {
+    "ticker": (
+        ("type", str),
+        ("sequence", int),
+        ("product_id", str),
+        ("price", float),
+        ("open_24h", float),
+        ("volume_24h", float),
+        ("low_24h", float),
+        ("high_24h", float),
+        ("volume_30d", float),
+        ("best_bid", float),
+        ("best_bid_size", float),
+        ("best_ask", float),
+        ("best_ask_size", float),
+        ("side", str),
+        ("time", to_epoch_micros),
+        ("trade_id", int),
+        ("last_size", float),
+    ),
+    "match": (
+        ("type", str),
+        ("trade_id", int),
+        ("maker_order_id", str),
+        ("taker_order_id", str),
+        ("side", str),
+        ("size", float),
+        ("price", float),
+        ("product_id", str),
+        ("sequence", int),
+        ("time", to_epoch_micros),
+    ),
+    "heartbeat": (
+        ("type", str),
+        ("sequence", int),
+        ("last_trade_id", int),
+        ("product_id", str),
+        ("time", to_epoch_micros),
+    ),
+}
+# The matches channel starts with the most recent match under its own type
+_channel_fields["last_match"] = _channel_fields["match"]
+
+
+def register_decoder(name: str):
+    """Register a decoder."""
+
+    def wrapper(cls):
+        _decoder_registry[name] = cls
+        return cls
+
+    return wrapper
+
+
+def get_decoder(name: str = "auto") -> "Decoder":
+    """Get a decoder by name.
+
+    Args:
+        name: A registered decoder, or "auto" for the fastest one that is installed
+
+    Raises:
+        ValueError: If the decoder is unknown
+        ImportError: If the decoder's library is not installed
+    """
+    if name == "auto":
+        for preferred in _preferred_decoders:
+            try:
+                decoder = _decoder_registry[preferred]()
+            except ImportError:
+                continue
+            logger.info("Using %s decoder", preferred)
+            return decoder
+    decoder_class = _decoder_registry.get(name)
+    if not decoder_class:
+        raise ValueError(f"Unknown decoder: {name}")
+    return decoder_class()
+
+
+def _convert(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep and convert the known fields of a decoded message."""
+    fields = _channel_fields.get(message.get("type"))
+    if fields is None:
+        return message
+    record = {}
+    for name, convert in fields:
+        value = message.get(name)
+        if value is not None:
+            record[name] = convert(value)
+    return record
+
+
+class Decoder(ABC):
+    """Generic decoder base class."""
+
+    @abstractmethod
+    def decode(self, frame: Union[str, bytes]) -> Dict[str, Any]:
+        """Decode a frame into a typed record."""
+        raise NotImplementedError("Subclasses must implement this method")
+
+
+@register_decoder("json")
+class StdlibDecoder(Decoder):
+    """Decoder using the standard library, always available."""
+
+    def decode(self, frame: Union[str, bytes]) -> Dict[str, Any]:
+        """Decode a frame into a typed record."""
+        return _convert(json.loads(frame))
+
+
+@register_decoder("orjson")
+class OrjsonDecoder(Decoder):
+    """Decoder parsing with orjson, then converting fields like the stdlib one."""
+
+    def __init__(self):
+        """Initialize the decoder.
+
+        Raises:
+            ImportError: If orjson is not installed
+        """
+        import orjson
+
+        self._loads = orjson.loads
+
+    def decode(self, frame: Union[str, bytes]) -> Dict[str, Any]:
+        """Decode a frame into a typed record."""
+        return _convert(self._loads(frame))
+
+
+@register_decoder("msgspec")
+class MsgspecDecoder(Decoder):
+    """Decoder with a msgspec struct per message type.
+
+    msgspec converts the numeric strings while parsing (`strict=False`) and skips
+    every field the structs don't declare, so nothing we drop is ever materialized.
+    """
+
+    def __init__(self):
+        """Initialize the decoder.
+
+        Raises:
+            ImportError: If msgspec is not installed
+        """
+        import msgspec
+
+        self._validation_error = msgspec.ValidationError
+        self._fallback = msgspec.json.Decoder().decode
+
+        types = {int: int, float: float, str: str, to_epoch_micros: datetime}
+        structs = []
+        for tag, fields in _channel_fields.items():
+            struct = msgspec.defstruct(
+                tag.title().replace("_", "") + "Message",
+                [
+                    (name, types[convert] | None, None)
+                    for name, convert in fields
+                    if name != "type"
+                ],
+                tag=tag,
+                tag_field="type",
+            )
+            structs.append(struct)
+        self._decoder = msgspec.json.Decoder(Union[tuple(structs)], strict=False)
+        self._fields = {struct: struct.__struct_fields__ for struct in structs}
+        self._tags = {struct: struct.__struct_config__.tag for struct in structs}
+
+    def decode(self, frame: Union[str, bytes]) -> Dict[str, Any]:
+        """Decode a frame into a typed record."""
+        try:
+            message = self._decoder.decode(frame)
+        except self._validation_error:
+            # Not one of the stored message types
+            return self._fallback(frame)
+
+        record = {"type": self._tags[type(message)]}
+        for name in self._fields[type(message)]:
+            value = getattr(message, name)
+            if value is not None:
+                record[name] = (
+                    to_epoch_micros(value) if isinstance(value, datetime) else value
+                )
+        return record
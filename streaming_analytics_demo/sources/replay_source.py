@@ -0,0 +1,305 @@
+"""Source replaying messages recorded by the file sink."""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import re
+import time
+from typing import Any, Callable, Dict, Iterator, List
+import zlib
+
+from streaming_analytics_demo.util.timestamps import to_epoch_micros
+
+from .decoders import get_decoder
+from .source import Source, register_source
+
+logger = logging.getLogger(__name__)
+
+# The suffix the file sink adds to a rotated file's name, before its extensions
+_ROTATED_SUFFIX = re.compile(r"-(\d{8}T\d{6})(?:-(\d+))?")
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Finds a frame's time without decoding it, to pace the replay
+_TIME = re.compile(r'"time":\s*"([^"]+)"')
+
+
+def archive_files(file_path: str) -> List[str]:
+    """Return the files a file sink wrote to `file_path`, oldest first.
+
+    These are the rotated files, ordered by the timestamp in their names, followed
+    by the file itself if it exists.
+    """
+    directory, name = os.path.split(file_path)
+    base, dot, extensions = name.partition(".")
+    rotated = []
+    for entry in os.listdir(directory or "."):
+        entry_base, entry_dot, entry_extensions = entry.partition(".")
+        if (entry_dot, entry_extensions) != (dot, extensions):
+            continue
+        if not entry_base.startswith(base):
+            continue
+        match = _ROTATED_SUFFIX.fullmatch(entry_base[len(base) :])
+        if match:
+            order = (match[1], int(match[2] or 0))
+            rotated.append((order, os.path.join(directory, entry)))
+    files = [path for _, path in sorted(rotated)]
+    if os.path.exists(file_path):
+        files.append(file_path)
+    return files
+
+
+def _read_mapped(f: Any, path: str, chunk_bytes: int) -> Iterator[List[bytes]]:
+    """Yield the lines of an uncompressed file, a chunk at a time, through mmap."""
+    size = os.fstat(f.fileno()).st_size
+    if not size:
+        return
+    with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+        end_of_lines = mm.rfind(b"\n") + 1
+        if end_of_lines < size:
+            logger.warning("Ignoring a partial line at the end of %s", path)
+        offset = 0
+        while offset < end_of_lines:
+            end = mm.rfind(b"\n", offset, offset + chunk_bytes) + 1
+            if not end:
+                # A line longer than a chunk
+                end = mm.find(b"\n", offset) + 1
+            yield mm[offset:end].splitlines()
+            offset = end
+
+
+def _decompress(
+    f: Any, chunk_bytes: int, new_decompressor: Callable[[], Any]
+) -> Iterator[bytes]:
+    """Yield the decompressed data of a file, a chunk of compressed data at a time.
+
+    The file sink starts a new compressed stream each time it opens a file, so a
+    file may hold several, one after another.
+
+    Raises:
+        EOFError: If the last stream is incomplete
+    """
+    decompressor = new_decompressor()
+    incomplete = False
+    while data := f.read(chunk_bytes):
+        while data:
+            incomplete = True
+            yield decompressor.decompress(data)
+            if not decompressor.eof:
+                break
+            data = decompressor.unused_data
+            decompressor = new_decompressor()
+            incomplete = False
+    if incomplete:
+        raise EOFError("Compressed stream ended before its end marker")
+
+
+def _read_stream(blocks: Iterator[bytes], path: str) -> Iterator[List[bytes]]:
+    """Yield the lines of a stream of decompressed data, a block at a time."""
+    rest = b""
+    try:
+        for data in blocks:
+            data = rest + data
+            end = data.rfind(b"\n") + 1
+            rest = data[end:]
+            if end:
+                yield data[:end].splitlines()
+    except EOFError:
+        logger.warning("%s ends mid-stream, it may still be being written", path)
+    if rest:
+        logger.warning("Ignoring a partial line at the end of %s", path)
+
+
+def read_lines(path: str, chunk_bytes: int = 1 << 20) -> Iterator[List[bytes]]:
+    """Yield the lines of a file sink's file, a chunk of roughly chunk_bytes at a time.
+
+    gzip and zstd files are recognized by their contents and decompressed as they
+    are read, other files are memory-mapped. zstd needs the `zstandard` package.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(_ZSTD_MAGIC))
+        f.seek(0)
+        if magic.startswith(_GZIP_MAGIC):
+            # wbits=31 reads the gzip header and trailer
+            blocks = _decompress(f, chunk_bytes, lambda: zlib.decompressobj(wbits=31))
+            yield from _read_stream(blocks, path)
+        elif magic == _ZSTD_MAGIC:
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError(f"Reading {path} needs the zstandard package") from e
+            decompressor = zstandard.ZstdDecompressor()
+            blocks = _decompress(f, chunk_bytes, decompressor.decompressobj)
+            yield from _read_stream(blocks, path)
+        else:
+            yield from _read_mapped(f, path, chunk_bytes)
+
+
+@register_source("replay")
+class ReplaySource(Source):
+    """Source that replays the JSON lines written by a file sink.
+
+    `file_path` is the file sink's `file_path` (or a list of them, e.g. one per
+    worker). The rotated files are replayed first, oldest first, then the file
+    itself, whether compressed or not. Files are read a chunk at a time on a
+    background thread, so a large archive is never held in memory.
+
+    With `speed: max` (the default) messages are replayed as fast as the sinks
+    take them. A number replays them at that multiple of the speed they were
+    recorded at, going by their `time` field: 1 keeps the original timing, 10
+    replays ten times faster. Messages without a time (e.g. subscriptions) are
+    replayed straight away.
+
+    `receive` raises EOFError once every file has been replayed.
+    """
+
+    config_schema = {
+        "type": "object",
+        "required": ["type", "file_path"],
+        "properties": {
+            "type": {"type": "string", "enum": ["replay"]},
+            "file_path": {
+                "oneOf": [
+                    {"type": "string"},
+                    {"type": "array", "items": {"type": "string"}, "minItems": 1},
+                ]
+            },
+            "speed": {
+                "oneOf": [
+                    {"type": "number", "exclusiveMinimum": 0},
+                    {"type": "string", "enum": ["max"]},
+                ]
+            },
+            "chunk_bytes": {"type": "integer", "minimum": 1},
+            "decoder": {
+                "type": "string",
+                "enum": ["auto", "json", "orjson", "msgspec"],
+            },
+        },
+        "additionalProperties": False,
+    }
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize the replay source."""
+        super().__init__(config)
+        file_paths = config["file_path"]
+        self.file_paths = [file_paths] if isinstance(file_paths, str) else file_paths
+        speed = config.get("speed", "max")
+        self.speed: float | None = None if speed == "max" else float(speed)
+        self.chunk_bytes = config.get("chunk_bytes", 1 << 20)
+        decoder = config.get("decoder")
+        self._decode = get_decoder(decoder).decode if decoder else json.loads
+
+        self.files: List[str] = []
+        self.files_replayed = 0
+        self.messages_replayed = 0
+        self._chunks: Iterator[List[bytes]] | None = None
+        self._lines: Iterator[bytes] = iter(())
+        # The recorded time and the monotonic time at which pacing started
+        self._first_recorded: int | None = None
+        self._started_at = 0.0
+
+    @classmethod
+    def partition(cls, config: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+        """Split a list of file paths across up to `count` configs."""
+        file_paths = config["file_path"]
+        if isinstance(file_paths, str):
+            return [config]
+        return [
+            {**config, "file_path": file_paths[i::count]}
+            for i in range(min(count, len(file_paths)))
+        ]
+
+    def _read_files(self) -> Iterator[List[bytes]]:
+        """Yield the lines of every file in turn, a chunk at a time."""
+        for path in self.files:
+            logger.info("Replaying %s", path)
+            yield from read_lines(path, self.chunk_bytes)
+            self.files_replayed += 1
+
+    async def connect(self) -> None:
+        """Find the files to replay.
+
+        Raises:
+            ConnectionError: If there are no files to replay
+        """
+        self.files = [path for p in self.file_paths for path in archive_files(p)]
+        if not self.files:
+            raise ConnectionError(f"No files to replay at {self.file_paths}")
+        logger.info("Replaying %d files", len(self.files))
+        self._chunks = self._read_files()
+
+    async def disconnect(self) -> None:
+        """Stop replaying and close the current file."""
+        self._close_files()
+
+    def __del__(self):
+        """Close the current file when the instance is garbage collected."""
+        self._close_files()
+
+    def _close_files(self) -> None:
+        """Close the current file, which needs no event loop."""
+        if getattr(self, "_chunks", None) is not None:
+            try:
+                self._chunks.close()
+            except ValueError:
+                # Still reading a chunk on the background thread, the file is
+                # closed when the generator is collected.
+                pass
+            self._chunks = None
+
+    async def receive(self) -> Any:
+        """Receive the next recorded message, decoded."""
+        return self.decode(await self.receive_raw())
+
+    def decode(self, frame: str) -> Any:
+        """Decode a frame returned by receive_raw."""
+        return self._decode(frame)
+
+    async def receive_raw(self) -> str:
+        """Receive the next recorded message as it was recorded.
+
+        Raises:
+            EOFError: Once every file has been replayed
+        """
+        if self._chunks is None:
+            raise RuntimeError("Must connect before receiving")
+        line = next(self._lines, None)
+        while not line:
+            if line is None:
+                chunk = await asyncio.get_running_loop().run_in_executor(
+                    None, next, self._chunks, None
+                )
+                if chunk is None:
+                    raise EOFError("Every file has been replayed")
+                self._lines = iter(chunk)
+            line = next(self._lines, None)
+
+        frame = line.decode()
+        self.messages_replayed += 1
+        if self.speed:
+            await self._pace(frame)
+        return frame
+
+    async def _pace(self, frame: str) -> None:
+        """Wait until a frame is due, relative to the first one with a time."""
+        match = _TIME.search(frame)
+        if not match:
+            return
+        recorded = to_epoch_micros(match[1])
+        now = time.monotonic()
+        if self._first_recorded is None:
+            self._first_recorded, self._started_at = recorded, now
+            return
+        due = self._started_at + (recorded - self._first_recorded) / 1e6 / self.speed
+        if due > now:
+            await asyncio.sleep(due - now)
+
+    def stats(self) -> dict:
+        """Return how far the replay has got."""
+        return {
+            "files": len(self.files),
+            "files_replayed": self.files_replayed,
+            "messages_replayed": self.messages_replayed,
+        }
@@ -0,0 +1,100 @@
+"""Per-product sequence number tracking."""
+
+import logging
+from typing import Any, Dict, Iterable, Set
+
+from streaming_analytics_demo.util import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class SequenceTracker:
+    """Tracks the last sequence number seen for each product and reports gaps.
+
+    Some channels (e.g. ticker) skip sequence numbers as a matter of course, so
+    individual gaps are only logged at debug level, at most 10 a second. A gap
+    that spans a reconnect means messages were lost while we were disconnected,
+    and is logged as a warning.
+    """
+
+    def __init__(self, field: str = "sequence"):
+        """Initialize the tracker.
+
+        Args:
+            field: The message field holding the sequence number
+        """
+        self.field = field
+        self._last: Dict[str, int] = {}
+        # Products whose next message is the first since a reconnect
+        self._reconnected: Set[str] = set()
+        self.gaps = 0
+        self.missing = 0
+        # Of the gaps above, those spanning a reconnect
+        self.reconnect_gaps = 0
+        self.reconnect_missing = 0
+        self.out_of_order = 0
+        self._debug_limit = RateLimiter(10)
+
+    def mark_reconnect(self, product_ids: Iterable[str] | None = None) -> None:
+        """Note that the connection was re-established before the next messages.
+
+        Args:
+            product_ids: The products carried by the connection, or None for all
+        """
+        if product_ids is None:
+            self._reconnected = set(self._last)
+        else:
+            self._reconnected.update(p for p in product_ids if p in self._last)
+
+    def track(self, message: Dict[str, Any]) -> None:
+        """Check a message's sequence number against the last one for its product."""
+        sequence = message.get(self.field)
+        product_id = message.get("product_id")
+        if sequence is None or product_id is None:
+            return
+        sequence = int(sequence)
+        last = self._last.get(product_id)
+        if last is None:
+            self._last[product_id] = sequence
+            return
+
+        after_reconnect = product_id in self._reconnected
+        if after_reconnect:
+            self._reconnected.discard(product_id)
+        if sequence <= last:
+            self.out_of_order += 1
+            return
+        self._last[product_id] = sequence
+
+        missing = sequence - last - 1
+        if missing:
+            self.gaps += 1
+            self.missing += missing
+            if after_reconnect:
+                self.reconnect_gaps += 1
+                self.reconnect_missing += missing
+                logger.warning(
+                    "Sequence gap of %d for %s across reconnect (%d -> %d)",
+                    missing,
+                    product_id,
+                    last,
+                    sequence,
+                )
+            elif logger.isEnabledFor(logging.DEBUG) and self._debug_limit.allow():
+                logger.debug(
+                    "Sequence gap of %d for %s (%d -> %d)",
+                    missing,
+                    product_id,
+                    last,
+                    sequence,
+                )
+
+    def stats(self) -> dict:
+        """Return a snapshot of the gap statistics."""
+        return {
+            "sequence_gaps": self.gaps,
+            "sequence_missing": self.missing,
+            "sequence_out_of_order": self.out_of_order,
+            "sequence_reconnect_gaps": self.reconnect_gaps,
+            "sequence_reconnect_missing": self.reconnect_missing,
+        }
@@ -1,9 +1,12 @@
 """Generic source implementation. This includes the base class and a registry of sources."""
 
+import json
 import jsonschema
 import logging
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Type, ClassVar
+from typing import Any, Dict, List, Type, ClassVar
+
+from streaming_analytics_demo.metrics import Metric
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +28,18 @@ def register_source(source_type: str):
     return wrapper
 
 
-def get_source(config: dict) -> "Source":
-    """Get a source from the config."""
+def get_source_class(config: dict) -> Type["Source"]:
+    """Get the class of the source described by the config."""
     source_type = config.get("type")
     source_class = _source_registry.get(source_type)
     if not source_class:
         raise ValueError(f"Unknown source type: {source_type}")
+    return source_class
+
+
+def get_source(config: dict) -> "Source":
+    """Get a source from the config."""
+    source_class = get_source_class(config)
     jsonschema.validate(config, source_class.config_schema)
     return source_class(config)
 
@@ -49,6 +58,15 @@ class Source(ABC):
         """All sources must be initialized with a config."""
         self.config = config
 
+    @classmethod
+    def partition(cls, config: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+        """Split a source's config into up to `count` configs covering the same data.
+
+        Used to spread a source across worker processes. Sources that can't be
+        split return their config unchanged, as the only partition.
+        """
+        return [config]
+
     def __del__(self):
         """By default, try to disconnect the source when the instance is garbage collected."""
         self.disconnect()
@@ -69,5 +87,34 @@ class Source(ABC):
 
     @abstractmethod
     async def receive(self) -> Any:
-        """Receive messages from the source."""
+        """Receive messages from the source.
+
+        Raises:
+            EOFError: If the source is finite and has no more messages
+        """
         raise NotImplementedError("Subclasses must implement this method")
+
+    async def receive_raw(self) -> str:
+        """Receive the next message exactly as the source delivered it.
+
+        Sources that read serialized frames should override this to return them
+        without decoding, the default implementation re-serializes the result of
+        receive.
+        """
+        return json.dumps(await self.receive())
+
+    def decode(self, frame: str) -> Any:
+        """Decode a frame returned by receive_raw into what receive would return."""
+        return json.loads(frame)
+
+    def stats(self) -> dict:
+        """Return a snapshot of the source's statistics, if it keeps any."""
+        return {}
+
+    def metrics(self) -> List[Metric]:
+        """Return the source's metrics for the metrics endpoint, if it keeps any.
+
+        Called each time the endpoint is scraped, so build them from totals the
+        source keeps anyway rather than doing extra work per message.
+        """
+        return []
@@ -0,0 +1,254 @@
+"""Supervisor running the listen pipeline across several worker processes."""
+
+import logging
+import multiprocessing
+import queue
+import time
+from typing import Any, Callable, Dict, List
+
+from streaming_analytics_demo.sinks.sink import get_sink_class
+from streaming_analytics_demo.sources.source import get_source_class
+
+logger = logging.getLogger(__name__)
+
+
+def worker_configs(config_data: Dict[str, Any], workers: int) -> List[Dict[str, Any]]:
+    """Split a listen config into one config per worker.
+
+    The source's config is split with `Source.partition`, so there may be fewer
+    configs than workers, and each sink's config is adapted with
+    `Sink.worker_config` so that workers don't share local files.
+    """
+    source_config = config_data["source"]
+    partitions = get_source_class(source_config).partition(source_config, workers)
+    configs = []
+    for i, partition in enumerate(partitions):
+        config = {**config_data, "source": partition}
+        if "sink" in config:
+            sink = config["sink"]
+            config["sink"] = get_sink_class(sink).worker_config(sink, i)
+        if "sinks" in config:
+            config["sinks"] = [
+                _with_spill_path(get_sink_class(sink).worker_config(sink, i), i)
+                for sink in config["sinks"]
+            ]
+        config = _with_spill_path(config, i)
+        if config.get("metrics", {}).get("port"):
+            # Each worker serves its own metrics
+            metrics = config["metrics"]
+            config["metrics"] = {**metrics, "port": metrics["port"] + i}
+        configs.append(config)
+    return configs
+
+
+def _with_spill_path(config: Dict[str, Any], worker: int) -> Dict[str, Any]:
+    """Give a worker a pipeline spill file of its own, if one is configured."""
+    pipeline = config.get("pipeline")
+    if not pipeline or "spill_path" not in pipeline:
+        return config
+    spill_path = f"{pipeline['spill_path']}.w{worker}"
+    return {**config, "pipeline": {**pipeline, "spill_path": spill_path}}
+
+
+class _Worker:
+    """A worker process and what the supervisor knows about it."""
+
+    def __init__(self, number: int, config: Dict[str, Any]):
+        """Initialize the worker's state, the process is started separately."""
+        self.number = number
+        self.config = config
+        self.process: multiprocessing.Process | None = None
+        self.started_at = 0.0
+        self.last_report = 0.0
+        self.restart_at: float | None = None
+        self.backoff_s = 0.0
+        self.restarts = 0
+        self.stats: Dict[str, Any] = {}
+        # Set once the worker's source has run out of messages
+        self.finished = False
+
+
+class Supervisor:
+    """Runs the listen pipeline in several worker processes and keeps them running.
+
+    Each worker runs its own source and sinks over a share of the source's
+    products, so decoding and insert serialization spread across cores. Workers
+    report their pipeline stats every `stats_interval_s`, which the supervisor
+    sums and logs at the same interval. A worker that exits is restarted after a
+    backoff that doubles up to `max_backoff_s`, and resets once a worker has run
+    for `max_backoff_s`. A worker that hasn't reported for three stats intervals
+    is considered hung and killed, then restarted the same way.
+
+    Workers are started with `spawn` and `target` is called in each with the
+    worker's config, its number and a queue to put `(number, stats)` reports on.
+    A worker whose source is finite (e.g. a replay) reports `(number, None)` once
+    it has read everything, and isn't restarted when it exits.
+    """
+
+    def __init__(
+        self,
+        config_data: Dict[str, Any],
+        workers: int,
+        target: Callable[[Dict[str, Any], int, Any], None],
+        restart_backoff_s: float = 1.0,
+        max_backoff_s: float = 60.0,
+        poll_interval_s: float = 1.0,
+    ):
+        """Initialize the supervisor.
+
+        Args:
+            config_data: The listen config to split across the workers
+            workers: The number of worker processes
+            target: The function each worker process runs
+            restart_backoff_s: Delay before the first restart of a worker
+            max_backoff_s: Limit on the delay between restarts
+            poll_interval_s: How often worker health is checked
+        """
+        self.target = target
+        self.restart_backoff_s = restart_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.poll_interval_s = poll_interval_s
+        self.stats_interval_s = (config_data.get("pipeline") or {}).get(
+            "stats_interval_s", 60
+        )
+        configs = worker_configs(config_data, workers)
+        if len(configs) < workers:
+            logger.info("Only %d workers have products to listen to", len(configs))
+        self.workers = [_Worker(i, config) for i, config in enumerate(configs)]
+
+        self._context = multiprocessing.get_context("spawn")
+        self._reports = self._context.Queue()
+        self._stats_logged_at = 0.0
+
+    def _start(self, worker: _Worker) -> None:
+        """Start a worker's process."""
+        worker.process = self._context.Process(
+            target=self.target,
+            args=(worker.config, worker.number, self._reports),
+            name=f"listen-worker-{worker.number}",
+        )
+        worker.process.start()
+        worker.started_at = worker.last_report = time.monotonic()
+        worker.restart_at = None
+        logger.info("Started worker %d (pid %d)", worker.number, worker.process.pid)
+
+    def start(self) -> None:
+        """Start every worker."""
+        for worker in self.workers:
+            self._start(worker)
+        self._stats_logged_at = time.monotonic()
+
+    def _collect_reports(self) -> None:
+        """Take the stats reported by the workers since the last poll."""
+        while True:
+            try:
+                number, stats = self._reports.get_nowait()
+            except queue.Empty:
+                return
+            worker = self.workers[number]
+            worker.last_report = time.monotonic()
+            if stats is None:
+                worker.finished = True
+            else:
+                worker.stats = stats
+
+    def _check(self, worker: _Worker, now: float) -> None:
+        """Restart a worker that has exited or hung, once its backoff has passed."""
+        if worker.restart_at is not None:
+            if now >= worker.restart_at:
+                worker.restarts += 1
+                self._start(worker)
+            return
+
+        health_timeout_s = 3 * self.stats_interval_s
+        if (
+            worker.process.is_alive()
+            and health_timeout_s
+            and now - worker.last_report > health_timeout_s
+        ):
+            logger.warning(
+                "Worker %d has not reported for %.0f s, killing it",
+                worker.number,
+                now - worker.last_report,
+            )
+            worker.process.kill()
+            worker.process.join()
+        if worker.process.is_alive() or worker.finished:
+            return
+
+        if now - worker.started_at >= self.max_backoff_s:
+            # It ran long enough that this isn't a crash loop
+            worker.backoff_s = 0.0
+        worker.backoff_s = min(
+            max(worker.backoff_s * 2, self.restart_backoff_s), self.max_backoff_s
+        )
+        worker.restart_at = now + worker.backoff_s
+        logger.warning(
+            "Worker %d exited with code %s, restarting in %.1f s",
+            worker.number,
+            worker.process.exitcode,
+            worker.backoff_s,
+        )
+
+    def poll(self) -> None:
+        """Collect worker stats, restart workers as needed and log the stats when due."""
+        self._collect_reports()
+        now = time.monotonic()
+        for worker in self.workers:
+            self._check(worker, now)
+        if (
+            self.stats_interval_s
+            and now - self._stats_logged_at >= self.stats_interval_s
+        ):
+            self._stats_logged_at = now
+            logger.info("Supervisor stats", extra={"extra_fields": self.stats()})
+
+    def stats(self) -> dict:
+        """Return the workers' latest stats summed, with the health of the workers."""
+        stats: Dict[str, Any] = {
+            "workers": len(self.workers),
+            "workers_alive": sum(
+                1 for w in self.workers if w.process and w.process.is_alive()
+            ),
+            "restarts": sum(w.restarts for w in self.workers),
+        }
+        for worker in self.workers:
+            for key, value in worker.stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stats[key] = stats.get(key, 0) + value
+        return stats
+
+    def stop(self, timeout_s: float = 30.0) -> None:
+        """Stop every worker, giving them the chance to flush their sinks."""
+        running = [
+            w.process for w in self.workers if w.process and w.process.is_alive()
+        ]
+        for process in running:
+            # Workers ignore SIGINT, which Ctrl-C has already sent them, and
+            # shut down cleanly on SIGTERM
+            process.terminate()
+        deadline = time.monotonic() + timeout_s
+        for process in running:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning("Worker pid %d did not stop, killing", process.pid)
+                process.kill()
+                process.join()
+        logger.info("Workers stopped", extra={"extra_fields": self.stats()})
+
+    @property
+    def finished(self) -> bool:
+        """Check whether every worker has finished and exited."""
+        return all(w.finished and not w.process.is_alive() for w in self.workers)
+
+    def run(self) -> None:
+        """Run the workers until interrupted, or until they have all finished."""
+        self.start()
+        try:
+            while not self.finished:
+                time.sleep(self.poll_interval_s)
+                self.poll()
+        except KeyboardInterrupt:
+            logger.info("Received interrupt, stopping workers...")
+        finally:
+            self.stop()
@@ -1,5 +1,6 @@
 """Utility functions."""
 
-from .logging_config import setup_logging
+from .logging_config import RateLimiter, setup_logging
+from .timestamps import to_epoch_micros
 
-__all__ = ["setup_logging"]
+__all__ = ["RateLimiter", "setup_logging", "to_epoch_micros"]
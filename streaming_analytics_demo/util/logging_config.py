@@ -1,8 +1,20 @@
 """Logging configuration for the application."""
 
+import atexit
+import copy
 import logging
+from logging.handlers import QueueHandler, QueueListener
 import json
+import queue
+import time
 from datetime import datetime, timezone
+from typing import List
+
+from streaming_analytics_demo.metrics import REGISTRY, Metric, counter
+
+# The listener writing the records queued by the current configuration
+_listener: QueueListener | None = None
+_queue_handler: "_DroppingQueueHandler | None" = None
 
 
 class JSONFormatter(logging.Formatter):
@@ -17,9 +29,11 @@ class JSONFormatter(logging.Formatter):
         Returns:
             str: JSON formatted log entry
         """
-        # Base log data
+        # Base log data, timestamped when the record was made rather than written
         log_data = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": datetime.fromtimestamp(
+                record.created, timezone.utc
+            ).isoformat(),
             "system": "streaming_analytics_demo",
             "level": record.levelname,
             "logger": record.name,
@@ -30,28 +44,132 @@ class JSONFormatter(logging.Formatter):
         if hasattr(record, "extra_fields"):
             log_data.update(record.extra_fields)
 
-        # Add exception info if it exists
+        # Add exception info if it exists, already formatted if it was queued
         if record.exc_info:
             log_data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_data["exception"] = record.exc_text
 
         return json.dumps(log_data)
 
 
-def setup_logging(level: int = logging.INFO) -> None:
+class _DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records rather than wait when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        """Initialize the handler."""
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge the arguments into the message, leaving the JSON to the listener.
+
+        The arguments are merged before the record is queued, as they may change
+        by the time it's written, e.g. a message dict modified by a later stage.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Queue a record, dropping it if the queue is full."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimiter:
+    """Token bucket limiting how often something happens, e.g. a per-message log.
+
+    Check `logger.isEnabledFor` first so a disabled level costs nothing:
+
+        if debug and limiter.allow():
+            logger.debug(...)
+    """
+
+    def __init__(self, per_second: float, burst: int = 1):
+        """Initialize the limiter.
+
+        Args:
+            per_second: The sustained rate allowed
+            burst: How many may happen at once after a quiet spell
+        """
+        self.per_second = per_second
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def allow(self) -> bool:
+        """Check whether it may happen now, using up a token if so."""
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.per_second
+        )
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+def setup_logging(level: int = logging.INFO, queue_size: int = 10000) -> None:
     """Set up logging configuration.
 
+    Records are put on a queue and formatted and written by a background thread,
+    so logging never blocks the event loop on JSON encoding or a slow stdout. If
+    the writer falls `queue_size` records behind, further records are dropped
+    and counted in the `ingest_log_records_dropped_total` metric. Queued records
+    are written when the process exits normally.
+
     Args:
         level: The logging level to use
+        queue_size: The most records waiting to be written
     """
-    # Create handler for stdout
+    global _listener, _queue_handler
+
+    # Create handler for stdout, run by the listener's thread
     handler = logging.StreamHandler()
     handler.setFormatter(JSONFormatter())
+    if _queue_handler is None:
+        REGISTRY.add_collector(_metrics)
+    stop_logging()
+    _queue_handler = _DroppingQueueHandler(queue.Queue(queue_size))
+    _listener = QueueListener(_queue_handler.queue, handler)
+    _listener.start()
+    atexit.register(stop_logging)
 
     # Configure root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
-    root_logger.addHandler(handler)
+    root_logger.addHandler(_queue_handler)
 
     # Remove any existing handlers (to avoid duplicates)
     for old_handler in root_logger.handlers[:-1]:
         root_logger.removeHandler(old_handler)
+
+
+def stop_logging() -> None:
+    """Stop the background writer, once it has written every queued record."""
+    global _listener
+
+    if _listener:
+        _listener.stop()
+        _listener = None
+        atexit.unregister(stop_logging)
+
+
+def _metrics() -> List[Metric]:
+    """Return the number of log records dropped."""
+    return [
+        counter(
+            "ingest_log_records_dropped_total",
+            "Log records dropped because the writer fell behind",
+            (),
+            {(): _queue_handler.dropped if _queue_handler else 0},
+        )
+    ]
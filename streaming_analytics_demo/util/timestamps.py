@@ -0,0 +1,25 @@
+"""Timestamp conversion helpers."""
+
+from datetime import datetime, timedelta, timezone
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch_micros(value: str | int | datetime) -> int:
+    """Convert a timestamp to integer microseconds since the Unix epoch.
+
+    Args:
+        value: An ISO 8601 string, a datetime (naive values are taken to be UTC)
+            or an integer that is already in epoch microseconds
+
+    Returns:
+        int: Microseconds since 1970-01-01T00:00:00Z
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _ONE_MICROSECOND
@@ -0,0 +1,57 @@
+"""Tests for dropping duplicate messages."""
+
+from streaming_analytics_demo.pipeline.dedup import Deduplicator
+
+
+def _trade(trade_id, product_id="BTC-USD", type="ticker"):
+    """Return a message for a trade."""
+    return {"type": type, "product_id": product_id, "trade_id": trade_id}
+
+
+def test_duplicates_within_the_window():
+    """A key seen among the recent ones of its product and type is a duplicate."""
+    dedup = Deduplicator("trade_id", window=10)
+    messages = [
+        _trade(1),
+        _trade(2),
+        _trade(1),
+        _trade(1, "ETH-USD"),
+        _trade(2, type="match"),
+        {"type": "heartbeat", "product_id": "BTC-USD"},
+        {"type": "heartbeat", "product_id": "BTC-USD"},
+        _trade(2),
+    ]
+    assert [dedup.is_duplicate(m) for m in messages] == [
+        False,
+        False,
+        True,
+        False,
+        False,
+        False,
+        False,
+        True,
+    ]
+    assert dedup.duplicates == {"BTC-USD": 2}
+    assert dedup.stats() == {"duplicates": 2}
+
+
+def test_last_match_repeating_a_match():
+    """The last_match sent on resubscribing is a duplicate of the match it repeats."""
+    dedup = Deduplicator("trade_id", window=10)
+    assert not dedup.is_duplicate(_trade(1, type="match"))
+    assert dedup.is_duplicate(_trade(1, type="last_match"))
+    assert not dedup.is_duplicate(_trade(2, type="last_match"))
+    assert dedup.is_duplicate(_trade(2, type="match"))
+    assert dedup.duplicates == {"BTC-USD": 2}
+
+
+def test_memory_is_bounded():
+    """Only the last `window` keys per product and type are remembered."""
+    dedup = Deduplicator("sequence", window=3)
+    for sequence in range(100):
+        assert not dedup.is_duplicate({"product_id": "BTC-USD", "sequence": sequence})
+    (recent,) = dedup._recent.values()
+    assert sorted(recent.keys) == [97, 98, 99]
+    assert dedup.is_duplicate({"product_id": "BTC-USD", "sequence": 98})
+    # Forgotten, so no longer recognized
+    assert not dedup.is_duplicate({"product_id": "BTC-USD", "sequence": 50})
@@ -0,0 +1,251 @@
+"""Tests for the source to sink pipeline."""
+
+import asyncio
+import json
+import logging
+import pytest
+from jsonschema import ValidationError
+from unittest.mock import AsyncMock, MagicMock
+
+from streaming_analytics_demo.metrics import REGISTRY
+from streaming_analytics_demo.pipeline import Pipeline
+
+
+@pytest.mark.asyncio
+async def test_reads_continue_while_sink_is_slow():
+    """The reader keeps filling the queue while a write is in progress."""
+    messages = [{"n": i} for i in range(10)]
+    source = AsyncMock()
+    source.receive = AsyncMock(side_effect=[*messages, KeyboardInterrupt])
+    sink = AsyncMock()
+    received_during_write = []
+
+    async def slow_write(batch):
+        received_during_write.append(pipeline.received)
+        await asyncio.sleep(0.01)
+
+    sink.raw_passthrough = False
+    sink.write_records = AsyncMock(side_effect=slow_write)
+    pipeline = Pipeline(source, sink, {"batch_size": 2, "stats_interval_s": 0})
+    await pipeline.run()
+
+    written = [m for call in sink.write_records.await_args_list for m in call.args[0]]
+    assert written == messages
+    assert max(received_during_write) == len(messages)
+    assert pipeline.stats()["written"] == len(messages)
+
+
+@pytest.mark.asyncio
+async def test_multiple_writers_drain_queue():
+    """Several writers share the queue between them."""
+    messages = [{"n": i} for i in range(20)]
+    source = AsyncMock()
+    source.receive = AsyncMock(side_effect=[*messages, KeyboardInterrupt])
+    sink = AsyncMock()
+    pipeline = Pipeline(
+        source, sink, {"writers": 3, "batch_size": 1, "stats_interval_s": 0}
+    )
+    await pipeline.run()
+
+    written = [m for call in sink.write_records.await_args_list for m in call.args[0]]
+    assert sorted(m["n"] for m in written) == list(range(20))
+
+
+@pytest.mark.asyncio
+async def test_raw_passthrough():
+    """Sinks that want raw frames get them without any decoding."""
+    frames = ['{"n": 0}', '{"n": 1}']
+    source = AsyncMock()
+    source.receive_raw = AsyncMock(side_effect=[*frames, KeyboardInterrupt])
+    sink = AsyncMock()
+    sink.raw_passthrough = True
+    pipeline = Pipeline(source, sink, {"stats_interval_s": 0})
+    await pipeline.run()
+
+    source.receive.assert_not_awaited()
+    sink.write_records.assert_not_awaited()
+    written = [m for call in sink.write_batch.await_args_list for m in call.args[0]]
+    assert written == frames
+
+
+def test_invalid_config():
+    """Unknown overflow policies are rejected."""
+    with pytest.raises(ValidationError):
+        Pipeline(AsyncMock(), AsyncMock(), {"overflow": "explode"})
+
+
+def _sink(raw=False, delay=0.0):
+    """Create a mock sink recording what it is given, optionally slowly."""
+    sink = AsyncMock()
+    sink.raw_passthrough = raw
+    sink.written = []
+
+    async def write(batch):
+        await asyncio.sleep(delay)
+        sink.written.extend(batch)
+
+    sink.write_records = AsyncMock(side_effect=write)
+    sink.write_batch = AsyncMock(side_effect=write)
+    return sink
+
+
+@pytest.mark.asyncio
+async def test_fan_out_slow_sink_does_not_throttle_others():
+    """Every sink gets every message, and a slow one doesn't hold up the rest."""
+    messages = [{"n": i} for i in range(50)]
+    source = AsyncMock()
+    source.receive = AsyncMock(side_effect=[*messages, KeyboardInterrupt])
+    fast, slow = _sink(), _sink(delay=0.01)
+    fast_done_at = []
+
+    async def fast_write(batch):
+        fast.written.extend(batch)
+        if len(fast.written) == len(messages):
+            fast_done_at.append(len(slow.written))
+
+    fast.write_records = AsyncMock(side_effect=fast_write)
+    pipeline = Pipeline(
+        source,
+        [fast, slow],
+        {"queue_size": 5, "batch_size": 5, "stats_interval_s": 0},
+    )
+    await pipeline.run()
+
+    assert fast.written == messages
+    assert slow.written == messages
+    # The fast sink had everything while the slow one was still working through it
+    assert fast_done_at[0] < len(messages)
+    stats = pipeline.stats()
+    assert stats["written"] == 2 * len(messages)
+    assert [s["written"] for s in stats["sinks"]] == [len(messages)] * 2
+    assert stats["sinks"][1]["queue_spilled"] > 0
+
+
+@pytest.mark.asyncio
+async def test_fan_out_raw_and_decoded():
+    """Raw sinks get frames and the others records, decoded once."""
+    frames = ['{"n": 0}', '{"n": 1}']
+    source = AsyncMock()
+    source.receive_raw = AsyncMock(side_effect=[*frames, KeyboardInterrupt])
+    source.decode = MagicMock(side_effect=json.loads)
+    raw, decoded = _sink(raw=True), _sink()
+    await Pipeline(source, [raw, decoded], {"stats_interval_s": 0}).run()
+
+    source.receive.assert_not_awaited()
+    assert source.decode.call_count == len(frames)
+    assert raw.written == frames
+    assert decoded.written == [{"n": 0}, {"n": 1}]
+
+
+def test_per_sink_overrides():
+    """Entries of sinks override the shared queue settings by position."""
+    pipeline = Pipeline(
+        AsyncMock(),
+        [_sink(), _sink()],
+        {"batch_size": 10, "sinks": [None, {"batch_size": 20, "overflow": "block"}]},
+    )
+    assert [b.batch_size for b in pipeline.branches] == [10, 20]
+    assert [b.queue.overflow for b in pipeline.branches] == ["spill", "block"]
+
+
+@pytest.mark.asyncio
+async def test_metrics():
+    """The pipeline reports its stages' metrics while it runs."""
+    messages = [{"n": i} for i in range(5)]
+    source = AsyncMock()
+    source.receive = AsyncMock(side_effect=[*messages, KeyboardInterrupt])
+    source.metrics = MagicMock(return_value=[])
+    sink = _sink()
+    sink.metrics = MagicMock(return_value=[])
+    pipeline = Pipeline(source, sink, {"batch_size": 2, "stats_interval_s": 0})
+
+    rendered = []
+
+    async def scrape(batch):
+        rendered.append(REGISTRY.render())
+
+    sink.write_records = AsyncMock(side_effect=scrape)
+    await pipeline.run()
+
+    assert "ingest_messages_received_total" in rendered[0]
+    assert "ingest_messages_received_total" not in REGISTRY.render()
+    metrics = {metric.name: metric for metric in pipeline.metrics()}
+    assert metrics["ingest_messages_received_total"].labels().value == 5
+    assert metrics["ingest_last_received_timestamp_seconds"].labels().value > 0
+    labels = (type(sink).__name__, "0")
+    assert metrics["ingest_messages_written_total"].labels(*labels).value == 5
+    batch_sizes = metrics["ingest_batch_size"].labels(*labels)
+    assert sum(batch_sizes.counts) == 3
+    assert batch_sizes.sum == 5
+
+
+@pytest.mark.asyncio
+async def test_debug_logging_is_rate_limited(caplog):
+    """At debug level, only a few of the received messages are logged."""
+    messages = [{"n": i} for i in range(100)]
+    source = AsyncMock()
+    source.receive = AsyncMock(side_effect=[*messages, KeyboardInterrupt])
+    pipeline = Pipeline(source, _sink(), {"stats_interval_s": 0})
+    with caplog.at_level(logging.DEBUG, "streaming_analytics_demo.pipeline"):
+        await pipeline.run()
+
+    logged = [
+        r for r in caplog.records if r.getMessage().startswith("Received message")
+    ]
+    assert len(logged) == 1
+
+
+@pytest.mark.asyncio
+async def test_transforms_per_sink():
+    """Each sink gets the records its transforms let through, counted when dropped."""
+    frames = ['{"type": "ticker", "price": 1.0}', '{"type": "heartbeat"}']
+    source = AsyncMock()
+    source.receive_raw = AsyncMock(side_effect=[*frames, KeyboardInterrupt])
+    source.decode = MagicMock(side_effect=json.loads)
+    archive = _sink(raw=True)
+    filtered = _sink(raw=True)
+    pipeline = Pipeline(
+        source,
+        [archive, filtered],
+        {
+            "stats_interval_s": 0,
+            "sinks": [
+                None,
+                {
+                    "transforms": [
+                        {"filter": {"type": ["ticker"]}},
+                        {"project": ["price"]},
+                    ]
+                },
+            ],
+        },
+    )
+    await pipeline.run()
+
+    assert archive.written == frames
+    # A raw sink with transforms is handed records instead of frames
+    assert filtered.written == [{"price": 1.0}]
+    assert [s["filtered"] for s in pipeline.stats()["sinks"]] == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_dedup():
+    """Messages received again are dropped before any sink, raw sinks included."""
+    frames = [
+        json.dumps({"type": "ticker", "product_id": "BTC-USD", "trade_id": n})
+        for n in [1, 2, 1, 3, 2]
+    ]
+    source = AsyncMock()
+    source.receive_raw = AsyncMock(side_effect=[*frames, KeyboardInterrupt])
+    source.decode = MagicMock(side_effect=json.loads)
+    sink = _sink(raw=True)
+    sink.metrics = MagicMock(return_value=[])
+    source.metrics = MagicMock(return_value=[])
+    pipeline = Pipeline(source, sink, {"stats_interval_s": 0, "dedup": {}})
+    await pipeline.run()
+
+    assert sink.written == [frames[0], frames[1], frames[3]]
+    assert pipeline.stats()["received"] == 5
+    assert pipeline.stats()["duplicates"] == 2
+    metrics = {metric.name: metric for metric in pipeline.metrics()}
+    assert metrics["ingest_duplicates_dropped_total"].labels("BTC-USD").value == 2
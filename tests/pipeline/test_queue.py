@@ -0,0 +1,77 @@
+"""Tests for the bounded queue and its overflow policies."""
+
+import asyncio
+import pytest
+
+from streaming_analytics_demo.pipeline import BoundedQueue
+
+
+@pytest.mark.asyncio
+async def test_get_batch_in_order():
+    """Items come out in the order they went in, up to the batch size."""
+    queue = BoundedQueue(10)
+    for i in range(5):
+        await queue.put(i)
+    assert await queue.get_batch(3) == [0, 1, 2]
+    assert await queue.get_batch(3) == [3, 4]
+    assert queue.high_water == 5
+
+
+@pytest.mark.asyncio
+async def test_block_waits_for_space():
+    """With the block policy a put on a full queue waits for a get."""
+    queue = BoundedQueue(2)
+    await queue.put(1)
+    await queue.put(2)
+    put = asyncio.create_task(queue.put(3))
+    await asyncio.sleep(0)
+    assert not put.done()
+
+    assert await queue.get_batch(1) == [1]
+    await put
+    assert await queue.get_batch(10) == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest():
+    """With the drop_oldest policy the oldest items are discarded."""
+    queue = BoundedQueue(2, overflow="drop_oldest")
+    for i in range(4):
+        await queue.put(i)
+    assert await queue.get_batch(10) == [2, 3]
+    assert queue.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_spill_preserves_order(tmp_path):
+    """With the spill policy overflow goes to disk and is read back in order."""
+    queue = BoundedQueue(2, overflow="spill", spill_path=str(tmp_path / "spill"))
+    for i in range(5):
+        await queue.put({"n": i})
+    assert queue.depth == 5
+    assert queue.spilled == 3
+
+    assert await queue.get_batch(2) == [{"n": 0}, {"n": 1}]
+    await queue.put({"n": 5})
+    assert await queue.get_batch(10) == [{"n": i} for i in range(2, 6)]
+    assert queue.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_close_drains_then_stops():
+    """A closed queue hands out what is left and then empty batches."""
+    queue = BoundedQueue(10)
+    await queue.put(1)
+    queue.close()
+    assert await queue.get_batch(10) == [1]
+    assert await queue.get_batch(10) == []
+
+
+@pytest.mark.asyncio
+async def test_close_wakes_waiting_getter():
+    """Closing the queue releases a getter waiting on an empty queue."""
+    queue = BoundedQueue(10)
+    getter = asyncio.create_task(queue.get_batch(10))
+    await asyncio.sleep(0)
+    queue.close()
+    assert await getter == []
@@ -0,0 +1,76 @@
+"""Tests for the declarative record transforms."""
+
+import jsonschema
+import pytest
+
+from streaming_analytics_demo.pipeline import compile_transforms
+from streaming_analytics_demo.pipeline.transforms import TRANSFORMS_SCHEMA
+
+_TICKER = {
+    "type": "ticker",
+    "product_id": "BTC-USD",
+    "price": 100.0,
+    "last_size": 0.5,
+    "best_bid": 99.0,
+    "best_ask": 101.0,
+    "time": 1738411200000000,
+}
+_HEARTBEAT = {"type": "heartbeat", "product_id": "BTC-USD", "sequence": 1}
+
+
+def test_filter_and_drop():
+    """Records are kept or dropped by their field values."""
+    keep = compile_transforms([{"filter": {"type": ["ticker"]}}])
+    assert keep(_TICKER) is _TICKER
+    assert keep(_HEARTBEAT) is None
+
+    drop = compile_transforms(
+        [{"drop": {"type": ["ticker"], "product_id": ["BTC-USD"]}}]
+    )
+    assert drop(_TICKER) is None
+    assert drop({**_TICKER, "product_id": "ETH-USD"})["product_id"] == "ETH-USD"
+
+
+def test_chain():
+    """Steps apply in order and never modify the record they are given."""
+    original = dict(_TICKER)
+    transform = compile_transforms(
+        [
+            {"filter": {"type": ["ticker"]}},
+            {"derive": ["spread", "mid", "notional"]},
+            {"rename": {"last_size": "size"}},
+            {"project": ["time", "product_id", "price", "size", "spread", "mid"]},
+        ]
+    )
+    assert transform(_TICKER) == {
+        "time": 1738411200000000,
+        "product_id": "BTC-USD",
+        "price": 100.0,
+        "size": 0.5,
+        "spread": 2.0,
+        "mid": 100.0,
+    }
+    assert _TICKER == original
+    assert transform(_HEARTBEAT) is None
+
+
+def test_derive_skips_records_without_the_fields():
+    """Fields that can't be derived are left out, strings are parsed."""
+    derive = compile_transforms([{"derive": ["spread"]}])
+    assert derive(_HEARTBEAT) is _HEARTBEAT
+    assert derive({"best_bid": "99.5", "best_ask": "100"})["spread"] == 0.5
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        [{"filter": {"type": ["ticker"]}, "project": ["price"]}],
+        [{"derive": ["unknown"]}],
+        [{"project": []}],
+        [{"sort": ["price"]}],
+    ],
+)
+def test_invalid_chains(steps):
+    """Each step has a single valid kind."""
+    with pytest.raises(jsonschema.ValidationError):
+        jsonschema.validate(steps, TRANSFORMS_SCHEMA)
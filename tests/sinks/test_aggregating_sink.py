@@ -0,0 +1,150 @@
+"""Tests for the aggregating sink."""
+
+import json
+import pytest
+
+from jsonschema import ValidationError
+
+from streaming_analytics_demo.sinks import AggregatingSink, get_sink
+
+_MINUTE = 60_000_000
+_START = 1738411200000000  # 2025-02-01T12:00:00Z
+
+
+def _trade(seconds, price, size, product_id="BTC-USD"):
+    """Return a decoded ticker message for a trade at a time after _START."""
+    return {
+        "type": "ticker",
+        "product_id": product_id,
+        "price": price,
+        "last_size": size,
+        "time": _START + int(seconds * 1e6),
+    }
+
+
+def _written(file_path):
+    """Read back the rows written to the file sink."""
+    with open(file_path) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Return an aggregating sink config writing windows to a file."""
+    return {
+        "type": "aggregate",
+        "window_s": 60,
+        "allowed_lateness_s": 5,
+        "sink": {
+            "type": "file",
+            "file_path": str(tmp_path / "windows.jsonl"),
+            "flush_interval_s": 0,
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_windows_closed_by_watermark(config):
+    """A window is written once the latest trade is allowed_lateness_s past its end."""
+    sink = get_sink(config)
+    await sink.connect()
+    await sink.write_records(
+        [
+            _trade(10, 100.0, 1.0),
+            {"type": "heartbeat", "product_id": "BTC-USD", "time": _START},
+            _trade(5, 90.0, 2.0),  # earlier than the first, so the open
+            _trade(30, 110.0, 1.0, "ETH-USD"),
+            _trade(50, 105.0, 0.5),
+            _trade(62, 104.0, 1.0),
+        ]
+    )
+    await sink.flush()
+    assert _written(config["sink"]["file_path"]) == []
+
+    # Within the lateness, still counted in the first window
+    await sink.write_records([_trade(59, 95.0, 1.0), _trade(66, 104.0, 1.0)])
+    await sink.flush()
+    assert _written(config["sink"]["file_path"]) == [
+        {
+            "product_id": "BTC-USD",
+            "window_start": _START,
+            "open": 90.0,
+            "high": 105.0,
+            "low": 90.0,
+            "close": 95.0,
+            "volume": 4.5,
+            "notional": 100.0 + 180.0 + 52.5 + 95.0,
+            "trades": 4,
+        },
+        {
+            "product_id": "ETH-USD",
+            "window_start": _START,
+            "open": 110.0,
+            "high": 110.0,
+            "low": 110.0,
+            "close": 110.0,
+            "volume": 1.0,
+            "notional": 110.0,
+            "trades": 1,
+        },
+    ]
+    assert sink.windows_written == 2
+    await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_late_trades_dropped(config):
+    """Trades for a window that was already written are dropped and counted."""
+    sink = get_sink(config)
+    await sink.connect()
+    await sink.write_records([_trade(10, 100.0, 1.0), _trade(70, 100.0, 1.0)])
+    await sink.write_records([_trade(20, 100.0, 1.0)])
+    assert sink.late_trades == 1
+    metrics = {metric.name: metric for metric in sink.metrics()}
+    assert metrics["ingest_aggregate_late_trades_total"].labels().value == 1
+    assert "ingest_file_rotations_total" in metrics
+    await sink.disconnect()
+
+    rows = _written(config["sink"]["file_path"])
+    assert [(row["window_start"], row["trades"]) for row in rows] == [
+        (_START, 1),
+        (_START + _MINUTE, 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_undecoded_messages(config):
+    """Messages with string values, as decoded without a decoder, are aggregated."""
+    sink = get_sink(config)
+    await sink.connect()
+    await sink.write(
+        json.dumps(
+            {
+                "type": "match",
+                "product_id": "BTC-USD",
+                "price": "100.5",
+                "size": "0.25",
+                "time": "2025-02-01T12:00:01.000000Z",
+            }
+        )
+    )
+    await sink.disconnect()
+
+    (row,) = _written(config["sink"]["file_path"])
+    assert row["window_start"] == _START
+    assert row["volume"] == 0.25
+    assert row["notional"] == 100.5 * 0.25
+
+
+def test_worker_config(config):
+    """The wrapped sink's config is adapted for each worker."""
+    worker = AggregatingSink.worker_config(config, 1)
+    assert worker["sink"]["file_path"].endswith("windows-w1.jsonl")
+
+
+def test_config_validation(config):
+    """A sink to write to is required, and its own config is validated."""
+    with pytest.raises(ValidationError):
+        get_sink({"type": "aggregate"})
+    with pytest.raises(ValidationError):
+        get_sink({**config, "sink": {"type": "file"}})
@@ -0,0 +1,145 @@
+"""Test suite for the native protocol ClickHouse sink."""
+
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+
+from streaming_analytics_demo.sinks import ClickHouseNativeSink, get_sink
+
+
+@pytest.fixture
+def config():
+    """Return a native sink config for the ticker table."""
+    return {
+        "type": "clickhouse_native",
+        "host": "localhost",
+        "port": 9000,
+        "database": "coinbase_demo",
+        "table": "coinbase_ticker",
+        "user": "default",
+        "password": "",
+    }
+
+
+@pytest.fixture
+def record():
+    """Return a decoded ticker message."""
+    return {
+        "type": "ticker",
+        "sequence": 98545870695,
+        "product_id": "BTC-USD",
+        "price": 101496.91,
+        "side": "sell",
+        "time": 1738634406419368,
+        "trade_id": 774546408,
+    }
+
+
+def _new_client(*args, **kwargs):
+    """Stand in for clickhouse_driver.Client, describing a DateTime64(3) time column."""
+    client = MagicMock()
+    client.kwargs = kwargs
+    client.inserts = []
+
+    def execute(query, data=None, columnar=False):
+        if query.startswith("DESCRIBE"):
+            return [
+                ("sequence", "UInt64"),
+                ("product_id", "String"),
+                ("price", "Float64"),
+                ("side", "String"),
+                ("time", "DateTime64(3)"),
+                ("trade_id", "UInt64"),
+            ]
+        client.inserts.append((query, [list(column) for column in data], columnar))
+
+    client.execute.side_effect = execute
+    return client
+
+
+@pytest.fixture
+def mock_driver():
+    """Patch the native driver, recording every client created."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_native_sink.clickhouse_driver"
+    ) as driver:
+        driver.clients = []
+
+        def create(*args, **kwargs):
+            client = _new_client(*args, **kwargs)
+            driver.clients.append(client)
+            return client
+
+        driver.Client.side_effect = create
+        yield driver
+
+
+@pytest.mark.asyncio
+async def test_inserts_columns_over_native_protocol(config, mock_driver, record):
+    """Batches are inserted as compressed columnar blocks with times scaled."""
+    sink = get_sink({**config, "max_rows": 2})
+    assert isinstance(sink, ClickHouseNativeSink)
+    await sink.connect()
+    client = mock_driver.clients[0]
+    assert client.kwargs["compression"] == "lz4"
+    assert client.kwargs["port"] == 9000
+
+    await sink.write_records([record, {**record, "trade_id": 774546409}])
+    await sink.flush()
+
+    ((query, columns, columnar),) = client.inserts
+    assert query == (
+        "INSERT INTO coinbase_ticker "
+        "(`sequence`, `product_id`, `price`, `side`, `time`, `trade_id`) VALUES"
+    )
+    assert columnar is True
+    assert columns[1] == ["BTC-USD", "BTC-USD"]
+    assert columns[4] == [1738634406419, 1738634406419]
+    assert columns[5] == [774546408, 774546409]
+    assert sink.rows_written == 2
+
+    await sink.disconnect()
+    client.disconnect.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_compression_none(config, mock_driver):
+    """Compression can be turned off."""
+    sink = get_sink({**config, "compression": "none"})
+    await sink.connect()
+    assert mock_driver.clients[0].kwargs["compression"] is False
+    await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_client_per_in_flight_insert(config, mock_driver, record):
+    """Concurrent inserts each get their own connection, and all are closed."""
+    release = threading.Event()
+    sink = get_sink({**config, "max_in_flight": 2})
+    await sink.connect()
+    first = mock_driver.clients[0]
+    describe = first.execute.side_effect
+    first.execute.side_effect = lambda *args, **kwargs: (
+        release.wait(5),
+        describe(*args, **kwargs),
+    )
+
+    await sink.write_record(record)
+    await sink.write_record(record)
+    assert len(mock_driver.clients) == 2
+    release.set()
+    await sink.flush()
+    assert sink.rows_written == 2
+
+    await sink.disconnect()
+    for client in mock_driver.clients:
+        client.disconnect.assert_called_once()
+
+
+def test_config_validation(config):
+    """Native sink options are validated."""
+    get_sink({**config, "compression": "zstd", "secure": True})
+    with pytest.raises(Exception):
+        get_sink({**config, "compression": "snappy"})
+    with pytest.raises(Exception):
+        get_sink({**config, "type": "clickhouse_connect", "compression": "lz4"})
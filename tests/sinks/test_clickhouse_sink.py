@@ -1,13 +1,19 @@
 """Test suite for ClickHouse sink."""
 
+import asyncio
 import json
+import threading
 import yaml
 import pytest
 from pathlib import Path
+from array import array
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock, patch
-from datetime import datetime
 
-from streaming_analytics_demo.sinks import get_sink
+from clickhouse_connect.datatypes.registry import get_from_name
+
+from streaming_analytics_demo.sinks import ClickHouseConnectSink, get_sink
+from streaming_analytics_demo.sinks.spool import SegmentSpool
 
 
 @pytest.fixture
@@ -45,11 +51,56 @@ def sample_message():
     }
 
 
+# Column types of the coinbase_ticker table in sql/coinbase_ticker.sql
+_ticker_column_types = {
+    "sequence": "UInt64",
+    "trade_id": "UInt64",
+    "price": "Float64",
+    "last_size": "Float64",
+    "time": "DateTime",
+    "product_id": "LowCardinality(String)",
+    "side": "LowCardinality(String)",
+    "open_24h": "Float64",
+    "volume_24h": "Float64",
+    "low_24h": "Float64",
+    "high_24h": "Float64",
+    "volume_30d": "Float64",
+    "best_bid": "Float64",
+    "best_bid_size": "Float64",
+    "best_ask": "Float64",
+    "best_ask_size": "Float64",
+}
+
+
+def _create_insert_context(table, column_names, column_oriented):
+    """Stand in for Client.create_insert_context using the ticker table's types."""
+    return SimpleNamespace(
+        table=table,
+        column_names=column_names,
+        column_types=[get_from_name(_ticker_column_types[c]) for c in column_names],
+        column_oriented=column_oriented,
+        data=None,
+    )
+
+
+def _inserted_rows(client, call=-1):
+    """Return the rows of an insert as dicts, keyed by column name."""
+    context = client.inserted[call]
+    return [dict(zip(context.column_names, row)) for row in zip(*context.data)]
+
+
 @pytest.fixture
 def mock_client():
     """Create a mock ClickHouse client."""
     client = MagicMock()
-    client.insert = MagicMock()
+    # The sink reuses insert contexts, so keep a copy of each one as it's inserted
+    client.inserted = []
+    client.insert = MagicMock(
+        side_effect=lambda context: client.inserted.append(
+            SimpleNamespace(**{**vars(context), "data": list(context.data)})
+        )
+    )
+    client.create_insert_context = MagicMock(side_effect=_create_insert_context)
     client.close = AsyncMock()
     return client
 
@@ -87,13 +138,11 @@ async def test_write_ticker_message(valid_config, mock_client, sample_message):
 
         await sink.write(json.dumps(sample_message))
 
+        await sink._wait_for_inserts()
         mock_client.insert.assert_called_once()
-        args = mock_client.insert.call_args[1]
-
-        # Verify data types of converted fields
-        data = args["data"][0]
-        column_names = args["column_names"]
-        row_data = dict(zip(column_names, data))
+        context = mock_client.inserted[0]
+        assert context.column_oriented is True
+        row_data = _inserted_rows(mock_client)[0]
 
         # Test numeric conversions
         assert isinstance(row_data["sequence"], int)
@@ -114,8 +163,13 @@ async def test_write_ticker_message(valid_config, mock_client, sample_message):
         assert isinstance(row_data["product_id"], str)
         assert isinstance(row_data["side"], str)
 
-        # Test datetime conversion
-        assert isinstance(row_data["time"], datetime)
+        # Test datetime conversion, DateTime columns take epoch seconds
+        assert row_data["time"] == 1738634406
+
+        # Numeric columns are built as typed arrays
+        columns = dict(zip(context.column_names, context.data))
+        assert columns["price"].typecode == "d"
+        assert columns["trade_id"].typecode == "Q"
 
         # Verify type field was removed
         assert "type" not in row_data
@@ -175,3 +229,401 @@ def test_config_validation():
     with pytest.raises(Exception) as exc_info:
         get_sink(invalid_config)
     assert "port" in str(exc_info.value)
+
+
+@pytest.mark.asyncio
+async def test_unbatched_by_default(valid_config, mock_client, sample_message):
+    """Without batch limits every message is inserted immediately."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink(valid_config)
+        await sink.connect()
+
+        await sink.write(json.dumps(sample_message))
+        await sink.write(json.dumps(sample_message))
+        await sink._wait_for_inserts()
+
+        assert mock_client.insert.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_flushes_on_max_rows(valid_config, mock_client, sample_message):
+    """Rows are buffered until max_rows is reached."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink({**valid_config, "max_rows": 3})
+        await sink.connect()
+
+        await sink.write_batch([json.dumps(sample_message)] * 2)
+        mock_client.insert.assert_not_called()
+
+        await sink.write(json.dumps(sample_message))
+        await sink._wait_for_inserts()
+        mock_client.insert.assert_called_once()
+        assert len(_inserted_rows(mock_client)) == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_flushes_on_max_bytes(valid_config, mock_client, sample_message):
+    """Rows are inserted once the buffered messages exceed max_bytes."""
+    message = json.dumps(sample_message)
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        # A ticker row is roughly 120 bytes on the wire
+        sink = get_sink({**valid_config, "max_rows": 1000, "max_bytes": 200})
+        await sink.connect()
+
+        await sink.write(message)
+        mock_client.insert.assert_not_called()
+        await sink.write(message)
+        await sink._wait_for_inserts()
+        mock_client.insert.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_batch_flushes_on_max_latency(valid_config, mock_client, sample_message):
+    """A partial batch is inserted once it has waited for max_latency_ms."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink({**valid_config, "max_rows": 1000, "max_latency_ms": 10})
+        await sink.connect()
+
+        await sink.write(json.dumps(sample_message))
+        mock_client.insert.assert_not_called()
+
+        await asyncio.sleep(0.05)
+        mock_client.insert.assert_called_once()
+        await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_max_bytes_alone_batches(valid_config, mock_client, sample_message):
+    """Setting only max_bytes batches rows without a row limit."""
+    message = json.dumps(sample_message)
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink({**valid_config, "max_bytes": 1 << 20})
+        await sink.connect()
+
+        await sink.write_batch([message] * 5)
+        mock_client.insert.assert_not_called()
+
+        await sink.disconnect()
+        mock_client.insert.assert_called_once()
+        assert len(_inserted_rows(mock_client)) == 5
+
+
+@pytest.mark.asyncio
+async def test_max_latency_alone_batches(valid_config, mock_client, sample_message):
+    """Setting only max_latency_ms batches rows until the batch has waited."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink({**valid_config, "max_latency_ms": 10})
+        await sink.connect()
+
+        await sink.write_batch([json.dumps(sample_message)] * 5)
+        mock_client.insert.assert_not_called()
+
+        await asyncio.sleep(0.05)
+        mock_client.insert.assert_called_once()
+        assert len(_inserted_rows(mock_client)) == 5
+        await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_disconnect_flushes_partial_batch(
+    valid_config, mock_client, sample_message
+):
+    """Disconnecting inserts whatever is still buffered."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink({**valid_config, "max_rows": 1000})
+        await sink.connect()
+
+        await sink.write(json.dumps(sample_message))
+        await sink.disconnect()
+
+        mock_client.insert.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_write_records(valid_config, mock_client, sample_message):
+    """Decoded records are inserted without modifying the caller's dict."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink(valid_config)
+        await sink.connect()
+
+        record = dict(sample_message)
+        await sink.write_record(record)
+        await sink._wait_for_inserts()
+
+        assert record == sample_message
+        row_data = _inserted_rows(mock_client)[0]
+        assert "type" not in row_data
+        assert row_data["price"] == 101496.91
+
+
+@pytest.mark.asyncio
+async def test_insert_context_reused(valid_config, mock_client, sample_message):
+    """The table's column types are only looked up once per set of columns."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink(valid_config)
+        await sink.connect()
+
+        for _ in range(3):
+            await sink.write_record(sample_message)
+        await sink._wait_for_inserts()
+
+        assert mock_client.insert.call_count == 3
+        mock_client.create_insert_context.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_message_shape_change_starts_new_batch(
+    valid_config, mock_client, sample_message
+):
+    """Records with different fields are inserted as separate batches."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink({**valid_config, "max_rows": 100})
+        await sink.connect()
+
+        short = {k: v for k, v in sample_message.items() if k != "best_ask_size"}
+        await sink.write_records([sample_message, sample_message, short])
+        await sink._wait_for_inserts()
+        assert mock_client.insert.call_count == 1
+        assert len(_inserted_rows(mock_client)) == 2
+
+        await sink.flush()
+        assert mock_client.insert.call_count == 2
+        assert "best_ask_size" not in _inserted_rows(mock_client)[0]
+
+
+def test_scale_times():
+    """Epoch microseconds are scaled to the precision of the target column."""
+    micros = array("q", [1738634406419368])
+    scale = ClickHouseConnectSink._scale_times
+    assert list(scale(micros, get_from_name("DateTime"))) == [1738634406]
+    assert list(scale(micros, get_from_name("DateTime64(3)"))) == [1738634406419]
+    assert scale(micros, get_from_name("DateTime64(6)")) is micros
+    assert list(scale(micros, get_from_name("DateTime64(9)"))) == [1738634406419368000]
+
+
+@pytest.mark.asyncio
+async def test_inserts_run_off_the_event_loop(
+    valid_config, mock_client, sample_message
+):
+    """A slow insert doesn't block writes until max_in_flight are outstanding."""
+    release = threading.Event()
+    mock_client.insert.side_effect = lambda context: release.wait(5)
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink({**valid_config, "max_in_flight": 2})
+        await sink.connect()
+        assert mock_ch.get_client.call_args[1]["autogenerate_session_id"] is False
+
+        await sink.write_record(sample_message)
+        await sink.write_record(sample_message)
+        assert len(sink._in_flight) == 2
+
+        # The third batch has to wait for a slot
+        third = asyncio.create_task(sink.write_record(sample_message))
+        await asyncio.sleep(0.05)
+        assert not third.done()
+
+        release.set()
+        await third
+        await sink.flush()
+        assert sink.rows_written == 3
+        assert mock_client.insert.call_count == 3
+        await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_failed_insert_is_raised(valid_config, mock_client, sample_message):
+    """An insert failure surfaces from the next write or flush."""
+    mock_client.insert.side_effect = Exception("ClickHouse is down")
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink(valid_config)
+        await sink.connect()
+
+        await sink.write_record(sample_message)
+        with pytest.raises(Exception, match="ClickHouse is down"):
+            await sink.flush()
+
+
+@pytest.mark.asyncio
+async def test_spool_replays_after_outage(
+    valid_config, mock_client, sample_message, tmp_path
+):
+    """With a spool, failed inserts are replayed in bulk once ClickHouse is back."""
+    spool = {"path": str(tmp_path), "retry_backoff_ms": 1}
+    outage = [True]
+    insert = mock_client.insert.side_effect
+
+    def flaky_insert(context):
+        if outage[0]:
+            raise Exception("ClickHouse is down")
+        insert(context)
+
+    mock_client.insert.side_effect = flaky_insert
+    messages = [{**sample_message, "sequence": n} for n in range(6)]
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink({**valid_config, "spool": spool})
+        await sink.connect()
+
+        # The failure is not raised, the sink keeps accepting writes
+        for message in messages[:4]:
+            await sink.write_record(message)
+        await sink.flush()
+        assert sink._replaying
+
+        outage[0] = False
+        await sink._replay_task
+        assert not sink._replaying
+        await sink.write_records(messages[4:])
+        await sink.flush()
+
+        inserted = [
+            row
+            for i in range(len(mock_client.inserted))
+            for row in _inserted_rows(mock_client, i)
+        ]
+        assert [row["sequence"] for row in inserted] == list(range(6))
+        # The backlog went in as a single insert
+        assert len(_inserted_rows(mock_client, 0)) == 4
+        assert sink.rows_written == 6
+        assert not sink._spool.pending
+        await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_spool_replays_on_restart(
+    valid_config, mock_client, sample_message, tmp_path
+):
+    """Records still in the spool when the sink stops are inserted on the next connect."""
+    config = {**valid_config, "spool": {"path": str(tmp_path), "retry_backoff_ms": 1}}
+    insert = mock_client.insert.side_effect
+    mock_client.insert.side_effect = Exception("ClickHouse is down")
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink(config)
+        await sink.connect()
+        await sink.write_records([sample_message] * 3)
+        await sink.disconnect()
+        assert mock_client.inserted == []
+
+        mock_client.insert.side_effect = insert
+        sink = get_sink(config)
+        await sink.connect()
+        await sink._replay_task
+        assert len(_inserted_rows(mock_client)) == 3
+        await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_on_disconnect_leaves_spool(
+    valid_config, mock_client, sample_message, tmp_path
+):
+    """A final flush that fails leaves the records in the spool, with no replay running."""
+    spool = {"path": str(tmp_path), "retry_backoff_ms": 1}
+    config = {**valid_config, "max_rows": 100, "spool": spool}
+    mock_client.insert.side_effect = Exception("ClickHouse is down")
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink(config)
+        await sink.connect()
+        await sink.write_records([sample_message] * 3)
+        await sink.disconnect()
+
+    assert sink._replay_task is None
+    assert mock_client.insert.call_count == 1
+    spool = SegmentSpool(spool["path"])
+    spool.open()
+    assert len(spool.read(10)[0]) == 3
+    spool.close()
+
+
+@pytest.mark.asyncio
+async def test_replay_backs_off_on_empty_reads(
+    valid_config, mock_client, sample_message, tmp_path
+):
+    """A replay that reads nothing while records are pending waits before reading again."""
+    spool = {"path": str(tmp_path), "retry_backoff_ms": 20}
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink({**valid_config, "spool": spool})
+        await sink.connect()
+        sink._spool.append([sample_message])
+
+        with patch.object(sink._spool, "read", return_value=([], None)) as read:
+            sink._start_replay()
+            await asyncio.sleep(0.1)
+            # 20, 40 then 80 ms apart
+            assert read.call_count <= 4
+            sink._replay_task.cancel()
+        mock_client.insert.assert_not_called()
+        await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_metrics(valid_config, mock_client, sample_message):
+    """Inserts are timed and failed inserts counted."""
+    with patch(
+        "streaming_analytics_demo.sinks.clickhouse_sink.clickhouse_connect"
+    ) as mock_ch:
+        mock_ch.get_client.return_value = mock_client
+        sink = get_sink(valid_config)
+        await sink.connect()
+
+        await sink.write_record(sample_message)
+        await sink.flush()
+        mock_client.insert.side_effect = Exception("ClickHouse is down")
+        await sink.write_record(sample_message)
+        with pytest.raises(Exception):
+            await sink.flush()
+
+        metrics = {metric.name: metric for metric in sink.metrics()}
+        table = (f"{valid_config['database']}.{valid_config['table']}",)
+        assert metrics["ingest_clickhouse_rows_written_total"].labels(*table).value == 1
+        assert (
+            metrics["ingest_clickhouse_insert_errors_total"].labels(*table).value == 1
+        )
+        latency = metrics["ingest_clickhouse_insert_seconds"].labels(*table)
+        assert sum(latency.counts) == 1
@@ -0,0 +1,34 @@
+"""Tests for the column-oriented batch builder."""
+
+from streaming_analytics_demo.sinks.columnar import ColumnarBatch
+
+
+def test_columns_are_typed():
+    """Known numeric fields become typed arrays and times epoch microseconds."""
+    record = {
+        "type": "ticker",
+        "trade_id": 1,
+        "price": "101.5",
+        "time": "2025-02-04T02:00:06.419368Z",
+        "product_id": "BTC-USD",
+    }
+    batch = ColumnarBatch(record)
+    assert batch.append(record)
+    assert batch.append({**record, "trade_id": 2, "price": 102.0})
+
+    assert batch.names == ("trade_id", "price", "time", "product_id")
+    trade_ids, prices, times, products = batch.columns()
+    assert trade_ids.typecode == "Q" and list(trade_ids) == [1, 2]
+    assert prices.typecode == "d" and list(prices) == [101.5, 102.0]
+    assert times.typecode == "q" and list(times) == [1738634406419368] * 2
+    assert products == ["BTC-USD", "BTC-USD"]
+
+
+def test_rejects_different_shape():
+    """Records with other fields don't belong in the batch."""
+    batch = ColumnarBatch({"price": "1.0", "side": "buy"})
+    assert not batch.append({"price": "1.0"})
+    assert not batch.append({"price": "1.0", "size": "2.0"})
+    assert batch.append({"price": "2.0", "side": "sell"})
+    assert len(batch) == 1
+    assert batch.nbytes == 8 + 3
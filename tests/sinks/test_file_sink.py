@@ -1,9 +1,13 @@
 """Tests for FileSink."""
 
+import asyncio
+import gzip
 import json
 import os
 import pytest
+import threading
 from pathlib import Path
+from unittest.mock import patch
 import yaml
 from streaming_analytics_demo.sinks.file_sink import FileSink
 
@@ -85,6 +89,33 @@ async def test_write_multiple_messages(sink):
             assert json.loads(line.strip()) == expected
 
 
+@pytest.mark.asyncio
+async def test_write_records(sink):
+    """Test that decoded records are written as JSON lines."""
+    records = [{"type": "ticker", "price": "50000.00"}, {"type": "heartbeat"}]
+
+    await sink.connect()
+    await sink.write_records(records)
+    await sink.disconnect()
+
+    with open(sink.config["file_path"]) as f:
+        assert [json.loads(line) for line in f] == records
+
+
+@pytest.mark.asyncio
+async def test_write_batch_raw(sink):
+    """Test that raw frames are written verbatim, one per line."""
+    frames = ['{"type": "ticker"}', '{"type":"heartbeat"}']
+    assert sink.raw_passthrough is True
+
+    await sink.connect()
+    await sink.write_batch(frames)
+    await sink.disconnect()
+
+    with open(sink.config["file_path"]) as f:
+        assert f.read().splitlines() == frames
+
+
 @pytest.mark.asyncio
 async def test_write_without_connect(sink):
     """Test that writing without connecting raises an error."""
@@ -109,3 +140,136 @@ async def test_cleanup_on_garbage_collection(valid_config):
     # Verify file descriptor is closed
     with pytest.raises(OSError):
         os.fstat(fd)
+
+
+@pytest.mark.asyncio
+async def test_writes_off_the_event_loop(sink):
+    """Test that file I/O happens on the sink's background thread."""
+    threads = []
+    write_lines = sink._write_lines
+
+    def record_thread(messages):
+        threads.append(threading.current_thread().name)
+        write_lines(messages)
+
+    sink._write_lines = record_thread
+    await sink.connect()
+    await sink.write_batch(['{"type": "ticker"}'])
+    await sink.disconnect()
+
+    assert threads and threads[0].startswith("file-sink")
+
+
+@pytest.mark.asyncio
+async def test_flush_interval(tmp_path):
+    """Test that buffered lines reach the file once the flush interval has passed."""
+    path = tmp_path / "archive.jsonl"
+    sink = FileSink({"type": "file", "file_path": str(path), "flush_interval_s": 0})
+
+    await sink.connect()
+    await sink.write_batch(['{"type": "ticker"}'])
+    assert path.read_text() == '{"type": "ticker"}\n'
+    await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_flush_on_quiet_feed(tmp_path):
+    """Test that buffered lines are flushed on a timer when no further writes arrive."""
+    path = tmp_path / "archive.jsonl"
+    sink = FileSink({"type": "file", "file_path": str(path), "flush_interval_s": 0.05})
+
+    await sink.connect()
+    await sink.write_batch(['{"type": "ticker"}'])
+    assert path.read_text() == ""
+    await asyncio.sleep(0.2)
+    assert path.read_text() == '{"type": "ticker"}\n'
+    await sink.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_fsync_on_flush(tmp_path):
+    """Test that the flush fsync policy syncs the file on every flush."""
+    path = tmp_path / "archive.jsonl"
+    sink = FileSink(
+        {
+            "type": "file",
+            "file_path": str(path),
+            "fsync": "flush",
+            "flush_interval_s": 0,
+        }
+    )
+
+    with patch("os.fsync") as mock_fsync:
+        await sink.connect()
+        await sink.write_batch(['{"type": "ticker"}'])
+        await sink.write_batch(['{"type": "ticker"}'])
+        await sink.disconnect()
+
+    # Once per flush and once on close
+    assert mock_fsync.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_rotate_by_size(tmp_path):
+    """Test that the file is moved aside and a new one started at the size limit."""
+    path = tmp_path / "archive.jsonl"
+    sink = FileSink({"type": "file", "file_path": str(path), "rotate_bytes": 50})
+    frames = [json.dumps({"type": "ticker", "sequence": i}) for i in range(10)]
+
+    await sink.connect()
+    for i in range(0, len(frames), 2):
+        await sink.write_batch(frames[i : i + 2])
+    await sink.disconnect()
+
+    rotated = sorted(tmp_path.glob("archive-*.jsonl"))
+    assert len(rotated) == sink.rotations == 5
+    lines = [line for p in rotated + [path] for line in p.read_text().splitlines()]
+    assert sorted(lines) == sorted(frames)
+    assert path.read_text() == ""
+
+
+@pytest.mark.asyncio
+async def test_rotate_by_time(tmp_path):
+    """Test that the file is rotated once it is older than the interval."""
+    path = tmp_path / "archive.jsonl"
+    sink = FileSink({"type": "file", "file_path": str(path), "rotate_interval_s": 0.01})
+
+    await sink.connect()
+    await sink.write_batch(['{"sequence": 1}'])
+    await asyncio.sleep(0.02)
+    await sink.write_batch(['{"sequence": 2}'])
+    await sink.disconnect()
+
+    assert sink.rotations == 1
+    assert len(list(tmp_path.glob("archive-*.jsonl"))) == 1
+
+
+@pytest.mark.asyncio
+async def test_gzip(tmp_path):
+    """Test that gzip output decompresses to the JSON lines, across reconnects."""
+    path = tmp_path / "archive.jsonl.gz"
+    config = {"type": "file", "file_path": str(path), "compression": "gzip"}
+
+    for batch in [['{"sequence": 1}', '{"sequence": 2}'], ['{"sequence": 3}']]:
+        sink = FileSink(config)
+        await sink.connect()
+        await sink.write_batch(batch)
+        await sink.disconnect()
+
+    with gzip.open(path, "rt") as f:
+        assert [json.loads(line)["sequence"] for line in f] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_zstd(tmp_path):
+    """Test that zstd output decompresses to the JSON lines."""
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / "archive.jsonl.zst"
+    sink = FileSink({"type": "file", "file_path": str(path), "compression": "zstd"})
+
+    await sink.connect()
+    await sink.write_batch(['{"sequence": 1}', '{"sequence": 2}'])
+    await sink.disconnect()
+
+    with zstandard.open(path, "rt") as f:
+        assert [json.loads(line)["sequence"] for line in f] == [1, 2]
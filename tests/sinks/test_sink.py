@@ -1,5 +1,8 @@
 """Test ability to register and get custom sinks."""
 
+import pytest
+from unittest.mock import AsyncMock
+
 from streaming_analytics_demo.sinks import get_sink, register_sink, Sink
 from streaming_analytics_demo.sinks import FileSink
 
@@ -41,3 +44,12 @@ def test_get_core_sink():
     """Test that get_sink returns the correct sink."""
     sink = get_sink({"type": "file", "file_path": "test.txt"})
     assert isinstance(sink, FileSink)
+
+
+@pytest.mark.asyncio
+async def test_default_write_batch():
+    """The default write_batch writes each message in order."""
+    sink = get_sink({"type": "test"})
+    sink.write = AsyncMock()
+    await sink.write_batch(["a", "b"])
+    assert [call.args[0] for call in sink.write.await_args_list] == ["a", "b"]
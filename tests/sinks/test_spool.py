@@ -0,0 +1,127 @@
+"""Tests for the segment spool."""
+
+import os
+from unittest.mock import patch
+
+from streaming_analytics_demo.sinks.spool import SegmentSpool
+
+
+def _segments(path):
+    """Return the names of the segment files in a spool directory."""
+    return sorted(name for name in os.listdir(path) if name.endswith(".seg"))
+
+
+def test_append_read_ack(tmp_path):
+    """Records are read back in order and stay until acknowledged."""
+    spool = SegmentSpool(str(tmp_path))
+    spool.open()
+    positions = spool.append([{"n": 0}, {"n": 1}, {"n": 2}])
+    assert spool.pending
+
+    records, position = spool.read(2)
+    assert records == [{"n": 0}, {"n": 1}]
+    assert position == positions[1]
+    # Reading doesn't acknowledge
+    assert spool.read(10)[0] == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+    spool.ack(position)
+    assert spool.read(10) == ([{"n": 2}], positions[2])
+    spool.ack(positions[2])
+    assert not spool.pending
+    assert spool.read(10) == ([], None)
+    spool.close()
+
+
+def test_segments_deleted_once_acknowledged(tmp_path):
+    """A new segment starts at segment_bytes and old ones go once fully acknowledged."""
+    # Each record is 9 bytes, so two fit in a segment
+    spool = SegmentSpool(str(tmp_path), segment_bytes=10)
+    spool.open()
+    positions = [spool.append([{"n": n}])[0] for n in range(6)]
+    assert len(_segments(tmp_path)) == 3
+
+    # Acknowledging part of a segment keeps it
+    spool.ack(positions[0])
+    assert len(_segments(tmp_path)) == 3
+    spool.ack(positions[3])
+    assert len(_segments(tmp_path)) == 1
+    assert spool.read(10)[0] == [{"n": 4}, {"n": 5}]
+    spool.close()
+
+
+def test_reopen_resumes_after_acknowledged(tmp_path):
+    """After a restart reading starts at the first unacknowledged record."""
+    spool = SegmentSpool(str(tmp_path), segment_bytes=20)
+    spool.open()
+    positions = [spool.append([{"n": n}])[0] for n in range(5)]
+    spool.ack(positions[2])
+    spool.close()
+
+    spool = SegmentSpool(str(tmp_path), segment_bytes=20)
+    spool.open()
+    assert spool.read(10)[0] == [{"n": 3}, {"n": 4}]
+    spool.append([{"n": 5}])
+    assert spool.read(10)[0] == [{"n": 3}, {"n": 4}, {"n": 5}]
+    spool.close()
+
+
+def test_torn_record_dropped(tmp_path):
+    """A record only partly written before a crash is discarded on open."""
+    spool = SegmentSpool(str(tmp_path))
+    spool.open()
+    spool.append([{"n": 0}])
+    spool.close()
+    with open(tmp_path / _segments(tmp_path)[-1], "ab") as f:
+        f.write(b'{"n": ')
+
+    spool = SegmentSpool(str(tmp_path))
+    spool.open()
+    assert spool.read(10)[0] == [{"n": 0}]
+    spool.close()
+
+
+def test_full(tmp_path):
+    """The spool is full once max_bytes of data is unacknowledged."""
+    spool = SegmentSpool(str(tmp_path), max_bytes=18)
+    spool.open()
+    position = spool.append([{"n": 0}])[0]
+    assert not spool.full
+    spool.append([{"n": 1}])
+    assert spool.full
+    spool.ack(position)
+    assert not spool.full
+    spool.close()
+
+
+def test_fsync_policy(tmp_path):
+    """Appends are only synced to disk with fsync set to append."""
+    for fsync, syncs in [("roll", 0), ("append", 2)]:
+        spool = SegmentSpool(str(tmp_path / fsync), fsync=fsync)
+        spool.open()
+        with patch("os.fsync") as mock_fsync:
+            spool.append([{"n": 0}])
+            spool.append([{"n": 1}])
+        assert mock_fsync.call_count == syncs
+        spool.close()
+
+
+def test_undecodable_record_rejected(tmp_path):
+    """A record that can't be decoded is skipped and moved to the rejected file once."""
+    spool = SegmentSpool(str(tmp_path))
+    spool.open()
+    spool.append([{"n": 0}])
+    spool._active.write(b"{not json\n")
+    spool._active.flush()
+    spool._sizes[0] += len(b"{not json\n")
+    positions = spool.append([{"n": 1}])
+
+    assert spool.read(10) == ([{"n": 0}, {"n": 1}], positions[0])
+    # Reading again, e.g. after a failed insert, doesn't reject it twice
+    spool.read(10)
+    assert spool.rejected == 1
+    with open(tmp_path / "rejected", "rb") as f:
+        assert f.read() == b"{not json\n"
+
+    spool.ack(positions[0])
+    assert not spool.pending
+    spool.close()
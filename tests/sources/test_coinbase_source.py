@@ -1,5 +1,6 @@
 """Tests for the CoinbaseSource class."""
 
+import asyncio
 import json
 import pytest
 from unittest.mock import AsyncMock, patch
@@ -117,6 +118,19 @@ async def test_receive_message(valid_config, mock_websocket):
     assert received_message == test_message
 
 
+@pytest.mark.asyncio
+async def test_receive_raw_message(valid_config, mock_websocket):
+    """Test that receive_raw returns the frame without decoding it."""
+    source = CoinbaseSource(valid_config)
+    source.websocket = mock_websocket
+    source._connected = True
+
+    frame = '{"type": "ticker", "price": "50000.00"}'
+    mock_websocket.recv = AsyncMock(return_value=frame)
+
+    assert await source.receive_raw() == frame
+
+
 @pytest.mark.asyncio
 async def test_receive_failed(valid_config, mock_websocket):
     """Test that receive raises error when not connected."""
@@ -140,3 +154,314 @@ async def test_receive_failed(valid_config, mock_websocket):
     # Verify close was called
     mock_websocket.close.assert_awaited_once()
     assert exception_raised is True
+
+
+@pytest.mark.asyncio
+async def test_receive_reconnects(valid_config, mock_websocket):
+    """Test that a dropped connection is re-established and resubscribed."""
+    valid_config["reconnect"] = {"enabled": True, "initial_backoff_ms": 1}
+    source = CoinbaseSource(valid_config)
+
+    dropped = AsyncMock()
+    dropped.recv = AsyncMock(side_effect=ConnectionError("Connection dropped"))
+    source.websocket = dropped
+    source._connected = True
+
+    test_message = {"type": "ticker", "sequence": 5, "product_id": "BTC-USD"}
+    frames = iter([json.dumps({"type": "subscriptions"}), json.dumps(test_message)])
+    mock_websocket.recv = AsyncMock(side_effect=lambda: next(frames))
+
+    # The first attempt fails, the second succeeds
+    mock_connect = AsyncMock(side_effect=[OSError("Refused"), mock_websocket])
+    with patch("websockets.connect", mock_connect):
+        assert await source.receive() == test_message
+
+    dropped.close.assert_awaited_once()
+    assert mock_connect.await_count == 2
+    mock_websocket.send.assert_awaited_once()
+    assert source.reconnects == 1
+    assert source.stats()["reconnects"] == 1
+    assert source.stats()["last_recovery_ms"] is not None
+
+
+@pytest.mark.asyncio
+async def test_receive_reconnect_gives_up(valid_config):
+    """Test that receive raises once max_attempts reconnects have failed."""
+    valid_config["reconnect"] = {"initial_backoff_ms": 1, "max_attempts": 3}
+    source = CoinbaseSource(valid_config)
+    source.websocket = AsyncMock()
+    source.websocket.recv = AsyncMock(side_effect=ConnectionError("dropped"))
+    source._connected = True
+
+    mock_connect = AsyncMock(side_effect=OSError("Refused"))
+    with patch("websockets.connect", mock_connect):
+        with pytest.raises(ConnectionError):
+            await source.receive()
+
+    assert mock_connect.await_count == 3
+    assert source.reconnects == 0
+
+
+@pytest.mark.asyncio
+async def test_receive_stalled(valid_config, mock_websocket):
+    """Test that a connection with no traffic is treated as failed."""
+    valid_config["heartbeat_timeout_s"] = 0.01
+    source = CoinbaseSource(valid_config)
+    source.websocket = mock_websocket
+    source._connected = True
+
+    async def never():
+        await asyncio.sleep(10)
+
+    mock_websocket.recv = never
+
+    with pytest.raises(ConnectionError, match="No message received"):
+        await source.receive()
+    assert source.websocket is None
+
+
+@pytest.mark.asyncio
+async def test_receive_tracks_sequence_gaps(valid_config, mock_websocket):
+    """Test that gaps in per-product sequence numbers are counted."""
+    source = CoinbaseSource(valid_config)
+    source.websocket = mock_websocket
+    source._connected = True
+
+    messages = [
+        {"type": "ticker", "sequence": 1, "product_id": "BTC-USD"},
+        {"type": "ticker", "sequence": 10, "product_id": "ETH-USD"},
+        {"type": "ticker", "sequence": 4, "product_id": "BTC-USD"},
+        {"type": "ticker", "sequence": 11, "product_id": "ETH-USD"},
+        {"type": "ticker", "sequence": 3, "product_id": "BTC-USD"},
+    ]
+    mock_websocket.recv = AsyncMock(side_effect=[json.dumps(m) for m in messages])
+    for _ in messages:
+        await source.receive()
+
+    stats = source.stats()
+    assert stats["sequence_gaps"] == 1
+    assert stats["sequence_missing"] == 2
+    assert stats["sequence_out_of_order"] == 1
+
+
+def _shard_websocket(product_ids, messages):
+    """Create a mock websocket that confirms the subscription then sends messages."""
+    ws = AsyncMock()
+    frames = [json.dumps({"type": "subscriptions"})]
+    frames += [json.dumps(m) for m in messages if m["product_id"] in product_ids]
+
+    async def recv():
+        if frames:
+            return frames.pop(0)
+        await asyncio.sleep(10)
+
+    ws.recv = recv
+    return ws
+
+
+@pytest.mark.parametrize("strategy", ["count", "hash"])
+def test_shard_assignment(valid_config, strategy):
+    """Test that every product is assigned to exactly one shard."""
+    product_ids = [f"P{i}-USD" for i in range(10)]
+    valid_config["subscription"]["product_ids"] = product_ids
+    valid_config["shards"] = {"count": 3, "strategy": strategy}
+    source = CoinbaseSource(valid_config)
+
+    assigned = [
+        p
+        for shard in source.shards
+        for p in shard.config["subscription"]["product_ids"]
+    ]
+    assert sorted(assigned) == sorted(product_ids)
+    assert 1 < len(source.shards) <= 3
+    if strategy == "count":
+        assert [
+            len(s.config["subscription"]["product_ids"]) for s in source.shards
+        ] == [4, 3, 3]
+
+    # The same products land on the same shards every time
+    again = CoinbaseSource(valid_config)
+    assert [s.config["subscription"] for s in again.shards] == [
+        s.config["subscription"] for s in source.shards
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sharded_receive(valid_config):
+    """Test that shards subscribe separately and merge into one ordered stream per product."""
+    valid_config["subscription"]["product_ids"] = ["BTC-USD", "ETH-USD"]
+    valid_config["shards"] = {"count": 2}
+    source = CoinbaseSource(valid_config)
+
+    messages = [
+        {"type": "ticker", "sequence": i, "product_id": product_id}
+        for i in range(1, 4)
+        for product_id in ["BTC-USD", "ETH-USD"]
+    ]
+    websockets = {}
+
+    async def connect(url):
+        ws = _shard_websocket(["BTC-USD", "ETH-USD"][len(websockets)], messages)
+        websockets[len(websockets)] = ws
+        return ws
+
+    with patch("websockets.connect", connect):
+        response = await source.connect()
+    assert len(response["shards"]) == 2
+
+    subscribed = [json.loads(ws.send.await_args.args[0]) for ws in websockets.values()]
+    assert [s["product_ids"] for s in subscribed] == [["BTC-USD"], ["ETH-USD"]]
+
+    received = [await source.receive() for _ in messages]
+    for product_id in ["BTC-USD", "ETH-USD"]:
+        assert [m["sequence"] for m in received if m["product_id"] == product_id] == [
+            1,
+            2,
+            3,
+        ]
+
+    stats = source.stats()
+    assert stats["messages"] == 6
+    assert [shard["messages"] for shard in stats["shards"]] == [3, 3]
+    assert stats["sequence_gaps"] == 0
+
+    await source.disconnect()
+    for ws in websockets.values():
+        ws.close.assert_awaited_once()
+    assert all(shard.websocket is None for shard in source.shards)
+
+
+@pytest.mark.asyncio
+async def test_sharded_reconnect_gaps(valid_config):
+    """Test that a shard's reconnect is noted for its own products only."""
+    valid_config["subscription"]["product_ids"] = ["BTC-USD", "ETH-USD"]
+    valid_config["shards"] = {"count": 2}
+    valid_config["reconnect"] = {"enabled": True, "initial_backoff_ms": 1}
+    source = CoinbaseSource(valid_config)
+
+    def ticker(product_id, sequence):
+        return json.dumps(
+            {"type": "ticker", "product_id": product_id, "sequence": sequence}
+        )
+
+    subscribed = json.dumps({"type": "subscriptions"})
+    reconnected = asyncio.Event()
+
+    def websocket(frames):
+        ws = AsyncMock()
+
+        async def recv():
+            frame = frames.pop(0) if frames else None
+            if isinstance(frame, Exception):
+                raise frame
+            if frame is None:
+                await asyncio.sleep(10)
+            elif frame == "after reconnect":
+                await reconnected.wait()
+                return ticker("ETH-USD", 3)
+            return frame
+
+        ws.recv = recv
+        return ws
+
+    connections = [
+        websocket([subscribed, ticker("BTC-USD", 1), ConnectionError("dropped")]),
+        websocket([subscribed, ticker("ETH-USD", 1), "after reconnect"]),
+        websocket([subscribed, ticker("BTC-USD", 5)]),
+    ]
+
+    async def connect(url):
+        if len(connections) == 1:
+            reconnected.set()
+        return connections.pop(0)
+
+    with patch("websockets.connect", connect):
+        await source.connect()
+        received = [await source.receive() for _ in range(4)]
+    assert sorted((m["product_id"], m["sequence"]) for m in received) == [
+        ("BTC-USD", 1),
+        ("BTC-USD", 5),
+        ("ETH-USD", 1),
+        ("ETH-USD", 3),
+    ]
+
+    stats = source.stats()
+    # Both products have a gap, only BTC-USD's spans its shard's reconnect
+    assert stats["sequence_gaps"] == 2
+    assert stats["sequence_missing"] == 4
+    assert stats["sequence_reconnect_gaps"] == 1
+    assert stats["sequence_reconnect_missing"] == 3
+    assert stats["reconnects"] == 1
+    assert stats["last_recovery_ms"] is not None
+    assert [shard["reconnects"] for shard in stats["shards"]] == [1, 0]
+    await source.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_sharded_receive_failed(valid_config):
+    """Test that a shard failing without reconnect fails the merged stream."""
+    valid_config["subscription"]["product_ids"] = ["BTC-USD", "ETH-USD"]
+    valid_config["shards"] = {"count": 2}
+    source = CoinbaseSource(valid_config)
+
+    mock_connect = AsyncMock(
+        side_effect=lambda url: _shard_websocket(["BTC-USD", "ETH-USD"], [])
+    )
+    with patch("websockets.connect", mock_connect):
+        await source.connect()
+    source.shards[0].websocket.recv = AsyncMock(side_effect=Exception("Dropped"))
+
+    with pytest.raises(Exception, match="Dropped"):
+        await source.receive()
+    await source.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_receive_typed(valid_config, mock_websocket):
+    """Test that a configured decoder returns typed records."""
+    valid_config["decoder"] = "json"
+    source = CoinbaseSource(valid_config)
+    source.websocket = mock_websocket
+    source._connected = True
+
+    test_message = {"type": "ticker", "price": "50000.00", "product_id": "BTC-USD"}
+    mock_websocket.recv = AsyncMock(return_value=json.dumps(test_message))
+
+    assert await source.receive() == {
+        "type": "ticker",
+        "product_id": "BTC-USD",
+        "price": 50000.0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_metrics(valid_config, mock_websocket):
+    """Frames are counted per product and channel, undecoded ones without labels."""
+    source = CoinbaseSource(valid_config)
+    source.websocket = mock_websocket
+    source._connected = True
+
+    messages = [
+        {"type": "ticker", "sequence": 1, "product_id": "BTC-USD"},
+        {"type": "match", "sequence": 2, "product_id": "BTC-USD"},
+        {"type": "last_match", "sequence": 3, "product_id": "BTC-USD"},
+        {"type": "ticker", "sequence": 1, "product_id": "ETH-USD"},
+    ]
+    mock_websocket.recv = AsyncMock(
+        side_effect=[json.dumps(m) for m in messages] + ['{"type": "heartbeat"}']
+    )
+    for _ in messages:
+        await source.receive()
+    await source.receive_raw()
+
+    metrics = {metric.name: metric for metric in source.metrics()}
+    frames = metrics["ingest_frames_received_total"]
+    assert {key: child.value for key, child in frames._children.items()} == {
+        ("BTC-USD", "ticker"): 1,
+        ("BTC-USD", "matches"): 2,
+        ("ETH-USD", "ticker"): 1,
+        ("", ""): 1,
+    }
+    # The first frame is always timed
+    assert sum(metrics["ingest_decode_seconds"].labels().counts) == 1
+    assert metrics["ingest_source_reconnects_total"].labels().value == 0
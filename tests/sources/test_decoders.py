@@ -0,0 +1,81 @@
+"""Tests for the message decoders."""
+
+import importlib.util
+import json
+
+import pytest
+
+from streaming_analytics_demo.sources.decoders import get_decoder
+
+TICKER = {
+    "type": "ticker",
+    "sequence": "96440493212",
+    "product_id": "BTC-USD",
+    "price": "97421.01",
+    "open_24h": "96420.01",
+    "volume_24h": "11009.55813263",
+    "low_24h": "95500",
+    "high_24h": "98000.5",
+    "volume_30d": "310217.53462719",
+    "best_bid": "97421.00",
+    "best_bid_size": "0.00038584",
+    "best_ask": "97421.01",
+    "best_ask_size": "0.18140919",
+    "side": "buy",
+    "time": "2025-02-01T12:00:00.123456Z",
+    "trade_id": 780146125,
+    "last_size": "0.00071001",
+}
+
+DECODERS = [
+    pytest.param(
+        name,
+        marks=pytest.mark.skipif(
+            name != "json" and importlib.util.find_spec(name) is None,
+            reason=f"{name} is not installed",
+        ),
+    )
+    for name in ["json", "orjson", "msgspec"]
+]
+
+
+@pytest.mark.parametrize("name", DECODERS)
+def test_decode_ticker(name):
+    """Test that ticker fields are converted to numbers and epoch microseconds."""
+    record = get_decoder(name).decode(json.dumps({**TICKER, "unused": "dropped"}))
+
+    assert record["type"] == "ticker"
+    assert record["sequence"] == 96440493212
+    assert record["trade_id"] == 780146125
+    assert record["price"] == 97421.01
+    assert record["best_ask_size"] == 0.18140919
+    assert record["time"] == 1738411200123456
+    assert record["product_id"] == "BTC-USD"
+    assert "unused" not in record
+    # Field order is fixed, so every ticker record has the same shape
+    assert list(record)[:3] == ["type", "sequence", "product_id"]
+
+
+@pytest.mark.parametrize("name", DECODERS)
+def test_decode_missing_fields(name):
+    """Test that absent and null fields are left out rather than failing."""
+    frame = json.dumps({"type": "heartbeat", "sequence": 5, "best_bid": None})
+    assert get_decoder(name).decode(frame) == {"type": "heartbeat", "sequence": 5}
+
+
+@pytest.mark.parametrize("name", DECODERS)
+def test_decode_other_types(name):
+    """Test that messages without a known type are decoded unchanged."""
+    message = {"type": "subscriptions", "channels": [{"name": "ticker"}]}
+    assert get_decoder(name).decode(json.dumps(message)) == message
+
+
+def test_auto_decoder():
+    """Test that auto always finds a decoder, the stdlib one at worst."""
+    assert get_decoder("auto").decode(json.dumps(TICKER))["price"] == 97421.01
+
+
+def test_unknown_decoder():
+    """Test that an unknown decoder is rejected."""
+    with pytest.raises(ValueError, match="Unknown decoder"):
+        get_decoder("pickle")
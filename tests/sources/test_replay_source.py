@@ -0,0 +1,200 @@
+"""Tests for the replay source."""
+
+import asyncio
+import gzip
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from jsonschema import ValidationError
+
+from streaming_analytics_demo.pipeline import Pipeline
+from streaming_analytics_demo.sinks import FileSink
+from streaming_analytics_demo.sources import ReplaySource, get_source
+from streaming_analytics_demo.sources.replay_source import archive_files, read_lines
+
+
+def _frame(n, time="2025-02-01T12:00:00Z"):
+    """Return a recorded ticker frame."""
+    return json.dumps(
+        {"type": "ticker", "sequence": n, "product_id": "BTC-USD", "time": time}
+    )
+
+
+async def _replay_all(source):
+    """Receive every frame from a source until it runs out."""
+    frames = []
+    await source.connect()
+    try:
+        while True:
+            frames.append(await source.receive_raw())
+    except EOFError:
+        pass
+    await source.disconnect()
+    return frames
+
+
+def test_archive_files_in_rotation_order(tmp_path):
+    """Rotated files come oldest first, then the current file."""
+    for name in [
+        "test.jsonl",
+        "test-20250201T120000-1.jsonl",
+        "test-20250201T110000.jsonl",
+        "test-20250201T120000.jsonl",
+        "test-w0.jsonl",
+        "test-20250201T100000.csv",
+        "other-20250201T100000.jsonl",
+    ]:
+        (tmp_path / name).touch()
+
+    assert archive_files(str(tmp_path / "test.jsonl")) == [
+        str(tmp_path / "test-20250201T110000.jsonl"),
+        str(tmp_path / "test-20250201T120000.jsonl"),
+        str(tmp_path / "test-20250201T120000-1.jsonl"),
+        str(tmp_path / "test.jsonl"),
+    ]
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+@pytest.mark.asyncio
+async def test_replays_rotated_and_compressed_archives(tmp_path, compression):
+    """Everything a rotating, compressing file sink wrote is replayed in order."""
+    file_path = str(tmp_path / "test.jsonl")
+    sink = FileSink(
+        {
+            "type": "file",
+            "file_path": file_path,
+            "rotate_bytes": 200,
+            "flush_interval_s": 0,
+            "compression": compression,
+        }
+    )
+    frames = [_frame(n) for n in range(20)]
+    await sink.connect()
+    for frame in frames:
+        await sink.write_batch([frame])
+    await sink.disconnect()
+    assert sink.rotations > 1
+
+    source = get_source({"type": "replay", "file_path": file_path})
+    assert await _replay_all(source) == frames
+    assert source.stats() == {
+        "files": sink.rotations + 1,
+        "files_replayed": sink.rotations + 1,
+        "messages_replayed": 20,
+    }
+
+
+def test_chunked_reading(tmp_path):
+    """Lines are read in chunks, including lines longer than a chunk."""
+    path = tmp_path / "test.jsonl"
+    lines = [b"a" * 3, b"b" * 40, b"c" * 5, b"d"]
+    path.write_bytes(b"\n".join(lines) + b"\n")
+    chunks = list(read_lines(str(path), chunk_bytes=8))
+    assert [line for chunk in chunks for line in chunk] == lines
+    assert len(chunks) > 1
+
+    gz_path = tmp_path / "test.jsonl.gz"
+    gz_path.write_bytes(gzip.compress(path.read_bytes()))
+    assert [line for c in read_lines(str(gz_path), 8) for line in c] == lines
+
+
+def test_partial_last_line_ignored(tmp_path):
+    """A line still being written at the end of the file is left out."""
+    path = tmp_path / "test.jsonl"
+    path.write_bytes(b'{"n": 0}\n{"n": 1}\n{"n"')
+    assert [line for c in read_lines(str(path)) for line in c] == [
+        b'{"n": 0}',
+        b'{"n": 1}',
+    ]
+
+    # A gzip file that hasn't been closed yet has no end-of-stream marker
+    gz_path = tmp_path / "test.jsonl.gz"
+    gz_path.write_bytes(gzip.compress(b'{"n": 0}\n{"n": 1}\n')[:-8])
+    assert [line for c in read_lines(str(gz_path)) for line in c] == [
+        b'{"n": 0}',
+        b'{"n": 1}',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_typed_receive(tmp_path):
+    """Received messages are decoded with the configured decoder."""
+    path = tmp_path / "test.jsonl"
+    path.write_text(_frame(1) + "\n")
+    source = get_source({"type": "replay", "file_path": str(path), "decoder": "json"})
+    await source.connect()
+    message = await source.receive()
+    assert message["time"] == 1738411200000000
+    with pytest.raises(EOFError):
+        await source.receive()
+
+
+@pytest.mark.asyncio
+async def test_connect_without_files(tmp_path):
+    """Connecting fails if there is nothing to replay."""
+    source = get_source({"type": "replay", "file_path": str(tmp_path / "x.jsonl")})
+    with pytest.raises(ConnectionError):
+        await source.connect()
+
+
+@pytest.mark.asyncio
+async def test_speed_paces_by_recorded_time(tmp_path):
+    """Messages are spaced by their recorded times divided by the speed."""
+    path = tmp_path / "test.jsonl"
+    path.write_text(
+        "\n".join(
+            [
+                '{"type": "subscriptions"}',
+                _frame(1, "2025-02-01T12:00:00Z"),
+                _frame(2, "2025-02-01T12:00:10Z"),
+            ]
+        )
+        + "\n"
+    )
+    source = get_source({"type": "replay", "file_path": str(path), "speed": 100})
+    with patch(
+        "streaming_analytics_demo.sources.replay_source.asyncio.sleep",
+        new_callable=AsyncMock,
+    ) as sleep:
+        assert len(await _replay_all(source)) == 3
+    (delay,), _ = sleep.await_args
+    assert sleep.await_count == 1
+    assert delay == pytest.approx(0.1, abs=0.01)
+
+
+def test_config_validation():
+    """Speed is a positive number or max."""
+    get_source({"type": "replay", "file_path": ["a.jsonl", "b.jsonl"], "speed": 2.5})
+    for speed in [0, "fast"]:
+        with pytest.raises(ValidationError):
+            get_source({"type": "replay", "file_path": "a.jsonl", "speed": speed})
+
+
+@pytest.mark.asyncio
+async def test_pipeline_stops_at_end_of_replay(tmp_path):
+    """The pipeline writes every replayed message and then stops."""
+    path = tmp_path / "test.jsonl"
+    frames = [_frame(n) for n in range(5)]
+    path.write_text("\n".join(frames) + "\n")
+    source = ReplaySource({"type": "replay", "file_path": str(path)})
+    await source.connect()
+    sink = AsyncMock()
+    sink.raw_passthrough = True
+
+    pipeline = Pipeline(source, sink, {"stats_interval_s": 0})
+    await asyncio.wait_for(pipeline.run(), 5)
+    written = [f for call in sink.write_batch.await_args_list for f in call.args[0]]
+    assert written == frames
+    assert pipeline.source_exhausted
+
+
+def test_partition_splits_file_paths():
+    """Each worker replays a share of the listed files."""
+    config = {"type": "replay", "file_path": ["a.jsonl", "b.jsonl", "c.jsonl"]}
+    assert [c["file_path"] for c in ReplaySource.partition(config, 2)] == [
+        ["a.jsonl", "c.jsonl"],
+        ["b.jsonl"],
+    ]
+    single = {"type": "replay", "file_path": "a.jsonl"}
+    assert ReplaySource.partition(single, 2) == [single]
@@ -28,3 +28,19 @@ def test_missing_required_fields():
     with pytest.raises(BadParameter) as exc_info:
         build_config(config_path)
     assert "required property" in str(exc_info.value)
+
+
+def test_valid_fanout_config():
+    """Test that a list of sinks is accepted in place of a single sink."""
+    config_path = Path(__file__).parent / "fixtures" / "valid_fanout_config.yml"
+    config = build_config(config_path)
+    assert [sink["type"] for sink in config["sinks"]] == ["file", "file"]
+
+
+def test_sink_and_sinks(tmp_path):
+    """Test that a config can't have both a sink and a list of sinks."""
+    config_path = Path(__file__).parent / "fixtures" / "valid_fanout_config.yml"
+    both = tmp_path / "both.yml"
+    both.write_text(config_path.read_text() + "\nsink:\n  type: file\n")
+    with pytest.raises(BadParameter):
+        build_config(both)
@@ -1,11 +1,14 @@
 """Tests the argument handling of the listen command."""
 
-import json
+import asyncio
+import os
+import signal
+
 import pytest
 from click.testing import CliRunner
 from pathlib import Path
 from unittest.mock import AsyncMock, patch, MagicMock
-from streaming_analytics_demo.listen import listen, _async_listen
+from streaming_analytics_demo.listen import listen, _async_listen, _async_run_worker
 
 
 @pytest.fixture
@@ -32,7 +35,7 @@ def mock_sink():
     mock_sink = MagicMock()
     mock_sink.connect = AsyncMock()
     mock_sink.disconnect = AsyncMock()
-    mock_sink.write = AsyncMock(side_effect=KeyboardInterrupt("break the loop"))
+    mock_sink.write_records = AsyncMock(side_effect=KeyboardInterrupt("break the loop"))
 
     return mock_sink
 
@@ -54,7 +57,7 @@ def test_listen_with_valid_arguments(runner, mock_coinbase_source, mock_sink):
 
     assert result.exit_code == 0
     mock_coinbase_source.connect.assert_awaited_once()
-    mock_sink.write.assert_awaited_once()
+    mock_sink.write_records.assert_awaited_once()
     mock_sink.disconnect.assert_awaited_once()
     mock_coinbase_source.disconnect.assert_awaited_once()
 
@@ -95,9 +98,8 @@ async def test_async_listen_happy_path():
 
     # Verify behavior
     assert source.receive.await_count == len(messages) + 1
-    assert sink.write.await_count == len(messages)
-    for msg, call in zip(messages, sink.write.await_args_list):
-        assert call.args[0] == json.dumps(msg)
+    written = [m for call in sink.write_records.await_args_list for m in call.args[0]]
+    assert written == messages
 
     # Verify cleanup
     source.disconnect.assert_awaited_once()
@@ -135,4 +137,91 @@ def test_listen_command(runner):
     # Verify the functions were called in the correct order
     mock_connect_source.assert_awaited_once()
     mock_connect_sink.assert_awaited_once()
-    mock_listen.assert_awaited_once_with(mock_source, mock_sink)
+    mock_listen.assert_awaited_once_with(mock_source, mock_sink, None, None)
+
+
+@pytest.mark.asyncio
+async def test_async_listen_write_failure_stops():
+    """A failed write stops the pipeline and disconnects both ends."""
+    source = AsyncMock()
+    sink = AsyncMock()
+    source.receive = AsyncMock(return_value={"type": "ticker"})
+    sink.write_records = AsyncMock(side_effect=Exception("insert failed"))
+
+    await _async_listen(source, sink)
+
+    sink.write_records.assert_awaited_once()
+    source.disconnect.assert_awaited_once()
+    sink.disconnect.assert_awaited_once()
+
+
+def test_listen_with_multiple_sinks(runner, mock_coinbase_source):
+    """Each sink in a sinks list is connected, written to and disconnected."""
+    config_file = Path(__file__).parent / "fixtures" / "valid_fanout_config.yml"
+    sinks = [MagicMock(), MagicMock()]
+    for sink in sinks:
+        sink.connect = AsyncMock()
+        sink.disconnect = AsyncMock()
+        sink.raw_passthrough = False
+        sink.write_records = AsyncMock()
+    mock_coinbase_source.receive = AsyncMock(
+        side_effect=[{"key": "value"}, KeyboardInterrupt("break the loop")]
+    )
+
+    with (
+        patch(
+            "streaming_analytics_demo.listen.get_source",
+            MagicMock(return_value=mock_coinbase_source),
+        ),
+        patch(
+            "streaming_analytics_demo.listen.get_sink", MagicMock(side_effect=sinks)
+        ) as mock_get_sink,
+    ):
+        result = runner.invoke(listen, ["--config", str(config_file)])
+
+    assert result.exit_code == 0
+    # The per-sink pipeline settings are not part of the sink's own config
+    assert "pipeline" not in mock_get_sink.call_args_list[1].args[0]
+    for sink in sinks:
+        sink.connect.assert_awaited_once()
+        sink.write_records.assert_awaited_once_with([{"key": "value"}])
+        sink.disconnect.assert_awaited_once()
+
+
+def test_listen_with_workers(runner):
+    """With --workers the supervisor runs the pipeline in worker processes."""
+    config_file = Path(__file__).parent / "fixtures" / "valid_config.yml"
+    with (
+        patch("streaming_analytics_demo.listen.Supervisor") as mock_supervisor,
+        patch("streaming_analytics_demo.listen._async_run", AsyncMock()) as mock_run,
+    ):
+        result = runner.invoke(listen, ["--config", str(config_file), "--workers", "2"])
+
+    assert result.exit_code == 0
+    assert mock_supervisor.call_args.args[1] == 2
+    mock_supervisor.return_value.run.assert_called_once()
+    mock_run.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_worker_shuts_down_on_sigterm():
+    """A worker cancels its pipeline on SIGTERM and lets it finish disconnecting."""
+    disconnected = []
+
+    async def run(config_data, stats_callback):
+        try:
+            await asyncio.sleep(60)
+        finally:
+            # A second SIGTERM while disconnecting is ignored
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.sleep(0.05)
+            disconnected.append(True)
+
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.05, os.kill, os.getpid(), signal.SIGTERM)
+    with patch("streaming_analytics_demo.listen._async_run", run):
+        try:
+            assert await _async_run_worker({}, MagicMock()) is False
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+    assert disconnected == [True]
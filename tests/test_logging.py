@@ -0,0 +1,67 @@
+"""Tests for the logging configuration."""
+
+import json
+import logging
+import queue
+import pytest
+from unittest.mock import patch
+
+from streaming_analytics_demo.util import RateLimiter, setup_logging
+from streaming_analytics_demo.util.logging_config import (
+    _DroppingQueueHandler,
+    stop_logging,
+)
+
+
+@pytest.fixture
+def restore_logging():
+    """Set logging up again as it was after the test."""
+    level = logging.getLogger().level
+    yield
+    setup_logging(level)
+
+
+def test_records_written_as_json_in_background(restore_logging, capsys):
+    """Records are written as JSON by the background writer, in order."""
+    setup_logging(logging.INFO)
+    logger = logging.getLogger("test")
+    message = {"price": 1.0}
+    logger.info("Received %s", message, extra={"extra_fields": {"worker": 1}})
+    # The arguments are merged when the record is made, not when it's written
+    message["price"] = 2.0
+    logger.debug("Not written")
+    try:
+        raise ValueError("bad")
+    except ValueError:
+        logger.exception("Failed")
+    stop_logging()
+
+    lines = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    assert [line["message"] for line in lines] == [
+        "Received {'price': 1.0}",
+        "Failed",
+    ]
+    assert lines[0]["worker"] == 1
+    assert "ValueError: bad" in lines[1]["exception"]
+
+
+def test_full_queue_drops_records():
+    """Records are dropped rather than block when the writer falls behind."""
+    handler = _DroppingQueueHandler(queue.Queue(1))
+    record = logging.makeLogRecord({"msg": "test"})
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+def test_rate_limiter():
+    """The limiter allows a burst, then refills at the given rate."""
+    with patch(
+        "streaming_analytics_demo.util.logging_config.time.monotonic"
+    ) as monotonic:
+        monotonic.return_value = 100.0
+        limiter = RateLimiter(per_second=2, burst=2)
+        assert [limiter.allow() for _ in range(3)] == [True, True, False]
+        monotonic.return_value = 100.5
+        assert [limiter.allow() for _ in range(2)] == [True, False]
@@ -0,0 +1,103 @@
+"""Tests for the metrics and the metrics endpoint."""
+
+import asyncio
+import pytest
+
+from streaming_analytics_demo.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsServer,
+    Registry,
+    counter,
+)
+
+
+def test_render_counters_and_gauges():
+    """Samples are rendered with their labels, escaped, after HELP and TYPE."""
+    received = Counter("received_total", "Messages received", ("product_id",))
+    received.labels("BTC-USD").inc()
+    received.labels("BTC-USD").inc(2)
+    received.labels('odd"one').inc()
+    depth = Gauge("queue_depth", "Queued messages")
+    depth.set(1.5)
+
+    registry = Registry()
+    registry.add_collector(lambda: [received, depth])
+    assert registry.render() == (
+        "# HELP received_total Messages received\n"
+        "# TYPE received_total counter\n"
+        'received_total{product_id="BTC-USD"} 3\n'
+        'received_total{product_id="odd\\"one"} 1\n'
+        "# HELP queue_depth Queued messages\n"
+        "# TYPE queue_depth gauge\n"
+        "queue_depth 1.5\n"
+    )
+
+
+def test_render_histogram():
+    """Histogram buckets are cumulative and end with +Inf."""
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        latency.observe(value)
+
+    registry = Registry()
+    registry.add_collector(lambda: [latency])
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 2.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_families_are_merged_across_collectors():
+    """Metrics of the same name from several collectors form one family."""
+    registry = Registry()
+    for sink in ["FileSink", "ClickHouseConnectSink"]:
+        registry.add_collector(
+            lambda sink=sink: [
+                counter("written_total", "Written", ("sink",), {(sink,): 1})
+            ]
+        )
+    text = registry.render()
+    assert text.count("# TYPE written_total counter") == 1
+    assert 'written_total{sink="FileSink"} 1' in text
+    assert 'written_total{sink="ClickHouseConnectSink"} 1' in text
+
+
+def test_wrong_label_count():
+    """Children must be given a value for every label."""
+    with pytest.raises(ValueError):
+        Counter("received_total", "Messages received", ("product_id",)).labels()
+
+
+async def _get(port, path):
+    """Make a GET request and return the response."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    response = await reader.read()
+    writer.close()
+    return response.decode()
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint():
+    """The server answers /metrics with the registry's metrics."""
+    registry = Registry()
+    received = Counter("received_total", "Messages received")
+    received.inc(5)
+    registry.add_collector(lambda: [received])
+    server = MetricsServer("127.0.0.1", 0, registry)
+    await server.start()
+    try:
+        response = await _get(server.port, "/metrics")
+        assert response.startswith("HTTP/1.1 200 OK\r\n")
+        assert "Content-Type: text/plain; version=0.0.4" in response
+        assert response.endswith("received_total 5\n")
+
+        assert (await _get(server.port, "/")).startswith("HTTP/1.1 404")
+    finally:
+        await server.stop()
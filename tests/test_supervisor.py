@@ -0,0 +1,125 @@
+"""Tests for the multi-process supervisor."""
+
+import signal
+import threading
+import time
+from pathlib import Path
+
+import yaml
+
+from streaming_analytics_demo.supervisor import Supervisor, worker_configs
+
+
+def _config(product_ids):
+    """Load the valid config with the given products."""
+    config_path = Path(__file__).parent / "fixtures" / "valid_config.yml"
+    config = yaml.safe_load(config_path.read_text())
+    config["source"]["subscription"]["product_ids"] = product_ids
+    return config
+
+
+def _exit_at_once(config, worker, reports):
+    """Worker target that reports once and exits."""
+    reports.put((worker, {"received": 10 * (worker + 1), "sink": "file"}))
+
+
+def _finish_at_once(config, worker, reports):
+    """Worker target whose source runs out straight away."""
+    reports.put((worker, {"received": 1}))
+    reports.put((worker, None))
+
+
+def _run_until_stopped(config, worker, reports):
+    """Worker target that keeps running until terminated, ignoring interrupts."""
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    reports.put(
+        (worker, {"received": len(config["source"]["subscription"]["product_ids"])})
+    )
+    stopped.wait(60)
+
+
+def _poll_until(supervisor, condition, timeout_s=20):
+    """Poll the supervisor until the condition holds."""
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+        supervisor.poll()
+
+
+def test_worker_configs():
+    """Products are split across the workers and each gets its own file."""
+    config = _config(["BTC-USD", "ETH-USD", "SOL-USD"])
+    config["pipeline"] = {"overflow": "spill", "spill_path": "spill.jsonl"}
+    config["metrics"] = {"port": 9108}
+    configs = worker_configs(config, 2)
+
+    assert [c["source"]["subscription"]["product_ids"] for c in configs] == [
+        ["BTC-USD", "SOL-USD"],
+        ["ETH-USD"],
+    ]
+    assert [c["sink"]["file_path"] for c in configs] == [
+        "test-w0.jsonl",
+        "test-w1.jsonl",
+    ]
+    assert configs[1]["pipeline"]["spill_path"] == "spill.jsonl.w1"
+    assert [c["metrics"]["port"] for c in configs] == [9108, 9109]
+    # The original config is left alone
+    assert config["sink"]["file_path"] == "test.jsonl"
+
+
+def test_no_more_workers_than_products():
+    """Workers without any products to listen to are not started."""
+    supervisor = Supervisor(_config(["BTC-USD"]), 4, _exit_at_once)
+    assert len(supervisor.workers) == 1
+
+
+def test_restarts_exited_workers():
+    """Workers that exit are restarted and their stats summed."""
+    supervisor = Supervisor(
+        _config(["BTC-USD", "ETH-USD"]), 2, _exit_at_once, restart_backoff_s=0.01
+    )
+    supervisor.start()
+    try:
+        _poll_until(
+            supervisor, lambda: all(w.restarts >= 1 for w in supervisor.workers)
+        )
+        _poll_until(supervisor, lambda: all(w.stats for w in supervisor.workers))
+    finally:
+        supervisor.stop()
+
+    stats = supervisor.stats()
+    assert stats["workers"] == 2
+    assert stats["restarts"] >= 2
+    assert stats["received"] == 30
+    assert "sink" not in stats
+
+
+def test_finished_workers_are_not_restarted():
+    """A worker that has read everything from its source is left to exit."""
+    supervisor = Supervisor(
+        _config(["BTC-USD", "ETH-USD"]), 2, _finish_at_once, restart_backoff_s=0.01
+    )
+    supervisor.start()
+    try:
+        _poll_until(supervisor, lambda: supervisor.finished)
+        time.sleep(0.1)
+        supervisor.poll()
+    finally:
+        supervisor.stop()
+    assert supervisor.stats()["restarts"] == 0
+    assert supervisor.stats()["received"] == 2
+
+
+def test_stop_terminates_workers():
+    """Stopping sends the workers SIGTERM so they can shut down cleanly."""
+    supervisor = Supervisor(_config(["BTC-USD", "ETH-USD"]), 2, _run_until_stopped)
+    supervisor.start()
+    _poll_until(supervisor, lambda: all(w.stats for w in supervisor.workers))
+    assert supervisor.stats()["workers_alive"] == 2
+
+    supervisor.stop(timeout_s=10)
+    assert [w.process.exitcode for w in supervisor.workers] == [0, 0]
+    assert supervisor.stats()["restarts"] == 0